@@ -1,9 +1,32 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
-app = FastAPI()
+from .db import get_supabase, open_pg_pool, close_db
+from .providers import close_providers
+from .audit import audit_sink
+from .webhook_ingest import webhook_ingestor
+from .model_registry import model_registry
+from .campaign_progress import progress_hub
+from . import auth, campaign_progress, campaigns, churn_sync, drift, effectiveness, imports, members, messaging, partitions, rollups, scoring, webhooks
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared client + pool for every router (see db.py)
+    get_supabase()
+    await open_pg_pool()
+    # Loads + warms the churn model in the background; health checks answer meanwhile
+    model_registry.start()
+    yield
+    model_registry.close()
+    await progress_hub.close()
+    webhook_ingestor.close()
+    audit_sink.close()
+    await close_providers()
+    await close_db()
+
+app = FastAPI(lifespan=lifespan)
 
 # 1. THE HEALTH CHECK (Heartbeat)
 # This tells Railway to stop killing the container.
@@ -11,6 +34,11 @@ app = FastAPI()
 async def health_check():
     return {"status": "healthy", "container": "alluring-warmth"}
 
+@app.get("/health")
+async def health():
+    # Liveness only: must not wait on the model, the database or anything else still warming up
+    return {"status": "ok"}
+
 # 2. TOTAL OPENNESS SECURITY
 app.add_middleware(
     CORSMiddleware,
@@ -20,20 +48,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class SMSRequest(BaseModel):
-    member_id: str
-
-@app.post("/api/messages/send-sms")
-async def send_sms(request: SMSRequest):
-    # This will appear in your Railway logs if the website successfully talks to the API
-    print(f"--- ACTION TRIGGERED ---")
-    print(f"SUCCESS: Received request for Member ID: {request.member_id}")
-    
-    return {"status": "success", "message": f"Connection verified for {request.member_id}"}
+# 3. ROUTERS
+app.include_router(messaging.router, prefix="/api")
+app.include_router(campaigns.router, prefix="/api")
+app.include_router(campaign_progress.router, prefix="/api")
+app.include_router(webhooks.router, prefix="/api")
+app.include_router(auth.router, prefix="/api")
+app.include_router(scoring.router, prefix="/api")
+app.include_router(churn_sync.router, prefix="/api")
+app.include_router(rollups.router, prefix="/api")
+app.include_router(drift.router, prefix="/api")
+app.include_router(effectiveness.router, prefix="/api")
+app.include_router(imports.router, prefix="/api")
+app.include_router(partitions.router, prefix="/api")
+app.include_router(members.router, prefix="/api")
 
 if __name__ == "__main__":
     import uvicorn
     # Using the PORT assigned by Railway or defaulting to 8080
     port = int(os.environ.get("PORT", 8080))
     # timeout_keep_alive=60 helps keep the connection from dropping during the handshake
-    uvicorn.run(app, host="0.0.0.0", port=port, timeout_keep_alive=60)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=port, timeout_keep_alive=60)
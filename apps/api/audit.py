@@ -0,0 +1,105 @@
+"""
+Buffered audit log writer.
+
+log_audit_event (dependencies.py) only enqueues; a background thread writes the
+queue to audit_logs in bulk inserts, when AUDIT_BATCH_SIZE rows are waiting or
+every AUDIT_FLUSH_INTERVAL_SECONDS, whichever comes first. close() drains the
+queue on shutdown (app lifespan / worker exit, with atexit as a backstop).
+
+Nothing is dropped silently:
+  - buffer full   -> the caller writes that event itself (backpressure, not loss)
+  - insert failed -> each event is printed as JSON under [Audit Log Lost] so it can be replayed
+"""
+import atexit
+import json
+import queue
+import threading
+from typing import List, Optional
+
+from .db import get_supabase
+from .settings import settings
+
+class AuditSink:
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.overflow_writes = 0
+
+    def _ensure_started(self):
+        # Started on first use, so each worker process (after fork) runs its own flusher
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+                self._thread.start()
+
+    def emit(self, row: dict):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Backpressure: this caller pays for one write rather than losing the event
+            self.overflow_writes += 1
+            self._write([row])
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def _drain(self, limit: int) -> List[dict]:
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows: List[dict]):
+        try:
+            get_supabase().table("audit_logs").insert(rows).execute()
+        except Exception as e:
+            # Don't fail the request if audit log fails, but definitely log it to stderr
+            print(f"[Audit Log Error] Failed to write {len(rows)} events: {e}")
+            for row in rows:
+                print(f"[Audit Log Lost] {json.dumps(row, default=str)}")
+
+    def flush(self):
+        """
+        Writes everything queued so far (in batches). Safe to call from any thread.
+        """
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                return
+            self._write(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """
+        Stops the flusher and writes whatever is still queued.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 10)
+            self._thread = None
+        self.flush()
+
+audit_sink = AuditSink(
+    settings.AUDIT_QUEUE_SIZE,
+    settings.AUDIT_BATCH_SIZE,
+    settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+)
+atexit.register(audit_sink.close)
@@ -0,0 +1,119 @@
+"""
+Request authentication without per-request I/O.
+
+- Access tokens are verified locally (signature + expiry + audience) with the project's
+  JWT secret (HS256, SUPABASE_JWT_SECRET) or the project's JWKS (asymmetric keys,
+  fetched once and cached by PyJWKClient). Only with neither configured do we fall back
+  to asking Supabase Auth (network).
+- profiles (gym_id, role) are cached per process in a TTL-bounded LRU (ProfileCache).
+  A role/gym change should call POST /auth/invalidate-profile (e.g. from a Supabase
+  database webhook on profiles); other processes pick it up within PROFILE_CACHE_TTL_SECONDS.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import jwt
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel
+
+from .settings import settings
+
+router = APIRouter()
+
+class TokenClaims(BaseModel):
+    user_id: str
+    email: Optional[str] = None
+
+class InvalidToken(Exception):
+    pass
+
+_jwks_client: Optional[jwt.PyJWKClient] = None
+
+def _jwks() -> jwt.PyJWKClient:
+    global _jwks_client
+    if _jwks_client is None:
+        # Keys are cached in-process; a rotated kid triggers one refetch
+        _jwks_client = jwt.PyJWKClient(f"{settings.SUPABASE_URL}/auth/v1/.well-known/jwks.json", cache_keys=True)
+    return _jwks_client
+
+def can_verify_locally() -> bool:
+    return bool(settings.SUPABASE_JWT_SECRET or settings.SUPABASE_JWKS_ENABLED)
+
+def verify_token(token: str) -> TokenClaims:
+    """
+    Verifies a Supabase access token locally. Raises InvalidToken.
+    """
+    try:
+        if settings.SUPABASE_JWT_SECRET:
+            key, algorithms = settings.SUPABASE_JWT_SECRET, ["HS256"]
+        else:
+            key, algorithms = _jwks().get_signing_key_from_jwt(token).key, ["RS256", "ES256"]
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=algorithms,
+            audience="authenticated",
+            options={"require": ["exp", "sub"]},
+            leeway=settings.JWT_LEEWAY_SECONDS,
+        )
+    except jwt.PyJWTError as e:
+        raise InvalidToken(str(e))
+    return TokenClaims(user_id=claims["sub"], email=claims.get("email"))
+
+class ProfileCache:
+    """
+    user_id -> (gym_id, role), LRU-bounded with a TTL per entry.
+    """
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[str, str]]]" = OrderedDict()
+        # Endpoints may run in the threadpool as well as the event loop
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, profile = entry
+            if expires_at <= self.clock():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return profile
+
+    def set(self, user_id: str, gym_id: str, role: str):
+        with self._lock:
+            self._entries[user_id] = (self.clock() + self.ttl_seconds, (gym_id, role))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """
+        Drops one user, or everyone when user_id is None.
+        """
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+profile_cache = ProfileCache(settings.PROFILE_CACHE_SIZE, settings.PROFILE_CACHE_TTL_SECONDS)
+
+class InvalidateProfileRequest(BaseModel):
+    user_id: Optional[str] = None  # None = flush every cached profile
+
+@router.post("/auth/invalidate-profile")
+async def invalidate_profile(request: InvalidateProfileRequest, x_api_key: str = Header(...)):
+    """
+    Call after changing a profile's role or gym (service-to-service, X-API-KEY).
+    """
+    if x_api_key != settings.X_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    profile_cache.invalidate(request.user_id)
+    return {"status": "invalidated"}
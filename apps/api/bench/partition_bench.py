@@ -0,0 +1,179 @@
+"""
+Query latency on the event tables, plain vs monthly partitioned (migration 030).
+
+Builds both layouts of member_score_history and audit_logs side by side in a scratch schema
+on a local Postgres (same columns and indexes as production), fills them with the same
+synthetic history, and times the queries that grow with them:
+  - effectiveness: before/after score lookups for recent contacts (migration 028's laterals)
+  - activity:      a gym's latest 100 audit rows (the /activity page)
+  - rollup day:    one day's score rows across all gyms
+  - retention:     removing the oldest month (delete vs drop partition), rolled back
+
+    python -m apps.api.bench.partition_bench --dsn postgresql://postgres@localhost/postgres \
+        --members 5000 --days 730
+The scratch schema is dropped afterwards unless --keep is given.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import asyncpg
+
+from ..settings import settings
+
+SCHEMA = "partition_bench"
+
+def _tables(layout: str, months: int) -> list:
+    partitioned = layout == "part"
+    suffix = " partition by range ({col})" if partitioned else ""
+    pk = "primary key (id, {col})" if partitioned else "primary key (id)"
+    statements = []
+    for table, col, columns in (
+        ("member_score_history", "score_date",
+         "id uuid not null default gen_random_uuid(), gym_id uuid not null, member_id text not null, "
+         "churn_score double precision not null, score_date timestamptz not null, created_at timestamptz not null default now()"),
+        ("audit_logs", "created_at",
+         "id uuid not null default gen_random_uuid(), gym_id uuid not null, user_id uuid not null, action text not null, "
+         "entity_type text, entity_id text, metadata jsonb, created_at timestamptz not null"),
+    ):
+        name = f"{SCHEMA}.{layout}_{table}"
+        statements.append(f"create table {name} ({columns}, {pk.format(col=col)}){suffix.format(col=col)}")
+        if partitioned:
+            statements.append(f"select {SCHEMA}.month_partitions('{layout}_{table}', {months})")
+    return statements
+
+async def _setup(conn, members: int, days: int, gyms: int):
+    months = days // 30 + 2
+    await conn.execute(f"drop schema if exists {SCHEMA} cascade; create schema {SCHEMA}")
+    await conn.execute(f"""
+        create function {SCHEMA}.month_partitions(p_table text, p_months int) returns void language plpgsql as $$
+        declare v_month timestamptz;
+        begin
+          for v_month in select generate_series(date_trunc('month', now()) - make_interval(months => p_months),
+                                                date_trunc('month', now()) + interval '1 month', interval '1 month')
+          loop
+            execute format('create table {SCHEMA}.%I partition of {SCHEMA}.%I for values from (%L) to (%L)',
+                           p_table || to_char(v_month, '_pYYYYMM'), p_table, v_month, v_month + interval '1 month');
+          end loop;
+        end $$""")
+    for layout in ("plain", "part"):
+        for statement in _tables(layout, months):
+            await conn.execute(statement)
+
+    # One score per member per day (the nightly sync), a few audit rows per gym per day
+    await conn.execute(f"""
+        create table {SCHEMA}.gyms as
+        select gen_random_uuid() as gym_id, g as n from generate_series(1, {gyms}) g""")
+    await conn.execute(f"""
+        insert into {SCHEMA}.plain_member_score_history (gym_id, member_id, churn_score, score_date)
+        select g.gym_id, 'm' || m, random() * 100, date_trunc('day', now()) - make_interval(days => d)
+        from {SCHEMA}.gyms g
+        cross join generate_series(1, {members} / {gyms}) m
+        cross join generate_series(0, {days} - 1) d""")
+    await conn.execute(f"""
+        insert into {SCHEMA}.plain_audit_logs (gym_id, user_id, action, created_at)
+        select g.gym_id, g.gym_id, 'send_sms', now() - make_interval(days => d, mins => a * 37)
+        from {SCHEMA}.gyms g
+        cross join generate_series(0, {days} - 1) d
+        cross join generate_series(1, 20) a""")
+    for table in ("member_score_history", "audit_logs"):
+        await conn.execute(f"insert into {SCHEMA}.part_{table} select * from {SCHEMA}.plain_{table}")
+    for layout in ("plain", "part"):
+        await conn.execute(f"create index on {SCHEMA}.{layout}_member_score_history (gym_id, member_id, score_date desc)")
+        await conn.execute(f"create index on {SCHEMA}.{layout}_audit_logs (gym_id, created_at desc)")
+        await conn.execute(f"analyze {SCHEMA}.{layout}_member_score_history")
+        await conn.execute(f"analyze {SCHEMA}.{layout}_audit_logs")
+
+    # 1,000 contacts from the last month to measure
+    await conn.execute(f"""
+        create table {SCHEMA}.contacts as
+        select g.gym_id, 'm' || (1 + (c * 7) % ({members} / {gyms})) as member_id,
+               now() - make_interval(days => 8 + c % 22) as created_at
+        from {SCHEMA}.gyms g
+        cross join generate_series(1, 1000 / {gyms}) c""")
+
+QUERIES = {
+    "effectiveness": """
+        select count(b.churn_score), count(a.churn_score)
+        from {s}.contacts cl
+        left join lateral (
+          select h.churn_score from {s}.{t}_member_score_history h
+          where h.gym_id = cl.gym_id and h.member_id = cl.member_id and h.score_date <= cl.created_at
+          order by h.score_date desc limit 1
+        ) b on true
+        left join lateral (
+          select h.churn_score from {s}.{t}_member_score_history h
+          where h.gym_id = cl.gym_id and h.member_id = cl.member_id
+            and h.score_date >= cl.created_at + interval '1 day' and h.score_date <= cl.created_at + interval '7 days'
+          order by h.score_date desc limit 1
+        ) a on true""",
+    "activity": """
+        select * from {s}.{t}_audit_logs
+        where gym_id = (select gym_id from {s}.gyms where n = 1)
+        order by created_at desc limit 100""",
+    "rollup day": """
+        select count(*), avg(churn_score) from {s}.{t}_member_score_history
+        where score_date >= date_trunc('day', now()) - interval '1 day' and score_date < date_trunc('day', now())""",
+}
+
+async def _time(conn, sql: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await conn.fetch(sql)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+async def _retention(conn, layout: str) -> float:
+    table = f"{SCHEMA}.{layout}_member_score_history"
+    oldest = await conn.fetchval(f"select date_trunc('month', min(score_date)) from {table}")
+    tx = conn.transaction()
+    await tx.start()
+    try:
+        start = time.perf_counter()
+        if layout == "plain":
+            await conn.execute(f"delete from {table} where score_date < $1::timestamptz + interval '1 month'", oldest)
+        else:
+            await conn.execute(f"drop table {SCHEMA}.part_member_score_history{oldest:_p%Y%m}")
+        return (time.perf_counter() - start) * 1000
+    finally:
+        await tx.rollback()
+
+async def run(dsn: str, members: int, days: int, gyms: int, repeat: int, keep: bool):
+    conn = await asyncpg.connect(dsn)
+    try:
+        start = time.perf_counter()
+        await _setup(conn, members, days, gyms)
+        rows = await conn.fetchval(f"select count(*) from {SCHEMA}.plain_member_score_history")
+        print(f"Loaded {rows:,} score rows ({members:,} members x {days} days, {gyms} gyms) "
+              f"in {time.perf_counter() - start:.0f}s")
+
+        print(f"{'query':<14} {'plain ms':>10} {'partitioned ms':>15}")
+        for name, sql in QUERIES.items():
+            plain = await _time(conn, sql.format(s=SCHEMA, t="plain"), repeat)
+            part = await _time(conn, sql.format(s=SCHEMA, t="part"), repeat)
+            print(f"{name:<14} {plain:>10.1f} {part:>15.1f}")
+        plain = await _retention(conn, "plain")
+        part = await _retention(conn, "part")
+        print(f"{'retention':<14} {plain:>10.1f} {part:>15.1f}")
+    finally:
+        if not keep:
+            await conn.execute(f"drop schema if exists {SCHEMA} cascade")
+        await conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Event table latency, plain vs partitioned")
+    parser.add_argument("--dsn", default=settings.DATABASE_URL, help="Local Postgres (default: DATABASE_URL)")
+    parser.add_argument("--members", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=730, help="Days of history")
+    parser.add_argument("--gyms", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Leave the scratch schema in place")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+    asyncio.run(run(args.dsn, args.members, args.days, args.gyms, args.repeat, args.keep))
+
+if __name__ == "__main__":
+    main()
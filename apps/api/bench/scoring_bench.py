@@ -0,0 +1,62 @@
+"""
+Throughput benchmark for churn scoring (scoring.py).
+
+Scores synthetic member_features rows through the library entry point and through
+POST /api/score/batch in-process, and compares against one /api/score call per row
+(how the n8n workflow scores today).
+
+    python -m apps.api.bench.scoring_bench --rows 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from .. import scoring
+from ..settings import settings
+
+def _rows(n: int):
+    rng = np.random.default_rng(0)
+    X = np.column_stack([
+        rng.integers(0, 2, n), rng.integers(0, 2, n), rng.integers(0, 2, n), rng.integers(0, 2, n),
+        np.ones(n), rng.integers(18, 60, n), rng.integers(0, 30, n), rng.choice([1, 6, 12], n),
+        rng.integers(1, 12, n), rng.integers(0, 2, n), rng.uniform(0, 4, n), rng.uniform(0, 4, n),
+        rng.uniform(0, 300, n), rng.integers(0, 60, n), rng.integers(0, 2, (n, 13)),
+    ])
+    rows = [dict(zip(scoring.FEATURE_COLUMNS, values)) for values in X.tolist()]
+    return X, rows
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Churn scoring throughput")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--single-sample", type=int, default=500, help="Rows sent one-by-one to /api/score for the baseline")
+    args = parser.parse_args()
+
+    from ..app import app
+    client = TestClient(app)
+    headers = {"X-API-KEY": settings.X_API_KEY}
+    scoring.get_model()
+
+    for n in args.rows:
+        X, rows = _rows(n)
+        _, t_matrix = _timed(lambda: scoring.score_matrix(X))
+        _, t_rows = _timed(lambda: scoring.score_rows(rows))
+        response, t_http = _timed(lambda: client.post("/api/score/batch", json={"rows": rows}, headers=headers))
+        response.raise_for_status()
+
+        print(f"{n:>7} rows  matrix {n / t_matrix:>14,.0f} rows/s  "
+              f"score_rows {n / t_rows:>12,.0f} rows/s  "
+              f"/score/batch {n / t_http:>10,.0f} rows/s ({t_http * 1000:.0f}ms)")
+
+    sample = _rows(args.single_sample)[1]
+    _, t_single = _timed(lambda: [client.post("/api/score", json=row, headers=headers).raise_for_status() for row in sample])
+    print(f"Baseline: /score one row per request {len(sample) / t_single:,.0f} rows/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Load generator for webhook ingestion (webhook_ingest.py).
+
+Fires Twilio status callbacks (several per message, shuffled like real delivery receipts)
+at the API and reports acknowledged callbacks/s, request latency, and how many status
+rows were actually applied after coalescing.
+
+    # Against a running API (uvicorn apps.api.app:app)
+    python -m apps.api.bench.webhook_load --url http://localhost:8000 --messages 5000
+
+    # In-process, no network or database: measures the ingestion path itself
+    python -m apps.api.bench.webhook_load --in-process --messages 5000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+CALLBACK_SEQUENCE = ["queued", "sent", "delivered"]
+
+def _callbacks(messages: int):
+    callbacks = []
+    for i in range(messages):
+        for status in CALLBACK_SEQUENCE:
+            callbacks.append({"MessageSid": f"SMbench{i:08d}", "MessageStatus": status})
+    # Receipts for different messages interleave, and a message's own can arrive out of order
+    random.shuffle(callbacks)
+    return callbacks
+
+async def _fire(client: httpx.AsyncClient, callbacks, concurrency: int):
+    latencies = []
+    queue = asyncio.Queue()
+    for cb in callbacks:
+        queue.put_nowait(cb)
+
+    async def worker():
+        while not queue.empty():
+            cb = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post("/api/webhooks/twilio/status", data=cb)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies
+
+def _in_process_client():
+    from ..app import app
+    from ..db import get_supabase
+    from .. import db
+    from ..tests.fakes import FakeSupabase
+
+    applied = []
+    fake = FakeSupabase({}, rpc_handlers={
+        "apply_message_status_updates": lambda _db, params: applied.extend(params["p_updates"]) or len(params["p_updates"]),
+    })
+    db._supabase = fake
+    app.dependency_overrides[get_supabase] = lambda: fake
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    return client, fake, applied
+
+async def main():
+    parser = argparse.ArgumentParser(description="Webhook ingestion load generator")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--in-process", action="store_true", help="Drive the app in-process with an in-memory database")
+    args = parser.parse_args()
+
+    callbacks = _callbacks(args.messages)
+    fake = applied = None
+    if args.in_process:
+        client, fake, applied = _in_process_client()
+    else:
+        client = httpx.AsyncClient(base_url=args.url, limits=httpx.Limits(max_connections=args.concurrency))
+
+    async with client:
+        start = time.perf_counter()
+        latencies = await _fire(client, callbacks, args.concurrency)
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"Callbacks:  {len(callbacks)} for {args.messages} messages, concurrency {args.concurrency}")
+    print(f"Throughput: {len(callbacks) / elapsed:,.0f} acks/s ({elapsed:.2f}s)")
+    print(f"Latency:    p50 {statistics.median(latencies):.1f}ms, p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f}ms")
+
+    if args.in_process:
+        from ..webhook_ingest import webhook_ingestor
+        flush_start = time.perf_counter()
+        webhook_ingestor.close()
+        print(f"Drain:      {(time.perf_counter() - flush_start) * 1000:.0f}ms")
+        print(f"Applied:    {len(applied)} status rows in {fake.calls_to('apply_message_status_updates').count('rpc')} RPCs "
+              f"(coalesced {webhook_ingestor.coalesced} of {webhook_ingestor.received} callbacks)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
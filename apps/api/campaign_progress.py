@@ -0,0 +1,202 @@
+"""
+Live campaign progress over server-sent events.
+
+GET /api/campaigns/{id}/progress streams the campaign's per-status counters (kept by the workers,
+migration 033) as `progress` events: a snapshot first, then one event per change, until the
+campaign is completed or failed. Comment lines keep idle connections open through proxies.
+
+Clients never query the database. One ProgressHub per process fans changes out to every stream:
+  - CAMPAIGN_PROGRESS_LISTEN_URL set: one asyncpg connection LISTENs on 'campaign_progress',
+    which the campaigns trigger notifies on every counter/status change
+  - otherwise (or if that connection drops): one task per watched campaign reads its row every
+    CAMPAIGN_PROGRESS_POLL_SECONDS, however many clients watch it
+Each stream only keeps the latest value, so a slow client skips intermediate counts instead of
+buffering them.
+"""
+import asyncio
+import json
+from typing import Dict, Optional, Set
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from .db import ASYNCPG_AVAILABLE, get_supabase
+from .dependencies import get_current_user_gym, UserContext
+from .settings import settings
+
+if ASYNCPG_AVAILABLE:
+    import asyncpg
+
+router = APIRouter()
+
+CHANNEL = "campaign_progress"
+TERMINAL_STATUSES = ("completed", "failed")
+PROGRESS_COLUMNS = "id, gym_id, status, total_recipients, processed_count, sent_count, failed_count, skipped_count, retrying_count"
+
+def _offer(queue: asyncio.Queue, row: dict):
+    # Latest value wins
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(row)
+
+def fetch_campaign_progress(campaign_id: str) -> Optional[dict]:
+    res = get_supabase().table("campaigns").select(PROGRESS_COLUMNS).eq("id", campaign_id).limit(1).execute()
+    return res.data[0] if res.data else None
+
+class ProgressHub:
+    def __init__(self, listen_url: Optional[str], poll_seconds: float):
+        self.listen_url = listen_url
+        self.poll_seconds = poll_seconds
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._pollers: Dict[str, asyncio.Task] = {}
+        self._listener = None
+        self._listen_failed = False
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    async def subscribe(self, campaign_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(campaign_id, set()).add(queue)
+        if not await self._ensure_listener():
+            self._ensure_poller(campaign_id)
+        return queue
+
+    def unsubscribe(self, campaign_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(campaign_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[campaign_id]
+            poller = self._pollers.pop(campaign_id, None)
+            if poller is not None:
+                poller.cancel()
+
+    def publish(self, row: dict):
+        for queue in self._subscribers.get(str(row.get("id")), ()):
+            _offer(queue, row)
+
+    async def _ensure_listener(self) -> bool:
+        if self._listener is not None:
+            return True
+        if not self.listen_url or not ASYNCPG_AVAILABLE or self._listen_failed:
+            return False
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._listener is None and not self._listen_failed:
+                try:
+                    conn = await asyncpg.connect(self.listen_url, statement_cache_size=0)
+                    await conn.add_listener(CHANNEL, self._on_notify)
+                    conn.add_termination_listener(self._on_terminated)
+                    self._listener = conn
+                    print(f"[Progress] Listening on {CHANNEL}")
+                except Exception as e:
+                    # Stay on polling for this process rather than retrying per request
+                    self._listen_failed = True
+                    print(f"[Progress] LISTEN unavailable, polling instead: {e}")
+        return self._listener is not None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            self.publish(json.loads(payload))
+        except ValueError as e:
+            print(f"[Progress] Bad notification payload: {e}")
+
+    def _on_terminated(self, connection):
+        if connection is not self._listener:
+            # Closed by close()
+            return
+        print("[Progress] LISTEN connection lost, polling watched campaigns")
+        self._listener = None
+        self._listen_failed = True
+        for campaign_id in self._subscribers:
+            self._ensure_poller(campaign_id)
+
+    def _ensure_poller(self, campaign_id: str):
+        if campaign_id not in self._pollers:
+            self._pollers[campaign_id] = asyncio.create_task(self._poll(campaign_id))
+
+    async def _poll(self, campaign_id: str):
+        last = None
+        try:
+            while campaign_id in self._subscribers:
+                try:
+                    row = await asyncio.to_thread(fetch_campaign_progress, campaign_id)
+                except Exception as e:
+                    print(f"[Progress] Poll failed for {campaign_id}: {e}")
+                    row = None
+                if row is not None and row != last:
+                    self.publish(row)
+                    last = row
+                    if row["status"] in TERMINAL_STATUSES:
+                        return
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            if self._pollers.get(campaign_id) is asyncio.current_task():
+                del self._pollers[campaign_id]
+
+    async def close(self):
+        for poller in self._pollers.values():
+            poller.cancel()
+        self._pollers.clear()
+        self._subscribers.clear()
+        if self._listener is not None:
+            conn, self._listener = self._listener, None
+            await conn.close()
+        self._listen_failed = False
+
+progress_hub = ProgressHub(settings.CAMPAIGN_PROGRESS_LISTEN_URL, settings.CAMPAIGN_PROGRESS_POLL_SECONDS)
+
+def progress_payload(row: dict) -> dict:
+    """
+    Counters as sent to the client. queued_count includes recipients claimed but not yet sent.
+    """
+    payload = {key: row.get(key) or 0 for key in
+               ("total_recipients", "processed_count", "sent_count", "failed_count", "skipped_count", "retrying_count")}
+    payload["queued_count"] = max(payload["total_recipients"] - payload["processed_count"] - payload["retrying_count"], 0)
+    payload["id"] = str(row["id"])
+    payload["status"] = row["status"]
+    return payload
+
+def _event(payload: dict) -> str:
+    return f"event: progress\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+async def _stream(campaign_id: str, queue: asyncio.Queue, snapshot: dict):
+    try:
+        last = progress_payload(snapshot)
+        yield _event(last)
+        while last["status"] not in TERMINAL_STATUSES:
+            try:
+                row = await asyncio.wait_for(queue.get(), timeout=settings.CAMPAIGN_PROGRESS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            payload = progress_payload(row)
+            if payload != last:
+                yield _event(payload)
+                last = payload
+    finally:
+        progress_hub.unsubscribe(campaign_id, queue)
+
+@router.get("/campaigns/{campaign_id}/progress")
+async def campaign_progress(campaign_id: str, user: UserContext = Depends(get_current_user_gym)):
+    """
+    text/event-stream of `progress` events until the campaign completes or fails.
+    """
+    # Subscribe before the snapshot so nothing between the two is missed
+    queue = await progress_hub.subscribe(campaign_id)
+    try:
+        row = await asyncio.to_thread(fetch_campaign_progress, campaign_id)
+    except Exception:
+        progress_hub.unsubscribe(campaign_id, queue)
+        raise
+    if row is None or (str(row["gym_id"]) != user.gym_id and user.role != "admin"):
+        progress_hub.unsubscribe(campaign_id, queue)
+        raise HTTPException(status_code=404, detail="Campaign not found")
+
+    return StreamingResponse(
+        _stream(campaign_id, queue, row),
+        media_type="text/event-stream",
+        # No proxy buffering, or events arrive in bursts
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
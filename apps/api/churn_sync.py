@@ -0,0 +1,174 @@
+"""
+Nightly churn sync: member_features -> churn scores -> members + member_score_history.
+
+Replaces the per-member loop in n8n/churn_sync_workflow.json (a /score call, a members
+update and a history insert for every member). Each chunk here is:
+  - one keyset page read   (member_features_page, in (gym_id, member_id) order)
+  - one vectorized scoring pass (scoring.py)
+  - one apply_churn_scores RPC, which updates members, bulk-inserts the history rows and
+    advances the run's checkpoint in a single transaction (migration 023)
+
+A run that crashes stays 'running' with the checkpoint of its last committed chunk, and the
+next invocation resumes after it, so no member is scored or recorded twice.
+
+Runs are incremental by default (migration 024): only members whose feature hash changed since
+their gym's watermark are read and scored, and a new score that moved less than
+CHURN_SCORE_MIN_CHANGE (without crossing the high-risk line) isn't written at all.
+A gym last scored by a different model version is rescored in full; --full forces it for everyone.
+
+The sync refuses to run while the loaded artifact is the shipped placeholder ("baseline": true in
+models/churn_model.json): its hand-tuned coefficients must never overwrite members' scores,
+risk flags or history. Point CHURN_MODEL_PATH at a trained export first.
+
+Usage:
+    python -m apps.api.churn_sync [--chunk-size 2000] [--restart] [--full]
+The n8n workflow now only triggers POST /api/churn-sync on its schedule.
+"""
+import argparse
+import threading
+import time
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+
+from . import scoring
+from .db import get_supabase
+from .members import at_risk_cache
+from .scoring import require_api_key
+from .settings import settings
+
+def _require_trained(model):
+    if model.baseline:
+        raise RuntimeError(
+            f"Churn model {model.version} is the placeholder baseline; "
+            "set CHURN_MODEL_PATH to a trained export before syncing scores"
+        )
+
+def _begin_run(supabase, model_version: str, restart: bool, incremental: bool) -> dict:
+    res = supabase.rpc("begin_churn_sync_run", {
+        "p_model_version": model_version,
+        "p_restart": restart,
+        "p_incremental": incremental,
+    }).execute()
+    return res.data[0]
+
+def _score_chunk(rows, model):
+    scores = scoring.score_rows(rows, model)
+    return [
+        {
+            "gym_id": row["gym_id"],
+            "member_id": row["member_id"],
+            "churn_score": float(score),
+            "is_high_risk": bool(score >= scoring.HIGH_RISK_THRESHOLD),
+        }
+        for row, score in zip(rows, scores)
+    ]
+
+def run_churn_sync(chunk_size: Optional[int] = None, restart: bool = False, full: bool = False) -> dict:
+    """
+    Scores changed member_features rows (every row with full=True), resuming an unfinished run
+    unless restart=True; a resumed run keeps its own mode. Returns the run summary.
+    On failure the error is recorded on the run (still resumable) and re-raised.
+    """
+    chunk_size = chunk_size or settings.CHURN_SYNC_CHUNK_SIZE
+    supabase = get_supabase()
+    # One model for the whole run, even if the registry swaps in a new version meanwhile
+    model = scoring.get_model()
+    _require_trained(model)
+    run = _begin_run(supabase, model.version, restart, incremental=not full)
+    if run.get("model_version") != model.version:
+        print(f"[Churn Sync] Unfinished run {run['id']} used model {run.get('model_version')}, starting over with {model.version}")
+        run = _begin_run(supabase, model.version, restart=True, incremental=not full)
+    run_id = run["id"]
+    # Incremental pages filter on the watermarks of the run's model version
+    page_model_version = run.get("model_version") if run.get("incremental", True) else None
+    after_gym_id, after_member_id = run.get("last_gym_id"), run.get("last_member_id")
+    if after_gym_id:
+        print(f"[Churn Sync] Resuming run {run_id} after {after_gym_id}/{after_member_id} ({run['rows_scored']} rows done)")
+    else:
+        mode = "incremental" if page_model_version else "full"
+        print(f"[Churn Sync] Starting {mode} run {run_id} (model {run.get('model_version')})")
+
+    start = time.perf_counter()
+    rows_scored = run.get("rows_scored") or 0
+    rows_written = run.get("rows_written") or 0
+    try:
+        while True:
+            page = supabase.rpc("member_features_page", {
+                "p_after_gym_id": after_gym_id,
+                "p_after_member_id": after_member_id,
+                "p_limit": chunk_size,
+                "p_model_version": page_model_version,
+            }).execute().data or []
+            if not page:
+                break
+
+            scores = _score_chunk(page, model)
+            written = supabase.rpc("apply_churn_scores", {
+                "p_run_id": run_id,
+                "p_after_gym_id": after_gym_id,
+                "p_after_member_id": after_member_id,
+                "p_scores": scores,
+                "p_min_change": settings.CHURN_SCORE_MIN_CHANGE,
+            }).execute().data
+            rows_scored += len(scores)
+            rows_written += written or 0
+            if written:
+                at_risk_cache.invalidate(s["gym_id"] for s in scores)
+            after_gym_id, after_member_id = page[-1]["gym_id"], page[-1]["member_id"]
+
+            if len(page) < chunk_size:
+                break
+    except Exception as e:
+        print(f"[Churn Sync Error] Run {run_id} stopped after {after_gym_id}/{after_member_id}: {e}")
+        supabase.table("churn_sync_runs").update({"error": str(e)}).eq("id", run_id).execute()
+        raise
+
+    # Completes the run and moves every gym's watermark to the run's start
+    supabase.rpc("finish_churn_sync_run", {"p_run_id": run_id}).execute()
+
+    elapsed = time.perf_counter() - start
+    print(f"[Churn Sync] Run {run_id} completed: {rows_scored} rows scored, {rows_written} written in {elapsed:.1f}s")
+    return {"run_id": run_id, "rows_scored": rows_scored, "rows_written": rows_written, "seconds": round(elapsed, 3)}
+
+# ------------------------------------------------------------------
+# Trigger endpoint (n8n schedule)
+# ------------------------------------------------------------------
+
+router = APIRouter(dependencies=[Depends(require_api_key)])
+
+# One sync per process; a second trigger while one is running is a no-op
+_running = threading.Lock()
+
+def _run_in_background(restart: bool, full: bool):
+    if not _running.acquire(blocking=False):
+        print("[Churn Sync] Already running in this process, ignoring trigger")
+        return
+    try:
+        run_churn_sync(restart=restart, full=full)
+    except Exception:
+        pass  # logged and recorded on the run; the next trigger resumes it
+    finally:
+        _running.release()
+
+@router.post("/churn-sync", status_code=202)
+async def trigger_churn_sync(background_tasks: BackgroundTasks, restart: bool = False, full: bool = False):
+    if _running.locked():
+        return {"status": "already_running"}
+    try:
+        _require_trained(scoring.get_model())
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    background_tasks.add_task(_run_in_background, restart, full)
+    return {"status": "started"}
+
+def main():
+    parser = argparse.ArgumentParser(description="GymGuard nightly churn sync")
+    parser.add_argument("--chunk-size", type=int, default=settings.CHURN_SYNC_CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Abandon any unfinished run and start over")
+    parser.add_argument("--full", action="store_true", help="Rescore every member, not only changed ones")
+    args = parser.parse_args()
+    run_churn_sync(chunk_size=args.chunk_size, restart=args.restart, full=args.full)
+
+if __name__ == "__main__":
+    main()
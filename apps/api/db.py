@@ -0,0 +1,89 @@
+"""
+Shared data access for the API and the worker.
+
+One Supabase client per process, on a single keep-alive (HTTP/2) connection pool,
+instead of one client + pool per router. The FastAPI app opens it in its lifespan
+(app.py) and routers receive it through Depends(get_supabase); worker processes and
+scripts get the same lazily created client from get_supabase().
+
+DATABASE_URL additionally opens a direct asyncpg pool (get_pg_pool) for hot bulk paths
+that are cheaper as plain SQL than through PostgREST. Optional: without it, or without
+asyncpg installed, get_pg_pool() returns None and callers use the Supabase client.
+"""
+from typing import Optional
+
+import httpx
+from supabase import create_client, Client, ClientOptions
+
+from .settings import settings
+
+# asyncpg is optional (only needed with DATABASE_URL)
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+
+_supabase: Optional[Client] = None
+_http: Optional[httpx.Client] = None
+_pg_pool = None
+
+def create_supabase(http: httpx.Client) -> Client:
+    return create_client(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_SERVICE_ROLE_KEY,
+        ClientOptions(httpx_client=http, postgrest_client_timeout=settings.SUPABASE_TIMEOUT_SECONDS),
+    )
+
+def _create_http() -> httpx.Client:
+    return httpx.Client(
+        http2=settings.SUPABASE_HTTP2,
+        timeout=settings.SUPABASE_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_POOL_SIZE,
+            max_keepalive_connections=settings.SUPABASE_POOL_SIZE,
+            keepalive_expiry=settings.SUPABASE_KEEPALIVE_SECONDS,
+        ),
+    )
+
+def get_supabase() -> Client:
+    """
+    Process-wide service-role client. Also the FastAPI dependency for routers.
+    """
+    global _supabase, _http
+    if _supabase is None:
+        _http = _create_http()
+        _supabase = create_supabase(_http)
+    return _supabase
+
+def get_pg_pool():
+    """
+    Direct asyncpg pool, or None when DATABASE_URL isn't configured.
+    """
+    return _pg_pool
+
+async def open_pg_pool():
+    global _pg_pool
+    if _pg_pool is not None or not settings.DATABASE_URL:
+        return _pg_pool
+    if not ASYNCPG_AVAILABLE:
+        print("[DB] DATABASE_URL is set but asyncpg is not installed; bulk paths will use PostgREST")
+        return None
+    _pg_pool = await asyncpg.create_pool(
+        settings.DATABASE_URL,
+        min_size=settings.PG_POOL_MIN_SIZE,
+        max_size=settings.PG_POOL_MAX_SIZE,
+        # PgBouncer (transaction mode) can't keep prepared statements across transactions
+        statement_cache_size=0,
+    )
+    return _pg_pool
+
+async def close_db():
+    global _supabase, _http, _pg_pool
+    if _pg_pool is not None:
+        await _pg_pool.close()
+        _pg_pool = None
+    if _http is not None:
+        _http.close()
+        _http = None
+    _supabase = None
@@ -1,11 +1,11 @@
 from fastapi import Header, HTTPException
-from supabase import create_client, Client
 from .settings import settings
+from .db import get_supabase
+from .audit import audit_sink
+from .auth import verify_token, can_verify_locally, profile_cache, InvalidToken, TokenClaims
 from pydantic import BaseModel
 import logging
-
-# Initialize Supabase Admin Client
-supabase_admin: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+from datetime import datetime
 
 from typing import Optional
 
@@ -23,6 +23,8 @@ async def get_current_user_gym(
     Validates Supabase JWT and derives gym_id from profiles.
     Replaces client-provided gym_id for security.
     Allows Admins to switch context via X-Target-Gym-ID.
+    The token is verified locally and the profile comes from auth.profile_cache,
+    so a warm request does no I/O at all.
     """
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid Authorization header format. Expected 'Bearer <token>'")
@@ -30,23 +32,34 @@ async def get_current_user_gym(
     token = authorization.split(" ")[1]
     
     try:
-        # Verify Token via Supabase Auth
-        user_res = supabase_admin.auth.get_user(token)
-        
-        if not user_res or not user_res.user:
-             raise HTTPException(status_code=401, detail="Invalid or expired token")
-        
-        user_id = user_res.user.id
-        email = user_res.user.email
-        
+        # Verify Token (locally when a secret/JWKS is configured, else via Supabase Auth)
+        if can_verify_locally():
+            try:
+                claims = verify_token(token)
+            except InvalidToken as e:
+                print(f"[Auth Error] {e}")
+                raise HTTPException(status_code=401, detail="Invalid or expired token")
+        else:
+            user_res = get_supabase().auth.get_user(token)
+            if not user_res or not user_res.user:
+                 raise HTTPException(status_code=401, detail="Invalid or expired token")
+            claims = TokenClaims(user_id=user_res.user.id, email=user_res.user.email)
+
+        user_id = claims.user_id
+        email = claims.email or ""
+
         # Get Gym Profile & Role
-        profile_res = supabase_admin.table("profiles").select("gym_id, role").eq("user_id", user_id).single().execute()
-        
-        if not profile_res.data:
-             raise HTTPException(status_code=403, detail="User has no associated gym profile")
-             
-        profile_gym_id = profile_res.data["gym_id"]
-        role = profile_res.data.get("role", "gym_owner") # Default if missing (shouldn't be per migration)
+        profile = profile_cache.get(user_id)
+        if profile is None:
+            profile_res = get_supabase().table("profiles").select("gym_id, role").eq("user_id", user_id).single().execute()
+
+            if not profile_res.data:
+                 raise HTTPException(status_code=403, detail="User has no associated gym profile")
+
+            profile = (profile_res.data["gym_id"], profile_res.data.get("role") or "gym_owner") # Default if missing (shouldn't be per migration)
+            profile_cache.set(user_id, *profile)
+
+        profile_gym_id, role = profile
         
         # Context Logic
         final_gym_id = profile_gym_id
@@ -60,6 +73,8 @@ async def get_current_user_gym(
             
         return UserContext(user_id=user_id, gym_id=final_gym_id, email=email, role=role)
         
+    except HTTPException:
+        raise
     except Exception as e:
         # Log the specific auth error internally
         print(f"[Auth Error] {str(e)}")
@@ -67,18 +82,17 @@ async def get_current_user_gym(
 
 def log_audit_event(gym_id: str, user_id: str, action: str, entity_type: str = None, entity_id: str = None, metadata: dict = None):
     """
-    Helper to insert rows into audit_logs.
+    Helper to record rows in audit_logs.
     Should be called inside endpoints after successful actions.
+    Only enqueues: audit.audit_sink writes them in bulk off the request path.
     """
-    try:
-        supabase_admin.table("audit_logs").insert({
-            "gym_id": gym_id,
-            "user_id": user_id,
-            "action": action,
-            "entity_type": entity_type,
-            "entity_id": entity_id,
-            "metadata": metadata or {}
-        }).execute()
-    except Exception as e:
-        # Don't fail the request if audit log fails, but definitely log it to stderr
-        print(f"[Audit Log Error] Failed to log {action}: {e}")
+    audit_sink.emit({
+        "gym_id": gym_id,
+        "user_id": user_id,
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "metadata": metadata or {},
+        # Stamped now, not at flush time
+        "created_at": datetime.now().isoformat()
+    })
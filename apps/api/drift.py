@@ -0,0 +1,334 @@
+"""
+Feature drift monitor over member_features.
+
+One chunked pass in (gym_id, member_id) order (member_features_page, migration 023). Rows
+of a gym are contiguous, so only the current gym's statistics are held in memory:
+  - count / nulls / min / max / mean / variance, merged chunk by chunk (Chan et al.)
+  - a fixed-size row reservoir as the quantile sketch (DRIFT_SKETCH_SIZE rows, any gym size)
+  - exact histogram counts over the reference window's decile bins
+
+Each feature is compared to its gym's reference window (model_monitor_reference, migration 027)
+with PSI over the reference bins and KS between the quantile sketches. The gym's
+model_monitor_runs row gets the worst status across features (thresholds in settings).
+A gym without a reference gets one from today's distribution (status ok, "baseline").
+
+Usage:
+    python -m apps.api.drift [--rebaseline]
+"""
+import argparse
+import time
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import APIRouter, BackgroundTasks, Depends
+
+from .db import get_supabase
+from .model_registry import FEATURE_COLUMNS
+from .scoring import require_api_key
+from .settings import settings
+
+QUANTILE_POINTS = np.linspace(0, 1, 101)
+REPORTED_QUANTILES = {"p01": 0.01, "p05": 0.05, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p95": 0.95, "p99": 0.99}
+# Empty bins would make PSI infinite
+PSI_EPSILON = 1e-4
+STATUS_ORDER = {"ok": 0, "warn": 1, "error": 2}
+
+def reference_edges(quantiles: np.ndarray) -> np.ndarray:
+    """
+    Inner bin edges from a feature's quantiles: the deciles, collapsed for discrete features
+    (a 0/1 column gets bins <0, [0, 1), >=1).
+    """
+    return np.unique(quantiles[10:100:10])
+
+def psi(reference_fractions: np.ndarray, current_counts: np.ndarray) -> float:
+    total = current_counts.sum()
+    if total == 0:
+        return 0.0
+    ref = np.clip(reference_fractions, PSI_EPSILON, None)
+    cur = np.clip(current_counts / total, PSI_EPSILON, None)
+    return float(np.sum((cur - ref) * np.log(cur / ref)))
+
+def ks(reference_quantiles: np.ndarray, current_values: np.ndarray) -> float:
+    """
+    Two-sample KS statistic between a reference quantile sketch and a current sample.
+    """
+    if len(current_values) == 0 or len(reference_quantiles) == 0:
+        return 0.0
+    ref = np.sort(reference_quantiles)
+    cur = np.sort(current_values)
+    grid = np.union1d(ref, cur)
+    f_ref = np.searchsorted(ref, grid, side="right") / len(ref)
+    f_cur = np.searchsorted(cur, grid, side="right") / len(cur)
+    return float(np.max(np.abs(f_ref - f_cur)))
+
+def drift_status(psi_value: float, ks_value: float, nulls: int) -> str:
+    if psi_value >= settings.DRIFT_PSI_ERROR or ks_value >= settings.DRIFT_KS_ERROR:
+        return "error"
+    if psi_value >= settings.DRIFT_PSI_WARN or ks_value >= settings.DRIFT_KS_WARN or nulls > 0:
+        return "warn"
+    return "ok"
+
+class GymFeatureStats:
+    """
+    Streaming statistics for one gym's features. Memory is O(sketch_size), whatever the gym size.
+    """
+    def __init__(self, n_features: int, sketch_size: int, bin_edges: Optional[List[np.ndarray]] = None,
+                 rng: Optional[np.random.Generator] = None):
+        self.count = np.zeros(n_features)
+        self.nulls = np.zeros(n_features, dtype=np.int64)
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+        self.min = np.full(n_features, np.inf)
+        self.max = np.full(n_features, -np.inf)
+        self.rows_seen = 0
+        self.sketch = np.empty((sketch_size, n_features))
+        self.rng = rng or np.random.default_rng()
+        self.bin_edges = bin_edges
+        self.histograms = [np.zeros(len(e) + 1, dtype=np.int64) for e in bin_edges] if bin_edges else None
+
+    def add(self, X: np.ndarray):
+        missing = np.isnan(X)
+        present = ~missing
+        n = present.sum(axis=0)
+        self.nulls += missing.sum(axis=0)
+        self.min = np.minimum(self.min, np.where(missing, np.inf, X).min(axis=0))
+        self.max = np.maximum(self.max, np.where(missing, -np.inf, X).max(axis=0))
+
+        # Chunk mean/M2, then merge into the running ones
+        safe_n = np.maximum(n, 1)
+        chunk_mean = np.where(missing, 0.0, X).sum(axis=0) / safe_n
+        chunk_m2 = np.where(missing, 0.0, (X - chunk_mean) ** 2).sum(axis=0)
+        total = self.count + n
+        safe_total = np.maximum(total, 1)
+        delta = chunk_mean - self.mean
+        self.mean = self.mean + delta * n / safe_total
+        self.m2 = self.m2 + chunk_m2 + delta ** 2 * self.count * n / safe_total
+        self.count = total
+
+        if self.histograms is not None:
+            for j, edges in enumerate(self.bin_edges):
+                column = X[present[:, j], j]
+                self.histograms[j] += np.bincount(np.searchsorted(edges, column, side="right"), minlength=len(edges) + 1)
+
+        self._sample(X)
+
+    def _sample(self, X: np.ndarray):
+        # Reservoir sampling (Algorithm R) over whole rows
+        size = len(self.sketch)
+        start = self.rows_seen
+        fill = max(0, min(size - start, len(X)))
+        if fill:
+            self.sketch[start:start + fill] = X[:fill]
+        rest = np.arange(start + fill, start + len(X))
+        if len(rest):
+            slots = self.rng.integers(0, rest + 1)
+            for i in np.flatnonzero(slots < size):
+                self.sketch[slots[i]] = X[fill + i]
+        self.rows_seen += len(X)
+
+    @property
+    def sample(self) -> np.ndarray:
+        return self.sketch[:min(self.rows_seen, len(self.sketch))]
+
+    @property
+    def variance(self) -> np.ndarray:
+        return np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), 0.0)
+
+    def column_sample(self, j: int) -> np.ndarray:
+        column = self.sample[:, j]
+        return column[~np.isnan(column)]
+
+    def quantiles(self, j: int, points) -> Optional[np.ndarray]:
+        column = self.column_sample(j)
+        return np.quantile(column, points) if len(column) else None
+
+def _to_matrix(rows: List[dict]) -> np.ndarray:
+    # None -> NaN: nulls are counted, not rejected
+    return np.array([[row.get(c) for c in FEATURE_COLUMNS] for row in rows], dtype=np.float64)
+
+def _load_reference(supabase, gym_id: str) -> Dict[str, dict]:
+    rows = supabase.table("model_monitor_reference").select("*").eq("gym_id", gym_id).execute().data or []
+    return {r["feature_name"]: r for r in rows}
+
+def _finish_gym(gym_id: str, stats: GymFeatureStats, reference: Dict[str, dict], run_date: date) -> dict:
+    """
+    Turns one gym's statistics into feature stats rows, a run row and (for a new baseline) reference rows.
+    """
+    feature_rows, reference_rows, drifted = [], [], []
+    gym_status = "ok"
+    for j, feature in enumerate(FEATURE_COLUMNS):
+        count = int(stats.count[j])
+        nulls = int(stats.nulls[j])
+        sample_quantiles = stats.quantiles(j, QUANTILE_POINTS)
+        row = {
+            "gym_id": gym_id,
+            "run_date": run_date.isoformat(),
+            "feature_name": feature,
+            "count": count,
+            "null_count": nulls,
+            "min_value": float(stats.min[j]) if count else None,
+            "max_value": float(stats.max[j]) if count else None,
+            "mean_value": float(stats.mean[j]) if count else None,
+            "variance": float(stats.variance[j]) if count else None,
+            # QUANTILE_POINTS are whole percentiles, so p05 is point 5
+            "quantiles": {k: float(sample_quantiles[int(round(v * 100))]) for k, v in REPORTED_QUANTILES.items()}
+                         if sample_quantiles is not None else None,
+        }
+
+        ref = reference.get(feature)
+        if ref is not None:
+            edges = np.array(ref["bin_edges"], dtype=np.float64)
+            counts = stats.histograms[j]
+            psi_value = psi(np.array(ref["bin_fractions"], dtype=np.float64), counts)
+            ks_value = ks(np.array(ref["quantiles"], dtype=np.float64), stats.column_sample(j))
+            # Small gyms: a few hundred members can't show drift reliably, so they only report
+            status = drift_status(psi_value, ks_value, nulls) if stats.rows_seen >= settings.DRIFT_MIN_MEMBERS else "ok"
+            row.update(histogram={"edges": edges.tolist(), "counts": counts.tolist()},
+                       psi=psi_value, ks=ks_value, drift_status=status)
+            if status != "ok":
+                drifted.append(f"{feature} psi={psi_value:.3f} ks={ks_value:.3f}")
+            if STATUS_ORDER[status] > STATUS_ORDER[gym_status]:
+                gym_status = status
+        elif sample_quantiles is not None:
+            # Baseline: today's distribution becomes the reference window
+            edges = reference_edges(sample_quantiles)
+            column = stats.column_sample(j)
+            counts = np.bincount(np.searchsorted(edges, column, side="right"), minlength=len(edges) + 1)
+            row.update(histogram={"edges": edges.tolist(), "counts": counts.tolist()}, drift_status="ok")
+            reference_rows.append({
+                "gym_id": gym_id,
+                "feature_name": feature,
+                "window_start": run_date.isoformat(),
+                "window_end": run_date.isoformat(),
+                "count": count,
+                "mean_value": row["mean_value"],
+                "variance": row["variance"],
+                "bin_edges": edges.tolist(),
+                "bin_fractions": (counts / max(counts.sum(), 1)).tolist(),
+                "quantiles": sample_quantiles.tolist(),
+            })
+        feature_rows.append(row)
+
+    if reference_rows and not reference:
+        notes = f"Baseline established from {stats.rows_seen} members"
+    elif drifted:
+        notes = "Drift: " + "; ".join(drifted)
+    else:
+        notes = f"No drift across {len(FEATURE_COLUMNS)} features ({stats.rows_seen} members)"
+    run_row = {"gym_id": gym_id, "run_date": run_date.isoformat(), "source": "drift", "status": gym_status, "notes": notes}
+    return {"features": feature_rows, "references": reference_rows, "run": run_row}
+
+class _Writer:
+    """
+    Buffers the per-gym rows and writes them in bulk upserts.
+    """
+    def __init__(self, supabase, batch_size: int = 1000):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.features: List[dict] = []
+        self.references: List[dict] = []
+        self.runs: List[dict] = []
+
+    def add(self, result: dict):
+        self.features.extend(result["features"])
+        self.references.extend(result["references"])
+        self.runs.append(result["run"])
+        if len(self.features) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.features:
+            self.supabase.table("model_monitor_feature_stats")\
+                .upsert(self.features, on_conflict="gym_id,run_date,feature_name").execute()
+        if self.references:
+            self.supabase.table("model_monitor_reference")\
+                .upsert(self.references, on_conflict="gym_id,feature_name").execute()
+        if self.runs:
+            self.supabase.table("model_monitor_runs").insert(self.runs).execute()
+        self.features, self.references, self.runs = [], [], []
+
+def run_drift_monitor(run_date: Optional[date] = None, chunk_size: Optional[int] = None, rebaseline: bool = False) -> dict:
+    """
+    Computes feature statistics + drift for every gym in one pass over member_features.
+    rebaseline=True replaces every gym's reference window with today's distribution.
+    """
+    run_date = run_date or date.today()
+    chunk_size = chunk_size or settings.DRIFT_CHUNK_SIZE
+    supabase = get_supabase()
+    writer = _Writer(supabase)
+    start = time.perf_counter()
+    statuses = {"ok": 0, "warn": 0, "error": 0}
+
+    current_gym, stats, reference = None, None, {}
+    after_gym_id, after_member_id = None, None
+
+    def finish():
+        result = _finish_gym(current_gym, stats, reference, run_date)
+        statuses[result["run"]["status"]] += 1
+        writer.add(result)
+
+    while True:
+        page = supabase.rpc("member_features_page", {
+            "p_after_gym_id": after_gym_id,
+            "p_after_member_id": after_member_id,
+            "p_limit": chunk_size,
+        }).execute().data or []
+        if not page:
+            break
+
+        # Split the chunk at gym boundaries (rows arrive ordered by gym_id)
+        boundaries = [0] + [i for i in range(1, len(page)) if page[i]["gym_id"] != page[i - 1]["gym_id"]] + [len(page)]
+        for lo, hi in zip(boundaries, boundaries[1:]):
+            gym_id = page[lo]["gym_id"]
+            if gym_id != current_gym:
+                if current_gym is not None:
+                    finish()
+                current_gym = gym_id
+                reference = {} if rebaseline else _load_reference(supabase, gym_id)
+                edges = [np.array(reference[f]["bin_edges"], dtype=np.float64) for f in FEATURE_COLUMNS] \
+                    if len(reference) == len(FEATURE_COLUMNS) else None
+                if edges is None:
+                    reference = {}
+                stats = GymFeatureStats(len(FEATURE_COLUMNS), settings.DRIFT_SKETCH_SIZE, edges)
+            stats.add(_to_matrix(page[lo:hi]))
+
+        after_gym_id, after_member_id = page[-1]["gym_id"], page[-1]["member_id"]
+        if len(page) < chunk_size:
+            break
+
+    if current_gym is not None:
+        finish()
+    writer.flush()
+
+    elapsed = time.perf_counter() - start
+    gyms = sum(statuses.values())
+    print(f"[Drift Monitor] {run_date}: {gyms} gyms ({statuses['warn']} warn, {statuses['error']} error) in {elapsed:.1f}s")
+    return {"run_date": run_date.isoformat(), "gyms": gyms, **statuses, "seconds": round(elapsed, 3)}
+
+# ------------------------------------------------------------------
+# Trigger endpoint (n8n schedule)
+# ------------------------------------------------------------------
+
+router = APIRouter(dependencies=[Depends(require_api_key)])
+
+def _run_in_background(rebaseline: bool):
+    try:
+        run_drift_monitor(rebaseline=rebaseline)
+    except Exception as e:
+        print(f"[Drift Monitor Error] {e}")
+
+@router.post("/monitor/drift", status_code=202)
+async def trigger_drift_monitor(background_tasks: BackgroundTasks, rebaseline: bool = False):
+    background_tasks.add_task(_run_in_background, rebaseline)
+    return {"status": "started"}
+
+def main():
+    parser = argparse.ArgumentParser(description="GymGuard feature drift monitor")
+    parser.add_argument("--rebaseline", action="store_true", help="Replace every gym's reference window with today's distribution")
+    parser.add_argument("--chunk-size", type=int, default=settings.DRIFT_CHUNK_SIZE)
+    args = parser.parse_args()
+    run_drift_monitor(chunk_size=args.chunk_size, rebaseline=args.rebaseline)
+
+if __name__ == "__main__":
+    main()
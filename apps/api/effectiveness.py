@@ -0,0 +1,50 @@
+"""
+Outreach effectiveness: did a member's churn score drop in the week after we contacted them?
+
+measure_outreach_effectiveness (migration 028) writes an outreach_outcomes row for every contact
+whose 7 day window has closed and hasn't been measured yet: the last score before the contact and
+the last score 1-7 days after it, each one index probe into member_score_history. It then
+re-aggregates gym_outreach_effectiveness_daily for just the days that got new outcomes.
+Contacts are measured once, so re-running is cheap and never double counts.
+
+Usage:
+    python -m apps.api.effectiveness [--lookback-days 30]
+The n8n effectiveness workflow triggers POST /api/effectiveness/run on its schedule.
+"""
+import argparse
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+
+from .db import get_supabase
+from .scoring import require_api_key
+
+def run_effectiveness(lookback_days: Optional[int] = None) -> dict:
+    """
+    Measures pending contacts from the last lookback_days (default: 30, set in the database).
+    """
+    params = {"p_lookback": f"{lookback_days} days"} if lookback_days else {}
+    start = time.perf_counter()
+    res = get_supabase().rpc("measure_outreach_effectiveness", params).execute()
+    summary = (res.data or [{}])[0]
+    elapsed = time.perf_counter() - start
+    print(f"[Effectiveness] {summary.get('outcome_count', 0)} contacts measured, "
+          f"{summary.get('day_count', 0)} gym days updated in {elapsed:.1f}s")
+    return {**summary, "seconds": round(elapsed, 3)}
+
+router = APIRouter(dependencies=[Depends(require_api_key)])
+
+@router.post("/effectiveness/run")
+def trigger_effectiveness(lookback_days: Optional[int] = None):
+    # Sync endpoint: runs in the threadpool; only unmeasured contacts are read
+    return run_effectiveness(lookback_days)
+
+def main():
+    parser = argparse.ArgumentParser(description="GymGuard outreach effectiveness")
+    parser.add_argument("--lookback-days", type=int, default=None, help="Oldest contacts to measure (default: 30)")
+    args = parser.parse_args()
+    run_effectiveness(args.lookback_days)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Streaming CSV member import (members or the 27 member_features inputs).
+
+POST /api/imports/csv streams the request body to a temp file, checks the header and answers 202
+with the new member_import_jobs row. The import then runs in the background, IMPORT_CHUNK_SIZE
+rows at a time, so memory stays flat whatever the file size:
+  - parse + validate a chunk against the members / member_features schema (off the event loop)
+  - bulk-load the valid rows into member_import_staging: COPY over the direct asyncpg pool
+    when DATABASE_URL is set, else PostgREST inserts
+  - write only the invalid rows to member_import_rows
+  - update the job's rows_processed / rows_invalid
+merge_member_import (migration 029) then rejects duplicate member_ids (the first row wins) and
+upserts the staged rows into members / member_features in one statement.
+
+Job status: uploaded (rows streaming in) -> validated (all staged) -> imported, or failed.
+"""
+import asyncio
+import csv
+import io
+import json
+import math
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+
+from .db import get_pg_pool, get_supabase
+from .dependencies import get_current_user_gym, UserContext, log_audit_event
+from .members import at_risk_cache
+from .model_registry import FEATURE_COLUMNS
+from .settings import settings
+
+router = APIRouter()
+
+MEMBER_COLUMNS = ["member_id", "first_name", "last_name", "phone", "email"]
+FLOAT_FEATURES = {"Avg_class_frequency_total", "Avg_class_frequency_current_month", "Avg_additional_charges_total"}
+INT_MAX = 2 ** 31 - 1
+
+# member_import_staging columns loaded for each import type
+STAGING_COLUMNS = {
+    "members": ["import_job_id", "row_number"] + MEMBER_COLUMNS + ["last_churn_score"],
+    "member_features": ["import_job_id", "row_number", "member_id"] + FEATURE_COLUMNS,
+}
+REJECT_COLUMNS = ["gym_id", "import_job_id", "row_number", "raw_row", "is_valid", "error_message"]
+
+def required_columns(import_type: str) -> List[str]:
+    return MEMBER_COLUMNS if import_type == "members" else ["member_id"] + FEATURE_COLUMNS
+
+def _text(raw: dict, column: str) -> Optional[str]:
+    value = (raw.get(column) or "").strip()
+    return value or None
+
+def _int(value: str) -> int:
+    number = float(value)
+    if not number.is_integer() or abs(number) > INT_MAX:
+        raise ValueError
+    return int(number)
+
+def _float(value: str) -> float:
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError
+    return number
+
+def validate_row(import_type: str, raw: dict) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    One CSV row -> (staging record, None) or (None, error message).
+    """
+    if None in raw:
+        return None, "Too many values"
+    member_id = _text(raw, "member_id")
+    if not member_id:
+        return None, "Missing member_id"
+    record = {"member_id": member_id}
+
+    if import_type == "members":
+        for column in ("first_name", "last_name"):
+            record[column] = _text(raw, column)
+            if record[column] is None:
+                return None, f"Missing {column}"
+        record["phone"] = _text(raw, "phone")
+        record["email"] = _text(raw, "email")
+        score = _text(raw, "last_churn_score")
+        if score is not None:
+            try:
+                record["last_churn_score"] = _float(score)
+            except ValueError:
+                return None, "last_churn_score is not a number"
+            # members_score_range
+            if not 0 <= record["last_churn_score"] <= 100:
+                return None, "last_churn_score must be between 0 and 100"
+        return record, None
+
+    missing = [c for c in FEATURE_COLUMNS if _text(raw, c) is None]
+    if missing:
+        return None, f"Missing values: {', '.join(missing)}"
+    for column in FEATURE_COLUMNS:
+        parse = _float if column in FLOAT_FEATURES else _int
+        try:
+            record[column] = parse(raw[column].strip())
+        except ValueError:
+            kind = "a number" if column in FLOAT_FEATURES else "a whole number"
+            return None, f"{column} must be {kind}"
+    return record, None
+
+def _read_chunk(rows: Iterator[dict], import_type: str, job_id: str, gym_id: str,
+                first_row_number: int, size: int) -> Tuple[int, List[dict], List[dict]]:
+    """
+    Reads + validates up to `size` rows. Returns (rows read, staging records, rejected rows).
+    """
+    valid, rejected = [], []
+    count = 0
+    for raw in rows:
+        row_number = first_row_number + count
+        count += 1
+        record, error = validate_row(import_type, raw)
+        if error is None:
+            valid.append({"import_job_id": job_id, "row_number": row_number, **record})
+        else:
+            rejected.append({
+                "gym_id": gym_id,
+                "import_job_id": job_id,
+                "row_number": row_number,
+                "raw_row": {k: v for k, v in raw.items() if k is not None},
+                "is_valid": False,
+                "error_message": error,
+            })
+        if count == size:
+            break
+    return count, valid, rejected
+
+async def _copy(pool, table: str, columns: List[str], records: List[dict], json_columns=()):
+    def value(record, column):
+        v = record.get(column)
+        return json.dumps(v) if column in json_columns else v
+    async with pool.acquire() as conn:
+        await conn.copy_records_to_table(
+            table,
+            schema_name="public",
+            columns=columns,
+            records=[tuple(value(r, c) for c in columns) for r in records],
+        )
+
+async def _write_chunk(import_type: str, valid: List[dict], rejected: List[dict]):
+    pool = get_pg_pool()
+    columns = STAGING_COLUMNS[import_type]
+    if pool is not None:
+        if valid:
+            await _copy(pool, "member_import_staging", columns, valid)
+        if rejected:
+            await _copy(pool, "member_import_rows", REJECT_COLUMNS, rejected, json_columns=("raw_row",))
+        return
+    # Every staging record carries the same keys, so PostgREST doesn't null out columns per row
+    if valid:
+        staged = [{c: r.get(c) for c in columns} for r in valid]
+        await asyncio.to_thread(lambda: get_supabase().table("member_import_staging").insert(staged).execute())
+    if rejected:
+        await asyncio.to_thread(lambda: get_supabase().table("member_import_rows").insert(rejected).execute())
+
+def _update_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    get_supabase().table("member_import_jobs").update(fields).eq("id", job_id).execute()
+
+async def run_member_import(job_id: str, gym_id: str, import_type: str, rows: Iterator[dict],
+                            chunk_size: Optional[int] = None) -> dict:
+    """
+    Validates + stages `rows` chunk by chunk, then merges them. The job row tracks progress.
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    processed = invalid = 0
+    try:
+        while True:
+            count, valid, rejected = await asyncio.to_thread(
+                _read_chunk, rows, import_type, job_id, gym_id, processed + 1, chunk_size)
+            if count == 0:
+                break
+            await _write_chunk(import_type, valid, rejected)
+            processed += count
+            invalid += len(rejected)
+            await asyncio.to_thread(_update_job, job_id, rows_processed=processed, rows_invalid=invalid)
+
+        await asyncio.to_thread(_update_job, job_id, status="validated")
+        res = await asyncio.to_thread(lambda: get_supabase().rpc("merge_member_import", {"p_job_id": job_id}).execute())
+        merged = (res.data or [{}])[0]
+        at_risk_cache.invalidate([gym_id])
+    except Exception as e:
+        print(f"[Import Error] Job {job_id} failed after {processed} rows: {e}")
+        try:
+            await asyncio.to_thread(lambda: get_supabase().rpc(
+                "fail_member_import", {"p_job_id": job_id, "p_error": str(e)[:1000]}).execute())
+        except Exception as fail_err:
+            print(f"[Import Error] Could not mark job {job_id} failed: {fail_err}")
+        raise
+
+    summary = {
+        "job_id": job_id,
+        "rows_processed": processed,
+        "rows_imported": merged.get("imported_count", 0),
+        "rows_invalid": invalid + merged.get("duplicate_count", 0),
+    }
+    print(f"[Import] Job {job_id}: {summary['rows_imported']} {import_type} rows imported, "
+          f"{summary['rows_invalid']} invalid of {processed}")
+    return summary
+
+async def _import_file(job_id: str, gym_id: str, import_type: str, text: io.TextIOWrapper, reader: csv.DictReader):
+    try:
+        await run_member_import(job_id, gym_id, import_type, reader)
+    except Exception:
+        # Already recorded on the job
+        pass
+    finally:
+        text.close()
+
+@router.post("/imports/csv", status_code=202)
+async def import_csv(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    import_type: str = Query(..., pattern="^(members|member_features)$"),
+    user: UserContext = Depends(get_current_user_gym),
+):
+    """
+    Body: the raw CSV file (Content-Type: text/csv), header row first.
+    Poll member_import_jobs (by the returned job_id) for progress.
+    """
+    spool = tempfile.TemporaryFile()
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"CSV is larger than {settings.IMPORT_MAX_BYTES} bytes")
+            await asyncio.to_thread(spool.write, chunk)
+        spool.seek(0)
+
+        text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(text)
+        header = [c.strip() for c in (reader.fieldnames or [])]
+        missing = [c for c in required_columns(import_type) if c not in header]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+        reader.fieldnames = header
+    except (HTTPException, UnicodeDecodeError, csv.Error) as e:
+        spool.close()
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=400, detail=f"Not a readable UTF-8 CSV: {e}")
+
+    job_id = str(uuid.uuid4())
+    try:
+        get_supabase().table("member_import_jobs").insert({
+            "id": job_id,
+            "gym_id": user.gym_id,
+            "created_by_user_id": user.user_id,
+            "source_type": "csv",
+            "import_type": import_type,
+            "status": "uploaded",
+        }).execute()
+    except Exception:
+        text.close()
+        raise
+
+    background_tasks.add_task(_import_file, job_id, user.gym_id, import_type, text, reader)
+    log_audit_event(user.gym_id, user.user_id, "import_csv", "member_import_job", job_id,
+                    {"import_type": import_type, "bytes": size})
+    return {"status": "import_started", "job_id": job_id}
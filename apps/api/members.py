@@ -0,0 +1,165 @@
+"""
+At-risk members read API for the Home screen.
+
+GET /api/members/at-risk serves the watchlist (high risk, not contacted within the cooldown, by
+score) one keyset page at a time through at_risk_members_page (migration 032): the cursor is the
+last row's (last_churn_score, id), so every page is an index range read however large the gym.
+Only the columns the Home screen shows are returned.
+
+Responses carry an ETag; a matching If-None-Match gets a 304 with no body.
+The first page (plus the list's total) is cached per gym for AT_RISK_CACHE_TTL_SECONDS, and dropped
+as soon as this process changes the list: send_sms and campaign sends (last_contacted_at), the
+churn sync and CSV imports (scores) call at_risk_cache.invalidate. Other processes pick changes up
+within the TTL.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+
+from .db import get_supabase
+from .dependencies import get_current_user_gym, UserContext
+from .settings import settings
+
+router = APIRouter()
+
+class FirstPageCache:
+    """
+    gym_id -> (page size, ETag, body) of the first page, LRU-bounded with a TTL per entry.
+    A page read before an invalidation of its gym is never stored (see generation()).
+    """
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[int, str, bytes]]]" = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        # Endpoints may run in the threadpool as well as the event loop
+        self._lock = threading.Lock()
+
+    def generation(self, gym_id: str) -> Tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._generations.get(gym_id, 0)
+
+    def get(self, gym_id: str, limit: int) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            entry = self._entries.get(gym_id)
+            if entry is None:
+                return None
+            expires_at, (size, etag, body) = entry
+            if expires_at <= self.clock():
+                del self._entries[gym_id]
+                return None
+            if size != limit:
+                return None
+            self._entries.move_to_end(gym_id)
+            return etag, body
+
+    def set(self, gym_id: str, limit: int, etag: str, body: bytes, generation: Tuple[int, int]):
+        with self._lock:
+            if generation != (self._epoch, self._generations.get(gym_id, 0)):
+                return
+            self._entries[gym_id] = (self.clock() + self.ttl_seconds, (limit, etag, body))
+            self._entries.move_to_end(gym_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, gym_ids: Optional[Iterable[str]] = None):
+        """
+        Drops the given gyms, or every gym when gym_ids is None.
+        """
+        with self._lock:
+            if gym_ids is None:
+                self._epoch += 1
+                self._entries.clear()
+                return
+            for gym_id in set(gym_ids):
+                self._generations[gym_id] = self._generations.get(gym_id, 0) + 1
+                self._entries.pop(gym_id, None)
+
+at_risk_cache = FirstPageCache(settings.AT_RISK_CACHE_SIZE, settings.AT_RISK_CACHE_TTL_SECONDS)
+
+def encode_cursor(score: float, member_uuid: str) -> str:
+    raw = json.dumps([score, member_uuid], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        score, member_uuid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(score), str(member_uuid)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def _not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+def _response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    headers = {
+        "ETag": etag,
+        # Revalidate every time; the body differs per user/gym
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization, X-Target-Gym-ID",
+    }
+    if _not_modified(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def fetch_at_risk_page(gym_id: str, limit: int, cursor: Optional[str] = None) -> dict:
+    after_score, after_id = decode_cursor(cursor) if cursor else (None, None)
+    rows = get_supabase().rpc("at_risk_members_page", {
+        "p_gym_id": gym_id,
+        "p_after_score": after_score,
+        "p_after_id": after_id,
+        "p_limit": limit + 1,
+        "p_cooldown": f"{settings.AT_RISK_CONTACT_COOLDOWN_HOURS} hours",
+        "p_with_total": cursor is None,
+    }).execute().data or []
+
+    page = {"members": [], "next_cursor": None}
+    if cursor is None:
+        page["total_count"] = rows[0]["total_count"] if rows else 0
+    for row in rows[:limit]:
+        row.pop("total_count", None)
+        page["members"].append(row)
+    if len(rows) > limit:
+        last = page["members"][-1]
+        page["next_cursor"] = encode_cursor(last["last_churn_score"], last["id"])
+    return page
+
+@router.get("/members/at-risk")
+def at_risk_members(
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Default AT_RISK_PAGE_SIZE"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    if_none_match: Optional[str] = Header(None),
+    user: UserContext = Depends(get_current_user_gym),
+):
+    """
+    High-risk members not contacted within AT_RISK_CONTACT_COOLDOWN_HOURS, by score (desc).
+    The first page also has total_count. Pass next_cursor back as cursor for the next page.
+    """
+    limit = limit or settings.AT_RISK_PAGE_SIZE
+    if cursor is None:
+        cached = at_risk_cache.get(user.gym_id, limit)
+        if cached is not None:
+            etag, body = cached
+            return _response(body, etag, if_none_match)
+        generation = at_risk_cache.generation(user.gym_id)
+
+    body = json.dumps(fetch_at_risk_page(user.gym_id, limit, cursor), separators=(",", ":")).encode()
+    etag = _etag(body)
+    if cursor is None:
+        at_risk_cache.set(user.gym_id, limit, etag, body, generation)
+    return _response(body, etag, if_none_match)
@@ -0,0 +1,166 @@
+"""
+Campaign message templates: compiled once, rendered per recipient batch.
+
+A template body uses {{first_name}}, {{last_name}} and {{gym_name}} placeholders. compile_template
+turns it into a str.format string plus the literal text's GSM-7 / UCS-2 length, so per message
+only the substituted values are measured to get the SMS segment count:
+  - GSM-7 (every character in the GSM 03.38 basic or extension table; extension chars take 2):
+    1 segment up to 160 septets, otherwise 153 per segment
+  - anything else goes out as UCS-2: 1 segment up to 70 UTF-16 units, otherwise 67 per segment
+Carriers don't split an extension char across segments, so a long message with one on the boundary
+can take one more segment than counted here.
+
+For provider-side personalization (bulk email), tagged() gives the body with each field as a
+substitution tag (-first_name-) and substitutions() the per-recipient values for those tags.
+
+Placeholders the renderer doesn't know are left in the text as written; the API rejects bodies
+with any (unknown_fields) before a campaign is created.
+"""
+import math
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# field -> text used when the member / gym has no value
+FIELDS = {"first_name": "there", "last_name": "", "gym_name": "your gym"}
+SUBSTITUTION_TAG = "-{}-"
+
+GSM7_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENSION = frozenset("\f^{}\\[~]|€")
+
+def gsm7_septets(text: str) -> Optional[int]:
+    """
+    Length in GSM-7 septets, or None if the text needs UCS-2.
+    """
+    septets = 0
+    for ch in text:
+        if ch in GSM7_BASIC:
+            septets += 1
+        elif ch in GSM7_EXTENSION:
+            septets += 2
+        else:
+            return None
+    return septets
+
+def ucs2_units(text: str) -> int:
+    # UTF-16 code units: characters outside the BMP (most emoji) take two
+    return len(text.encode("utf-16-le")) // 2
+
+def segment_count(gsm7: bool, length: int) -> int:
+    if gsm7:
+        return 1 if length <= 160 else math.ceil(length / 153)
+    return 1 if length <= 70 else math.ceil(length / 67)
+
+def segments_for(text: str) -> int:
+    septets = gsm7_septets(text)
+    if septets is not None:
+        return segment_count(True, septets)
+    return segment_count(False, ucs2_units(text))
+
+class CompiledTemplate:
+    def __init__(self, body: str):
+        self.body = body
+        pieces = []
+        literals = []
+        self.fields: List[str] = []  # in order of appearance, repeats included
+        self.unknown_fields: List[str] = []
+        pos = 0
+        for match in PLACEHOLDER.finditer(body):
+            literals.append(body[pos:match.start()])
+            pieces.append(_escape(body[pos:match.start()]))
+            name = match.group(1)
+            if name in FIELDS:
+                self.fields.append(name)
+                pieces.append("{" + name + "}")
+            else:
+                self.unknown_fields.append(name)
+                literals.append(match.group(0))
+                pieces.append(_escape(match.group(0)))
+            pos = match.end()
+        literals.append(body[pos:])
+        pieces.append(_escape(body[pos:]))
+
+        self._format = "".join(pieces)
+        literal_text = "".join(literals)
+        # Everything about the fixed text is measured here, once
+        self._literal_septets = gsm7_septets(literal_text)
+        self._literal_units = ucs2_units(literal_text)
+
+    def values(self, member: Optional[dict], gym_name: Optional[str]) -> Dict[str, str]:
+        member = member or {}
+        return {
+            "first_name": (member.get("first_name") or "").strip() or FIELDS["first_name"],
+            "last_name": (member.get("last_name") or "").strip() or FIELDS["last_name"],
+            "gym_name": (gym_name or "").strip() or FIELDS["gym_name"],
+        }
+
+    def render(self, values: Dict[str, str], measured: Optional[dict] = None) -> Tuple[str, int]:
+        """
+        (message body, SMS segments) for one recipient's values.
+        measured memoizes value -> (septets, units) across calls; names and the gym repeat a lot.
+        """
+        if measured is None:
+            measured = {}
+        text = self._format.format_map(values)
+        septets = self._literal_septets
+        units = self._literal_units
+        for name in self.fields:
+            value = values[name]
+            m = measured.get(value)
+            if m is None:
+                m = measured[value] = (gsm7_septets(value), ucs2_units(value))
+            if septets is not None:
+                septets = None if m[0] is None else septets + m[0]
+            units += m[1]
+        return text, segment_count(septets is not None, units if septets is None else septets)
+
+    def render_batch(self, members: Iterable[dict], gym_name: Optional[str]) -> Dict[str, Tuple[str, int]]:
+        """
+        member_id -> (body, segments) for every member of one bulk lookup.
+        """
+        measured = {}
+        return {m["member_id"]: self.render(self.values(m, gym_name), measured) for m in members}
+
+    def tagged(self) -> str:
+        return self._format.format_map({name: SUBSTITUTION_TAG.format(name) for name in FIELDS})
+
+    def substitutions(self, values: Dict[str, str]) -> Dict[str, str]:
+        return {SUBSTITUTION_TAG.format(name): values[name] for name in set(self.fields)}
+
+    def estimate_segments(self, lengths: Dict[str, Optional[int]], gsm7: bool, gym_name: Optional[str]) -> int:
+        """
+        Segments for a member whose names have these lengths (None = missing, so the fallback is used)
+        and are (gsm7=True) or aren't all GSM-7 characters, without the names themselves.
+        """
+        values = self.values(None, gym_name)
+        gym = values["gym_name"]
+        gym_septets = gsm7_septets(gym)
+        septets = self._literal_septets if gsm7 else None
+        units = self._literal_units
+        for name in self.fields:
+            if name == "gym_name":
+                length, field_septets = ucs2_units(gym), gym_septets
+            elif lengths.get(name):
+                length, field_septets = lengths[name], lengths[name]
+            else:
+                length = len(values[name])
+                field_septets = gsm7_septets(values[name])
+            units += length
+            if septets is not None:
+                septets = None if field_septets is None else septets + field_septets
+        return segment_count(septets is not None, units if septets is None else septets)
+
+def _escape(literal: str) -> str:
+    return literal.replace("{", "{{").replace("}", "}}")
+
+@lru_cache(maxsize=256)
+def compile_template(body: str) -> CompiledTemplate:
+    """
+    Compiled form of a body; campaigns share it, so it's built once per distinct body per process.
+    """
+    return CompiledTemplate(body)
@@ -1,27 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends, Header
 from pydantic import BaseModel
 from typing import Optional
-from supabase import create_client, Client
-from .settings import Settings
+from supabase import Client
+from .settings import settings
 from datetime import datetime
 import os
 
-# Try to import Twilio, but don't fail if not installed (mock mode)
-try:
-    from twilio.rest import Client as TwilioClient
-    TWILIO_AVAILABLE = True
-except ImportError:
-    TWILIO_AVAILABLE = False
-
 router = APIRouter()
-settings = Settings()
 
 from .dependencies import get_current_user_gym, UserContext, log_audit_event
-
-# Supabase Client (Service Role for writing to message_sends and members)
-# We can reuse the one from dependencies or keep this one. 
-# Ideally reuse to save connections, but keeping separate for now is less risky for refactor.
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+from .ratelimit import sms_limiter, RateLimitExceeded
+from .retries import is_rate_limited
+from .providers import get_sms_provider
+from .db import get_supabase
+from .members import at_risk_cache
+from .message_templates import segments_for
 
 class SendSMSRequest(BaseModel):
     # gym_id: str  <-- Removed, derived from token
@@ -29,7 +22,11 @@ class SendSMSRequest(BaseModel):
     message_body: str
 
 @router.post("/messages/send-sms")
-async def send_sms(request: SendSMSRequest, user: UserContext = Depends(get_current_user_gym)):
+async def send_sms(
+    request: SendSMSRequest,
+    user: UserContext = Depends(get_current_user_gym),
+    supabase: Client = Depends(get_supabase),
+):
     # Gym ID is trustworthy now
     gym_id = user.gym_id
 
@@ -51,30 +48,28 @@ async def send_sms(request: SendSMSRequest, user: UserContext = Depends(get_curr
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-    # 2. Send via Twilio (or Mock)
+    # 2. Send via the shared provider client (Twilio, or the fake in dev/load tests)
+    provider = get_sms_provider()
     provider_message_id = None
     status = "queued"
     error_message = None
 
-    if TWILIO_AVAILABLE and settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
-        try:
-            client = TwilioClient(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-            message = client.messages.create(
-                body=request.message_body,
-                from_=settings.TWILIO_PHONE_NUMBER,
-                to=phone_number
-            )
-            provider_message_id = message.sid
-            status = message.status 
-        except Exception as e:
-            status = "failed"
-            error_message = str(e)
-            pass
-    else:
-        # Mock Mode
-        print(f"[MOCK SEND] To: {phone_number}, Body: {request.message_body}")
-        provider_message_id = "mock-" + datetime.now().isoformat()
-        status = "sent"
+    # Same shared buckets as the campaign worker, so direct sends count against the account limit too
+    try:
+        await sms_limiter.acquire(gym_id)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    try:
+        result = await provider.send_sms(phone_number, request.message_body)
+        provider_message_id = result["provider_message_id"]
+        status = result["status"]
+        await sms_limiter.report_async(1, rate_limited=False)
+    except Exception as e:
+        status = "failed"
+        error_message = str(e)
+        if is_rate_limited(e):
+            await sms_limiter.report_async(0, rate_limited=True)
 
     # 3. Log to message_sends
     try:
@@ -82,10 +77,11 @@ async def send_sms(request: SendSMSRequest, user: UserContext = Depends(get_curr
             "gym_id": gym_id,
             "member_id": request.member_id,
             "channel": "sms",
-            "provider": "twilio" if (TWILIO_AVAILABLE and settings.TWILIO_ACCOUNT_SID) else "mock",
+            "provider": provider.name,
             "provider_message_id": provider_message_id,
             "status": status,
             "error_message": error_message,
+            "segment_count": segments_for(request.message_body),
             "created_at": datetime.now().isoformat()
         }
         supabase.table("message_sends").insert(send_record).execute()
@@ -102,6 +98,7 @@ async def send_sms(request: SendSMSRequest, user: UserContext = Depends(get_curr
 
         # 5. Update Member last_contacted_at
         supabase.table("members").update({"last_contacted_at": datetime.now().isoformat()}).eq("member_id", request.member_id).eq("gym_id", gym_id).execute()
+        at_risk_cache.invalidate([gym_id])
 
         # 6. Audit Log
         log_audit_event(
@@ -117,6 +114,6 @@ async def send_sms(request: SendSMSRequest, user: UserContext = Depends(get_curr
          raise HTTPException(status_code=500, detail=f"Failed to record message logs: {str(e)}")
 
     if status == "failed":
-        raise HTTPException(status_code=500, detail=f"Twilio Send Failed: {error_message}")
+        raise HTTPException(status_code=500, detail=f"SMS Send Failed: {error_message}")
 
     return {"status": "success", "provider_message_id": provider_message_id}
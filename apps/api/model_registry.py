@@ -0,0 +1,138 @@
+"""
+Churn model registry: one loaded model per process, swapped atomically on change.
+
+Nothing is loaded at import. The app lifespan calls model_registry.start(), which loads and
+warms the model on a background thread, so the health check answers while it does.
+A request that arrives first loads it itself (once; concurrent callers wait on the same load).
+
+Loaded models are immutable: standardization is folded into read-only weight arrays at load,
+and a new version replaces the whole object in one reference assignment. In-flight scoring
+keeps the model it started with. The same thread polls CHURN_MODEL_PATH every
+CHURN_MODEL_RELOAD_SECONDS and swaps in a new artifact without a restart; reload() does it now.
+"""
+import json
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from .settings import settings
+
+# member_features columns, in model order (migration 003)
+BASE_FEATURES = [
+    "Gender", "Near_Location", "Partner", "Promo_friends", "Phone", "Age",
+    "Lifetime_Tenure", "Contract_period", "Month_to_end_contract", "Group_visits",
+    "Avg_class_frequency_total", "Avg_class_frequency_current_month",
+    "Avg_additional_charges_total", "Days_Since_Last_Visit",
+]
+FEATURE_COLUMNS = BASE_FEATURES + [f"Month_{i}" for i in range(1, 14)]
+
+def _frozen(values) -> np.ndarray:
+    array = np.array(values, dtype=np.float64)
+    array.setflags(write=False)
+    return array
+
+class ChurnModel:
+    def __init__(self, version: str, features: List[str], mean, scale, coef, intercept: float, baseline: bool = False):
+        if features != FEATURE_COLUMNS:
+            raise ValueError(f"Model {version} expects features {features}, not member_features' {FEATURE_COLUMNS}")
+        self.version = version
+        # Placeholder coefficients, not a trained export: churn_sync won't write its scores
+        self.baseline = baseline
+        self.features = features
+        self.mean = _frozen(mean)
+        self.scale = _frozen(scale)
+        self.coef = _frozen(coef)
+        self.intercept = float(intercept)
+        # Fold standardization into the weights: ((X - mean) / scale) @ coef == X @ w + b
+        self.weights = _frozen(self.coef / self.scale)
+        self.bias = self.intercept - float(self.mean @ self.weights)
+
+    @classmethod
+    def load(cls, path: str) -> "ChurnModel":
+        with open(path) as f:
+            artifact = json.load(f)
+        if artifact.get("kind") != "logistic_regression":
+            raise ValueError(f"Unsupported model kind: {artifact.get('kind')}")
+        return cls(artifact["version"], artifact["features"], artifact["mean"],
+                   artifact["scale"], artifact["coef"], artifact["intercept"], artifact.get("baseline", False))
+
+    def score(self, X: np.ndarray) -> np.ndarray:
+        """
+        (n, 27) feature matrix -> churn probability scores 0..100, same order.
+        """
+        logits = X @ self.weights + self.bias
+        # Clip so exp() can't overflow on garbage input
+        return 100.0 / (1.0 + np.exp(-np.clip(logits, -500, 500)))
+
+    def warm_up(self):
+        # First matmul/exp initializes BLAS and ufunc dispatch; do it before a request does
+        self.score(np.zeros((2, len(self.features))))
+
+class ModelRegistry:
+    def __init__(self, path: str, reload_interval: float):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._model: Optional[ChurnModel] = None
+        self._mtime: Optional[float] = None
+        self._load_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def current(self) -> ChurnModel:
+        model = self._model
+        if model is None:
+            model = self._load(force=False)
+        return model
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def _load(self, force: bool) -> ChurnModel:
+        with self._load_lock:
+            mtime = os.stat(self.path).st_mtime
+            if self._model is not None and not force and mtime == self._mtime:
+                return self._model
+            model = ChurnModel.load(self.path)
+            model.warm_up()
+            previous, self._model, self._mtime = self._model, model, mtime
+        if previous is None:
+            print(f"[Model Registry] Loaded churn model {model.version}")
+        elif previous.version != model.version:
+            print(f"[Model Registry] Swapped churn model {previous.version} -> {model.version}")
+        return model
+
+    def reload(self) -> ChurnModel:
+        """
+        Loads the artifact again now. A bad artifact raises and leaves the current model in place.
+        """
+        return self._load(force=True)
+
+    def start(self):
+        """
+        Loads + warms the model in the background, then watches the artifact for new versions.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-registry", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._load(force=False)
+            except Exception as e:
+                print(f"[Model Registry Error] Failed to load {self.path}: {e}")
+            if self.reload_interval <= 0 or self._stop.wait(self.reload_interval):
+                return
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+model_registry = ModelRegistry(settings.CHURN_MODEL_PATH, settings.CHURN_MODEL_RELOAD_SECONDS)
@@ -0,0 +1,54 @@
+"""
+Partition maintenance for the monthly-partitioned event tables (migration 030):
+member_score_history, message_sends, provider_webhook_events, engagement_events, audit_logs.
+
+maintain_partitions creates each table's partitions PARTITION_MONTHS_AHEAD months ahead (rows
+never wait on a missing month; anything outside every range lands in a default partition and
+is moved once its month exists), then expires months past the table's retention in
+partition_policies: dropped, or detached into the archive schema where archive = true.
+Retention is changed in the table, e.g.
+    update partition_policies set retention_months = 36 where table_name = 'audit_logs';
+
+Usage:
+    python -m apps.api.partitions [--months-ahead 3]
+The n8n partition maintenance workflow triggers POST /api/maintenance/partitions daily.
+"""
+import argparse
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+
+from .db import get_supabase
+from .scoring import require_api_key
+from .settings import settings
+
+def run_partition_maintenance(months_ahead: Optional[int] = None) -> dict:
+    months_ahead = settings.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    start = time.perf_counter()
+    res = get_supabase().rpc("maintain_partitions", {"p_months_ahead": months_ahead}).execute()
+    tables = res.data or []
+    elapsed = time.perf_counter() - start
+    for t in tables:
+        if t["created_count"] or t["archived_count"] or t["dropped_count"]:
+            print(f"[Partitions] {t['table_name']}: {t['created_count']} created, "
+                  f"{t['archived_count']} archived, {t['dropped_count']} dropped")
+    print(f"[Partitions] Maintained {len(tables)} tables in {elapsed:.1f}s")
+    return {"tables": tables, "seconds": round(elapsed, 3)}
+
+router = APIRouter(dependencies=[Depends(require_api_key)])
+
+@router.post("/maintenance/partitions")
+def trigger_partition_maintenance(months_ahead: Optional[int] = None):
+    # Sync endpoint: DDL on empty/expired partitions only, runs in the threadpool
+    return run_partition_maintenance(months_ahead)
+
+def main():
+    parser = argparse.ArgumentParser(description="GymGuard partition maintenance")
+    parser.add_argument("--months-ahead", type=int, default=None,
+                        help=f"Months of partitions to create ahead (default: {settings.PARTITION_MONTHS_AHEAD})")
+    args = parser.parse_args()
+    run_partition_maintenance(args.months_ahead)
+
+if __name__ == "__main__":
+    main()
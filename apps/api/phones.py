@@ -0,0 +1,33 @@
+"""
+Phone number normalization (E.164).
+
+normalize_e164 mirrors private.normalize_phone_e164 (migration 022), which fills
+members.phone_e164 on every insert/update; opt-outs match on that indexed column.
+"""
+import re
+from typing import Optional
+
+_NON_DIGITS = re.compile(r"\D")
+
+def normalize_e164(phone: Optional[str], default_country: str = "1") -> Optional[str]:
+    """
+    '(555) 010-1234' -> '+15550101234'. None when the number can't be made unambiguous.
+    Bare 10-digit numbers are assumed to be in the default country (NANP).
+    """
+    raw = (phone or "").strip()
+    digits = _NON_DIGITS.sub("", raw)
+    if not digits:
+        return None
+
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif len(digits) == 10:
+        digits = default_country + digits
+    elif not (len(digits) == 11 and digits.startswith(default_country)):
+        return None
+
+    if not 8 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return "+" + digits
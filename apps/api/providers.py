@@ -0,0 +1,244 @@
+"""
+Provider clients for outbound SMS and email.
+
+One long-lived client per provider per process (get_sms_provider / get_email_provider),
+each holding a pooled httpx.AsyncClient, so sends reuse connections and never block
+the event loop. A semaphore caps in-flight requests per process.
+
+Failures raise retries.ProviderError with the provider's HTTP status, so the retry
+policy and the rate limiter can classify them without parsing text.
+
+PROVIDER=fake (or missing credentials) swaps in FakeSmsProvider / FakeEmailProvider:
+no network, with configurable latency and error rate for load testing.
+"""
+import asyncio
+import random
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+
+from .retries import ProviderError
+from .settings import settings
+
+class SmsProvider:
+    name = "sms"
+
+    def __init__(self, max_concurrency: int):
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def send_sms(self, to: str, body: str) -> dict:
+        """
+        Sends one SMS. Returns {"provider_message_id", "status"}; raises ProviderError.
+        """
+        async with self._slots:
+            return await self._send_sms(to, body)
+
+    async def _send_sms(self, to: str, body: str) -> dict:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+class EmailProvider:
+    name = "email"
+    # Recipients per send_bulk request
+    max_batch_size = 1000
+
+    def __init__(self, max_concurrency: int):
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def send_email(self, to: str, subject: str, body: str, custom_args: Optional[Dict[str, str]] = None) -> dict:
+        """
+        Sends one email. custom_args come back on the provider's event webhooks.
+        Returns {"provider_message_id", "status"}; raises ProviderError.
+        """
+        async with self._slots:
+            return await self._send_email(to, subject, body, custom_args or {})
+
+    async def send_bulk(self, subject: str, body: str, recipients: List[dict]) -> dict:
+        """
+        Sends one email per recipient in a single request. subject/body contain substitution tags;
+        each recipient is {"to", "substitutions": {tag: value}, "custom_args"}.
+        Returns {"provider_message_id", "status"} for the whole request; raises ProviderError.
+        """
+        if len(recipients) > self.max_batch_size:
+            raise ValueError(f"{len(recipients)} recipients in one request (max {self.max_batch_size})")
+        async with self._slots:
+            return await self._send_bulk(subject, body, recipients)
+
+    async def _send_email(self, to: str, subject: str, body: str, custom_args: Dict[str, str]) -> dict:
+        raise NotImplementedError
+
+    async def _send_bulk(self, subject: str, body: str, recipients: List[dict]) -> dict:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+def _http_client(**kwargs) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=settings.PROVIDER_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=settings.PROVIDER_MAX_CONCURRENCY,
+            max_keepalive_connections=settings.PROVIDER_MAX_CONCURRENCY,
+        ),
+        **kwargs,
+    )
+
+def _raise_for_status(response: httpx.Response, provider: str):
+    if response.status_code >= 400:
+        raise ProviderError(f"{provider} HTTP {response.status_code}: {response.text[:200]}", status_code=response.status_code)
+
+class TwilioSmsProvider(SmsProvider):
+    name = "twilio"
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, max_concurrency: int):
+        super().__init__(max_concurrency)
+        self.from_number = from_number
+        self.client = _http_client(
+            base_url=f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}",
+            auth=(account_sid, auth_token),
+        )
+
+    async def _send_sms(self, to: str, body: str) -> dict:
+        try:
+            response = await self.client.post("/Messages.json", data={"To": to, "From": self.from_number, "Body": body})
+        except httpx.TimeoutException as e:
+            raise ProviderError(f"Twilio request timed out: {e}", status_code=504)
+        except httpx.TransportError as e:
+            raise ProviderError(f"Twilio service unavailable: {e}", status_code=503)
+        _raise_for_status(response, "Twilio")
+        message = response.json()
+        return {"provider_message_id": message["sid"], "status": message.get("status") or "queued"}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class SendGridEmailProvider(EmailProvider):
+    name = "sendgrid"
+
+    def __init__(self, api_key: str, from_email: str, max_concurrency: int):
+        super().__init__(max_concurrency)
+        self.from_email = from_email
+        self.client = _http_client(
+            base_url="https://api.sendgrid.com/v3",
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+
+    async def _send_email(self, to: str, subject: str, body: str, custom_args: Dict[str, str]) -> dict:
+        return await self._post(subject, body, [{"to": [{"email": to}], "custom_args": custom_args}])
+
+    async def _send_bulk(self, subject: str, body: str, recipients: List[dict]) -> dict:
+        # One personalization per recipient; SendGrid swaps its substitutions into the shared subject/body
+        return await self._post(subject, body, [
+            {"to": [{"email": r["to"]}], "substitutions": r["substitutions"], "custom_args": r["custom_args"]}
+            if r.get("substitutions") else {"to": [{"email": r["to"]}], "custom_args": r["custom_args"]}
+            for r in recipients
+        ])
+
+    async def _post(self, subject: str, body: str, personalizations: List[dict]) -> dict:
+        payload = {
+            "personalizations": personalizations,
+            "from": {"email": self.from_email},
+            "subject": subject,
+            "content": [{"type": "text/plain", "value": body}],
+        }
+        try:
+            response = await self.client.post("/mail/send", json=payload)
+        except httpx.TimeoutException as e:
+            raise ProviderError(f"SendGrid request timed out: {e}", status_code=504)
+        except httpx.TransportError as e:
+            raise ProviderError(f"SendGrid service unavailable: {e}", status_code=503)
+        _raise_for_status(response, "SendGrid")
+        return {"provider_message_id": response.headers.get("X-Message-Id"), "status": "queued"}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class _FakeBehaviour:
+    """
+    Latency + error injection shared by the fake providers.
+    Errors are 429s (what we hit under load), so retries and throttling get exercised.
+    """
+    def __init__(self, latency_ms: float, error_rate: float):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+
+    async def call(self) -> dict:
+        if self.latency_ms:
+            # +/-50% jitter so concurrent sends don't finish in lockstep
+            await asyncio.sleep(self.latency_ms / 1000 * random.uniform(0.5, 1.5))
+        if random.random() < self.error_rate:
+            raise ProviderError("Simulated Provider Rate Limit", status_code=429)
+        return {"provider_message_id": f"mock-{uuid.uuid4()}", "status": "sent"}
+
+class FakeSmsProvider(SmsProvider):
+    name = "mock"
+
+    def __init__(self, latency_ms: float = 0, error_rate: float = 0.0, max_concurrency: int = 100):
+        super().__init__(max_concurrency)
+        self.behaviour = _FakeBehaviour(latency_ms, error_rate)
+
+    async def _send_sms(self, to: str, body: str) -> dict:
+        return await self.behaviour.call()
+
+class FakeEmailProvider(EmailProvider):
+    name = "mock"
+
+    def __init__(self, latency_ms: float = 0, error_rate: float = 0.0, max_concurrency: int = 100):
+        super().__init__(max_concurrency)
+        self.behaviour = _FakeBehaviour(latency_ms, error_rate)
+
+    async def _send_email(self, to: str, subject: str, body: str, custom_args: Dict[str, str]) -> dict:
+        return await self.behaviour.call()
+
+    async def _send_bulk(self, subject: str, body: str, recipients: List[dict]) -> dict:
+        return await self.behaviour.call()
+
+# ------------------------------------------------------------------
+# Per-process instances
+# Created lazily so each worker process (after fork) builds its own connection pool.
+# ------------------------------------------------------------------
+_sms_provider: Optional[SmsProvider] = None
+_email_provider: Optional[EmailProvider] = None
+
+def _fake_kwargs() -> dict:
+    return {
+        "latency_ms": settings.FAKE_PROVIDER_LATENCY_MS,
+        "error_rate": settings.FAKE_PROVIDER_ERROR_RATE,
+        "max_concurrency": settings.PROVIDER_MAX_CONCURRENCY,
+    }
+
+def get_sms_provider() -> SmsProvider:
+    global _sms_provider
+    if _sms_provider is None:
+        if settings.PROVIDER != "fake" and settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
+            _sms_provider = TwilioSmsProvider(
+                settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN,
+                settings.TWILIO_PHONE_NUMBER, settings.PROVIDER_MAX_CONCURRENCY,
+            )
+        else:
+            _sms_provider = FakeSmsProvider(**_fake_kwargs())
+    return _sms_provider
+
+def get_email_provider() -> EmailProvider:
+    global _email_provider
+    if _email_provider is None:
+        if settings.PROVIDER != "fake" and settings.SENDGRID_API_KEY:
+            _email_provider = SendGridEmailProvider(
+                settings.SENDGRID_API_KEY, settings.EMAIL_FROM, settings.PROVIDER_MAX_CONCURRENCY,
+            )
+        else:
+            _email_provider = FakeEmailProvider(**_fake_kwargs())
+    return _email_provider
+
+async def close_providers():
+    """
+    Closes the pooled connections. Call on process/app shutdown.
+    """
+    global _sms_provider, _email_provider
+    for provider in (_sms_provider, _email_provider):
+        if provider is not None:
+            await provider.aclose()
+    _sms_provider = _email_provider = None
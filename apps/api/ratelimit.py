@@ -0,0 +1,274 @@
+"""
+Token-bucket throttling for SMS sends.
+
+Two levels of buckets:
+  - 'sms:global'     sized to the provider account (SMS_GLOBAL_RATE_PER_SEC)
+  - 'sms:gym:<id>'   one per gym (SMS_PER_GYM_RATE_PER_SEC, default half the account),
+                     so a single gym can never take the whole account
+
+With the default 'postgres' backend the bucket state lives in public.send_rate_buckets
+(migration 019): the API process, every worker process and every container draw from
+the same rows, so together they stay under the account limit. The 'local' backend keeps
+buckets in memory and is only correct for a single process (dev, tests).
+
+Tokens are only ever taken without waiting. The campaign worker takes them *before*
+claiming recipients and claims no more than it was granted, so a send never sits
+waiting for tokens while holding a lease.
+
+The global rate adapts (AIMD): a provider 429 halves it for everyone, and while sends keep
+succeeding it climbs back toward the configured ceiling at RECOVERY_PER_SECOND, however many
+messages go out meanwhile. 429s are reported right away; successes are summed per process
+and reported at most once per REPORT_INTERVAL, so sending doesn't add a write per message.
+
+The Postgres store makes blocking PostgREST calls. The async single-send path (acquire,
+report_async) runs them in a thread so the API's event loop isn't held up.
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+from .settings import settings
+
+# Floor for the adaptive rate, as a fraction of the configured ceiling
+MIN_RATE_FACTOR = 0.05
+# Additive increase per second of successful sending, as a fraction of the ceiling
+# (a halving from full speed is undone in 25s)
+RECOVERY_PER_SECOND = 0.02
+# Seconds between success reports from one process
+REPORT_INTERVAL = 1.0
+
+GLOBAL_KEY = "sms:global"
+
+def gym_key(gym_id: str) -> str:
+    return f"sms:gym:{gym_id}"
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, requested: int) -> Tuple[int, float]:
+        """
+        Takes up to `requested` whole tokens. Returns (granted, seconds until the next token).
+        """
+        self._refill()
+        # Epsilon absorbs float drift from refills (0.1 * 10 can land on 0.99999...)
+        granted = max(0, min(requested, int(self.tokens + 1e-9)))
+        self.tokens -= granted
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return granted, wait
+
+    def give_back(self, count: int):
+        self._refill()
+        self.tokens = min(self.burst, self.tokens + count)
+
+    def set_rate(self, rate: float):
+        # Settle what was earned at the old rate first
+        self._refill()
+        self.rate = rate
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+class LocalBucketStore:
+    """
+    In-memory buckets. Same contract as the SQL functions in migrations 019 and 036.
+    """
+    blocking = False
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.factors: Dict[str, float] = {}
+        self.adjusted_at: Dict[str, float] = {}
+
+    def _bucket(self, key: str, rate: float, burst: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate, burst, self.clock)
+            self.factors[key] = 1.0
+            self.adjusted_at[key] = self.clock()
+        return bucket
+
+    def take(self, key: str, rate: float, burst: float, requested: int) -> Tuple[int, float]:
+        return self._bucket(key, rate, burst).take(requested)
+
+    def give_back(self, key: str, rate: float, burst: float, count: int):
+        self._bucket(key, rate, burst).give_back(count)
+
+    def adjust(self, key: str, rate: float, burst: float, rate_limited: bool) -> float:
+        bucket = self._bucket(key, rate, burst)
+        factor = self.factors[key]
+        now = self.clock()
+        if rate_limited:
+            factor = max(MIN_RATE_FACTOR, factor / 2)
+            bucket.set_rate(rate * factor)
+            bucket.drain()
+        else:
+            factor = min(1.0, factor + (now - self.adjusted_at[key]) * RECOVERY_PER_SECOND)
+            bucket.set_rate(rate * factor)
+        self.factors[key] = factor
+        self.adjusted_at[key] = now
+        return factor
+
+class PostgresBucketStore:
+    """
+    Buckets shared by every process through public.send_rate_buckets (migration 019).
+    """
+    blocking = True
+
+    def __init__(self, client=None):
+        # None = the process-wide client from db.py, resolved on first use
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from .db import get_supabase
+            self._client = get_supabase()
+        return self._client
+
+    def take(self, key: str, rate: float, burst: float, requested: int) -> Tuple[int, float]:
+        res = self.client.rpc("take_send_tokens", {
+            "p_key": key, "p_rate": rate, "p_burst": burst, "p_requested": requested,
+        }).execute()
+        row = res.data[0] if isinstance(res.data, list) else res.data
+        return int(row["granted"]), float(row["wait_seconds"])
+
+    def give_back(self, key: str, rate: float, burst: float, count: int):
+        self.client.rpc("return_send_tokens", {
+            "p_key": key, "p_rate": rate, "p_burst": burst, "p_count": count,
+        }).execute()
+
+    def adjust(self, key: str, rate: float, burst: float, rate_limited: bool) -> float:
+        res = self.client.rpc("adjust_send_rate", {
+            "p_key": key, "p_rate": rate, "p_burst": burst, "p_rate_limited": rate_limited,
+            "p_min_factor": MIN_RATE_FACTOR, "p_recovery_per_second": RECOVERY_PER_SECOND,
+        }).execute()
+        return float(res.data)
+
+class RateLimitExceeded(Exception):
+    pass
+
+class SendRateLimiter:
+    def __init__(self, store, global_rate: float, global_burst: float, per_gym_rate: float,
+                 sleep: Callable[[float], "asyncio.Future"] = asyncio.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.store = store
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.per_gym_rate = per_gym_rate
+        # A gym can burst for one second of its own rate
+        self.per_gym_burst = max(1.0, per_gym_rate)
+        self.sleep = sleep
+        self.clock = clock
+        # Successes not yet reported to the store
+        self._unreported = 0
+        self._reported_at = clock()
+        self._report_lock = threading.Lock()
+
+    async def _call(self, fn, *args):
+        # Store calls that go over the network leave the event loop
+        if self.store.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    # --- batch API (campaign worker) ---
+
+    def reserve(self, requested: int) -> Tuple[int, float]:
+        """
+        Takes up to `requested` global tokens without waiting.
+        Returns (granted, seconds until the next token).
+        """
+        return self.store.take(GLOBAL_KEY, self.global_rate, self.global_burst, requested)
+
+    def release(self, count: int):
+        """
+        Returns unused global tokens.
+        """
+        if count > 0:
+            self.store.give_back(GLOBAL_KEY, self.global_rate, self.global_burst, count)
+
+    def admit(self, rows: Iterable[dict]) -> Tuple[List[dict], List[dict]]:
+        """
+        Splits already-reserved rows into (admitted, deferred) using each gym's bucket.
+        Deferred rows should be handed back to the queue and their global tokens released.
+        """
+        by_gym: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_gym.setdefault(row["gym_id"], []).append(row)
+
+        admitted, deferred = [], []
+        for gym_id, gym_rows in by_gym.items():
+            granted, _ = self.store.take(gym_key(gym_id), self.per_gym_rate, self.per_gym_burst, len(gym_rows))
+            admitted.extend(gym_rows[:granted])
+            deferred.extend(gym_rows[granted:])
+        return admitted, deferred
+
+    def report(self, successes: int, rate_limited: bool):
+        """
+        Feeds send outcomes back into the shared adaptive rate. A 429 is applied now;
+        successes only reach the store once per REPORT_INTERVAL.
+        """
+        with self._report_lock:
+            self._unreported += successes
+            now = self.clock()
+            if not rate_limited and not (self._unreported and now - self._reported_at >= REPORT_INTERVAL):
+                return
+            self._unreported = 0
+            self._reported_at = now
+
+        factor = self.store.adjust(GLOBAL_KEY, self.global_rate, self.global_burst, rate_limited)
+        if rate_limited:
+            print(f"[Rate Limit] Provider returned 429, slowing to {self.global_rate * factor:.2f} msg/s")
+
+    async def report_async(self, successes: int, rate_limited: bool):
+        await self._call(self.report, successes, rate_limited)
+
+    # --- single-send API (messaging.send_sms) ---
+
+    async def acquire(self, gym_id: str, timeout: float = 10.0):
+        """
+        Waits for one gym token and one global token. Raises RateLimitExceeded after `timeout`.
+        """
+        deadline = self.clock() + timeout
+        taken = []
+        for key, rate, burst in (
+            (gym_key(gym_id), self.per_gym_rate, self.per_gym_burst),
+            (GLOBAL_KEY, self.global_rate, self.global_burst),
+        ):
+            while True:
+                granted, wait = await self._call(self.store.take, key, rate, burst, 1)
+                if granted:
+                    taken.append((key, rate, burst))
+                    break
+                if self.clock() + wait > deadline:
+                    # Don't burn the gym's token on a send that never happens
+                    for t_key, t_rate, t_burst in taken:
+                        await self._call(self.store.give_back, t_key, t_rate, t_burst, 1)
+                    raise RateLimitExceeded(f"No send capacity on {key} within {timeout:.0f}s")
+                await self.sleep(wait)
+
+def _build_limiter() -> SendRateLimiter:
+    if settings.SMS_RATE_LIMIT_BACKEND == "local":
+        store = LocalBucketStore()
+    else:
+        store = PostgresBucketStore()
+    return SendRateLimiter(
+        store,
+        settings.SMS_GLOBAL_RATE_PER_SEC,
+        settings.SMS_GLOBAL_BURST,
+        settings.SMS_PER_GYM_RATE_PER_SEC,
+    )
+
+# Process-wide limiter shared by every send path
+sms_limiter = _build_limiter()
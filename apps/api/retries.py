@@ -0,0 +1,79 @@
+"""
+Retry policy for provider sends.
+
+Transient failures (rate limits, 5xx, timeouts) are rescheduled on message_sends
+via next_retry_at with exponential backoff + jitter; anything else, or a send that
+has used up SEND_MAX_ATTEMPTS, gives up and goes to dead_letter_messages.
+"""
+import random
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+from .settings import settings
+
+class ProviderError(Exception):
+    """
+    Send failure that carries the provider's HTTP status, so the policy below
+    never has to guess from the message text.
+    """
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+# Fallback for errors without a status: status codes only count when labelled as such
+# ("HTTP 503", "status: 429"), so digits inside phone numbers are never mistaken for one.
+_STATUS_IN_TEXT = re.compile(r"\b(?:http|status|status code|error code)\s*:?\s*(\d{3})(?!\d)")
+_RATE_LIMIT_PHRASES = ("rate limit", "too many requests")
+_TRANSIENT_PHRASES = _RATE_LIMIT_PHRASES + ("timeout", "timed out", "temporarily unavailable", "service unavailable")
+
+def _status(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status
+    match = _STATUS_IN_TEXT.search(str(error).lower())
+    return int(match.group(1)) if match else None
+
+def is_retryable(error: Exception) -> bool:
+    status = _status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    message = str(error).lower()
+    return any(phrase in message for phrase in _TRANSIENT_PHRASES)
+
+def is_rate_limited(error: Exception) -> bool:
+    status = _status(error)
+    if status is not None:
+        return status == 429
+    message = str(error).lower()
+    return any(phrase in message for phrase in _RATE_LIMIT_PHRASES)
+
+def backoff_seconds(attempt: int, base: Optional[float] = None, cap: Optional[float] = None) -> float:
+    """
+    Exponential backoff with equal jitter: half of the window is fixed, half random,
+    so retries from one burst spread out but never fire immediately.
+    attempt is the number of attempts already made (1 after the first failure).
+    """
+    base = settings.RETRY_BASE_DELAY_SECONDS if base is None else base
+    cap = settings.RETRY_MAX_DELAY_SECONDS if cap is None else cap
+    window = min(cap, base * (2 ** max(attempt - 1, 0)))
+    return window / 2 + random.uniform(0, window / 2)
+
+def failure_update(attempt_count: int, error: Exception, now: Optional[datetime] = None) -> dict:
+    """
+    message_sends fields for a failed attempt. attempt_count includes the attempt that just failed.
+    final_status stays 'pending' while a retry is scheduled, otherwise 'gave_up'.
+    """
+    now = now or datetime.now()
+    fields = {
+        "status": "failed",
+        "attempt_count": attempt_count,
+        "last_error": str(error),
+        "updated_at": now.isoformat(),
+    }
+    if is_retryable(error) and attempt_count < settings.SEND_MAX_ATTEMPTS:
+        fields["final_status"] = "pending"
+        fields["next_retry_at"] = (now + timedelta(seconds=backoff_seconds(attempt_count))).isoformat()
+    else:
+        fields["final_status"] = "gave_up"
+        fields["next_retry_at"] = None
+    return fields
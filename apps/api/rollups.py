@@ -0,0 +1,50 @@
+"""
+Daily metrics rollup for every gym at once.
+
+rollup_daily_metrics (migration 026) makes one grouped pass over each source table
+(members, message_sends, engagement_events, member_features) and bulk-upserts
+gym_daily_metrics, model_monitor_score_stats (including p90_score) and
+model_monitor_feature_stats for all 27 model inputs. Re-running a day overwrites it.
+
+Usage:
+    python -m apps.api.rollups [--date 2026-01-29]
+The n8n daily metrics workflow triggers POST /api/rollups/daily on its schedule.
+"""
+import argparse
+import time
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+
+from .db import get_supabase
+from .scoring import require_api_key
+
+def run_daily_rollup(metric_date: Optional[date] = None) -> dict:
+    """
+    Rolls up one day (default: yesterday, in the database's timezone).
+    """
+    params = {"p_metric_date": metric_date.isoformat()} if metric_date else {}
+    start = time.perf_counter()
+    res = get_supabase().rpc("rollup_daily_metrics", params).execute()
+    summary = (res.data or [{}])[0]
+    elapsed = time.perf_counter() - start
+    print(f"[Daily Rollup] {metric_date or 'yesterday'}: {summary.get('gym_count', 0)} gyms, "
+          f"{summary.get('feature_row_count', 0)} feature rows in {elapsed:.1f}s")
+    return {**summary, "metric_date": metric_date.isoformat() if metric_date else None, "seconds": round(elapsed, 3)}
+
+router = APIRouter(dependencies=[Depends(require_api_key)])
+
+@router.post("/rollups/daily")
+def trigger_daily_rollup(metric_date: Optional[date] = None):
+    # Sync endpoint: runs in the threadpool; the rollup is a single statement-per-table RPC
+    return run_daily_rollup(metric_date)
+
+def main():
+    parser = argparse.ArgumentParser(description="GymGuard daily metrics rollup")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="Day to roll up (default: yesterday)")
+    args = parser.parse_args()
+    run_daily_rollup(args.date)
+
+if __name__ == "__main__":
+    main()
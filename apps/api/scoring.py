@@ -0,0 +1,140 @@
+"""
+Churn scoring, in-process and vectorized.
+
+The model is a standardized logistic regression loaded from a JSON artifact
+(CHURN_MODEL_PATH, default models/churn_model.json) by model_registry.py. Scoring a batch
+is one matrix product, so 100k rows cost about the same as a handful of HTTP calls did.
+
+Library entry point: score_rows(rows) / score_matrix(X).
+HTTP: POST /api/score (one row, for the existing n8n workflow) and POST /api/score/batch.
+Both require X-API-KEY (machine-to-machine), checked before the body is validated.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel
+
+from .model_registry import FEATURE_COLUMNS, ChurnModel, model_registry
+from .settings import settings
+
+HIGH_RISK_THRESHOLD = 70.0
+
+def get_model() -> ChurnModel:
+    return model_registry.current()
+
+class FeatureError(ValueError):
+    pass
+
+def to_matrix(rows: Sequence[Dict]) -> np.ndarray:
+    """
+    member_features rows (dicts) -> float matrix in model column order.
+    Extra keys (gym_id, member_id, ...) are ignored.
+    """
+    try:
+        return np.array([[row[c] for c in FEATURE_COLUMNS] for row in rows], dtype=np.float64).reshape(len(rows), len(FEATURE_COLUMNS))
+    except KeyError as e:
+        missing = e.args[0]
+        index = next(i for i, row in enumerate(rows) if missing not in row)
+        raise FeatureError(f"Row {index} is missing feature {missing!r}")
+    except (TypeError, ValueError):
+        for i, row in enumerate(rows):
+            for c in FEATURE_COLUMNS:
+                try:
+                    float(row[c])
+                except (TypeError, ValueError):
+                    raise FeatureError(f"Row {i} has a non-numeric {c!r}: {row[c]!r}")
+        raise
+
+def score_matrix(X: np.ndarray, model: Optional[ChurnModel] = None) -> np.ndarray:
+    return (model or get_model()).score(X)
+
+def score_rows(rows: Sequence[Dict], model: Optional[ChurnModel] = None) -> np.ndarray:
+    """
+    Library entry point: scores member_features rows in one pass. Raises FeatureError.
+    Pass model to pin a version across several calls (a reload can swap it in between).
+    """
+    if not rows:
+        return np.empty(0)
+    return score_matrix(to_matrix(rows), model)
+
+# ------------------------------------------------------------------
+# Endpoints
+# ------------------------------------------------------------------
+
+def require_api_key(x_api_key: Optional[str] = Header(None)):
+    if x_api_key != settings.X_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+router = APIRouter(dependencies=[Depends(require_api_key)])
+
+class MemberFeatures(BaseModel):
+    Gender: int
+    Near_Location: int
+    Partner: int
+    Promo_friends: int
+    Phone: int
+    Age: int
+    Lifetime_Tenure: int
+    Contract_period: int
+    Month_to_end_contract: int
+    Group_visits: int
+    Avg_class_frequency_total: float
+    Avg_class_frequency_current_month: float
+    Avg_additional_charges_total: float
+    Days_Since_Last_Visit: int
+    Month_1: int
+    Month_2: int
+    Month_3: int
+    Month_4: int
+    Month_5: int
+    Month_6: int
+    Month_7: int
+    Month_8: int
+    Month_9: int
+    Month_10: int
+    Month_11: int
+    Month_12: int
+    Month_13: int
+
+class BatchScoreRequest(BaseModel):
+    # Plain dicts: validating 100k rows field-by-field would cost more than scoring them
+    rows: List[Dict]
+
+@router.post("/score")
+async def score(features: MemberFeatures):
+    model = get_model()
+    value = float(score_rows([features.model_dump()], model)[0])
+    return {
+        "churn_probability_score": value,
+        "is_high_risk": value >= HIGH_RISK_THRESHOLD,
+        "model_version": model.version,
+    }
+
+@router.post("/score/batch")
+def score_batch(request: BatchScoreRequest):
+    """
+    Scores are returned in the same order as the rows.
+    Sync endpoint: FastAPI runs it in the threadpool, so a big batch doesn't block the event loop.
+    """
+    model = get_model()
+    try:
+        scores = score_rows(request.rows, model)
+    except FeatureError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "scores": scores.tolist(),
+        "model_version": model.version,
+        "count": len(request.rows),
+    }
+
+@router.post("/score/reload")
+def reload_model():
+    """
+    Swaps in the artifact at CHURN_MODEL_PATH now, without waiting for the file watcher.
+    """
+    try:
+        model = model_registry.reload()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model reload failed, still serving {get_model().version}: {e}")
+    return {"status": "ok", "model_version": model.version}
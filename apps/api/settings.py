@@ -11,11 +11,106 @@ class Settings:
         self.CORS_ORIGINS = self._parse_cors(os.getenv("CORS_ORIGINS", ""))
         self.SUPABASE_URL = os.getenv("SUPABASE_URL")
         self.SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+        # Shared data access (see db.py): one keep-alive pool per process
+        self.SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+        self.SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+        self.SUPABASE_KEEPALIVE_SECONDS = float(os.getenv("SUPABASE_KEEPALIVE_SECONDS", "60"))
+        self.SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "30"))
+        # Optional direct Postgres pool for bulk paths (asyncpg)
+        self.DATABASE_URL = os.getenv("DATABASE_URL")
+        self.PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+        self.PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+
+        # Auth (see auth.py). Either the project's JWT secret (HS256) or JWKS enables local
+        # token verification; with neither, every request asks Supabase Auth.
+        self.SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+        self.SUPABASE_JWKS_ENABLED = os.getenv("SUPABASE_JWKS_ENABLED", "false").lower() == "true"
+        self.JWT_LEEWAY_SECONDS = float(os.getenv("JWT_LEEWAY_SECONDS", "5"))
+        self.PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+        self.PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
         
         # Twilio
         self.TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
         self.TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
         self.TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+
+        # Email (SendGrid)
+        self.SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
+        self.EMAIL_FROM = os.getenv("EMAIL_FROM")
+
+        # Provider clients (see providers.py)
+        # PROVIDER=fake never calls out; the fake's latency/error rate are for load tests.
+        self.PROVIDER = os.getenv("PROVIDER", "live")  # 'live' | 'fake'
+        self.PROVIDER_MAX_CONCURRENCY = int(os.getenv("PROVIDER_MAX_CONCURRENCY", "20"))
+        self.PROVIDER_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_TIMEOUT_SECONDS", "10"))
+        self.FAKE_PROVIDER_LATENCY_MS = float(os.getenv("FAKE_PROVIDER_LATENCY_MS", "0"))
+        self.FAKE_PROVIDER_ERROR_RATE = float(os.getenv("FAKE_PROVIDER_ERROR_RATE", "0"))
+
+        # SMS throughput (see ratelimit.py)
+        # Global = the provider account ceiling. With the 'postgres' backend every process and container
+        # shares one bucket, so this is the account limit itself, not a per-process share.
+        # Per-gym defaults to half the account so one gym can't take all of it; claims are also
+        # round-robin across gyms (migration 019), so smaller gyms keep moving during a big campaign.
+        self.SMS_RATE_LIMIT_BACKEND = os.getenv("SMS_RATE_LIMIT_BACKEND", "postgres")  # 'postgres' | 'local' (single process only)
+        self.SMS_GLOBAL_RATE_PER_SEC = float(os.getenv("SMS_GLOBAL_RATE_PER_SEC", "10"))
+        self.SMS_GLOBAL_BURST = float(os.getenv("SMS_GLOBAL_BURST", "0")) or self.SMS_GLOBAL_RATE_PER_SEC
+        self.SMS_PER_GYM_RATE_PER_SEC = float(os.getenv("SMS_PER_GYM_RATE_PER_SEC", "0")) or self.SMS_GLOBAL_RATE_PER_SEC * 0.5
+        # Per SMS segment, for campaign estimates only (see campaigns.py)
+        self.SMS_SEGMENT_PRICE_USD = float(os.getenv("SMS_SEGMENT_PRICE_USD", "0.0083"))
+
+        # Audit log buffering (see audit.py)
+        self.AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+        self.AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+        self.AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1.0"))
+
+        # Webhook ingestion buffering (see webhook_ingest.py)
+        self.WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "20000"))
+        self.WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "500"))
+        self.WEBHOOK_FLUSH_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_FLUSH_INTERVAL_SECONDS", "1.0"))
+
+        # Churn scoring (see scoring.py)
+        self.CHURN_MODEL_PATH = os.getenv("CHURN_MODEL_PATH", os.path.join(os.path.dirname(__file__), "models", "churn_model.json"))
+        # Poll the artifact for a new version this often (0 = load once, reload only via POST /api/score/reload)
+        self.CHURN_MODEL_RELOAD_SECONDS = float(os.getenv("CHURN_MODEL_RELOAD_SECONDS", "60"))
+        self.CHURN_SYNC_CHUNK_SIZE = int(os.getenv("CHURN_SYNC_CHUNK_SIZE", "2000"))
+        # Score points (0..100): smaller moves aren't written to members or member_score_history
+        self.CHURN_SCORE_MIN_CHANGE = float(os.getenv("CHURN_SCORE_MIN_CHANGE", "0.5"))
+
+        # Feature drift monitor (see drift.py)
+        self.DRIFT_CHUNK_SIZE = int(os.getenv("DRIFT_CHUNK_SIZE", "5000"))
+        self.DRIFT_SKETCH_SIZE = int(os.getenv("DRIFT_SKETCH_SIZE", "2048"))  # rows kept per gym for quantiles/KS
+        self.DRIFT_MIN_MEMBERS = int(os.getenv("DRIFT_MIN_MEMBERS", "100"))  # smaller gyms report stats but never warn
+        self.DRIFT_PSI_WARN = float(os.getenv("DRIFT_PSI_WARN", "0.1"))
+        self.DRIFT_PSI_ERROR = float(os.getenv("DRIFT_PSI_ERROR", "0.25"))
+        self.DRIFT_KS_WARN = float(os.getenv("DRIFT_KS_WARN", "0.1"))
+        self.DRIFT_KS_ERROR = float(os.getenv("DRIFT_KS_ERROR", "0.2"))
+
+        # Event table partitions (see partitions.py); retention lives in the partition_policies table
+        self.PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+        # CSV member import (see imports.py)
+        self.IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+        self.IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(512 * 1024 * 1024)))
+
+        # Home screen at-risk list (see members.py)
+        self.AT_RISK_PAGE_SIZE = int(os.getenv("AT_RISK_PAGE_SIZE", "50"))
+        self.AT_RISK_CONTACT_COOLDOWN_HOURS = int(os.getenv("AT_RISK_CONTACT_COOLDOWN_HOURS", "24"))
+        # First page per gym; sends, the churn sync and imports drop a gym's entry in this process
+        self.AT_RISK_CACHE_SIZE = int(os.getenv("AT_RISK_CACHE_SIZE", "1000"))
+        self.AT_RISK_CACHE_TTL_SECONDS = float(os.getenv("AT_RISK_CACHE_TTL_SECONDS", "30"))
+
+        # Live campaign progress stream (see campaign_progress.py)
+        # LISTEN needs a direct or session-mode URL (transaction-mode PgBouncer drops notifications);
+        # without one, each watched campaign's row is polled once per process instead
+        self.CAMPAIGN_PROGRESS_LISTEN_URL = os.getenv("CAMPAIGN_PROGRESS_LISTEN_URL")
+        self.CAMPAIGN_PROGRESS_POLL_SECONDS = float(os.getenv("CAMPAIGN_PROGRESS_POLL_SECONDS", "2"))
+        self.CAMPAIGN_PROGRESS_KEEPALIVE_SECONDS = float(os.getenv("CAMPAIGN_PROGRESS_KEEPALIVE_SECONDS", "15"))
+
+        # Send retries (see retries.py)
+        self.SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))
+        self.RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "30"))
+        self.RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "3600"))
         
         self._validate()
 
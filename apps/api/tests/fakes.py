@@ -0,0 +1,119 @@
+"""
+In-memory stand-in for the supabase-py client.
+Supports the subset of the query builder the API uses and records every
+executed call so tests can assert on round trips.
+"""
+from types import SimpleNamespace
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table_name = table
+        self.op = "select"
+        self.payload = None
+        self.filters = []
+        self.limit_n = None
+        self.on_conflict = None
+        self.single_row = False
+
+    # --- operations ---
+    def select(self, *_args, **_kwargs):
+        self.op = "select"
+        return self
+
+    def insert(self, payload, **_kwargs):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict="", **_kwargs):
+        self.op, self.payload, self.on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload, **_kwargs):
+        self.op, self.payload = "update", payload
+        return self
+
+    # --- filters ---
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def _matches(self, row):
+        return all(f(row) for f in self.filters)
+
+    def execute(self):
+        rows = self.db.tables.setdefault(self.table_name, [])
+        self.db.calls.append((self.table_name, self.op))
+
+        if self.op == "select":
+            data = [dict(r) for r in rows if self._matches(r)]
+            if self.limit_n is not None:
+                data = data[: self.limit_n]
+            if self.single_row:
+                data = data[0] if data else None
+            return SimpleNamespace(data=data)
+
+        if self.op == "insert":
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            rows.extend(dict(p) for p in payload)
+            return SimpleNamespace(data=payload)
+
+        if self.op == "upsert":
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            keys = [k.strip() for k in (self.on_conflict or "id").split(",")]
+            for p in payload:
+                existing = next((r for r in rows if all(r.get(k) == p.get(k) for k in keys)), None)
+                if existing is not None:
+                    existing.update(p)
+                else:
+                    rows.append(dict(p))
+            return SimpleNamespace(data=payload)
+
+        if self.op == "update":
+            updated = []
+            for r in rows:
+                if self._matches(r):
+                    r.update(self.payload)
+                    updated.append(dict(r))
+            return SimpleNamespace(data=updated)
+
+        raise NotImplementedError(self.op)
+
+
+class FakeRpc:
+    def __init__(self, db, name, params):
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self):
+        self.db.calls.append((self.name, "rpc"))
+        return SimpleNamespace(data=self.db.rpc_handlers[self.name](self.db, self.params))
+
+
+class FakeSupabase:
+    def __init__(self, tables=None, rpc_handlers=None):
+        self.tables = tables or {}
+        self.rpc_handlers = rpc_handlers or {}
+        self.calls = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRpc(self, name, params or {})
+
+    def calls_to(self, table):
+        return [op for t, op in self.calls if t == table]
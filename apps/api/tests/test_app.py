@@ -0,0 +1,28 @@
+from fastapi.testclient import TestClient
+from ..app import app
+from ..db import get_supabase
+from .fakes import FakeSupabase
+
+def test_routers_are_mounted_under_api():
+    paths = set(app.openapi()["paths"])
+    assert {"/api/messages/send-sms", "/api/campaigns/start-mass-outreach", "/api/webhooks/twilio/inbound"} <= paths
+
+def _opt_out_phone(db, params):
+    hits = [m for m in db.tables["members"] if m["phone_e164"] == params["p_phone_e164"]]
+    for m in hits:
+        m["sms_opted_out"] = True
+    return [{"gym_id": m["gym_id"], "member_id": m["member_id"]} for m in hits]
+
+def test_routers_use_the_injected_client():
+    fake = FakeSupabase(
+        {"members": [{"gym_id": "gym-1", "member_id": "m1", "phone_e164": "+15550001111", "sms_opted_out": False}]},
+        rpc_handlers={"opt_out_phone": _opt_out_phone},
+    )
+    app.dependency_overrides[get_supabase] = lambda: fake
+    try:
+        response = TestClient(app).post("/api/webhooks/twilio/inbound", data={"From": "+15550001111", "Body": "STOP"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert fake.tables["members"][0]["sms_opted_out"] is True
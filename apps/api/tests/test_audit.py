@@ -0,0 +1,46 @@
+import pytest
+from .. import db
+from ..audit import AuditSink
+from .fakes import FakeSupabase
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeSupabase({"audit_logs": []})
+    monkeypatch.setattr(db, "_supabase", fake)
+    return fake
+
+def _event(i):
+    return {"gym_id": "gym-1", "user_id": "user-1", "action": f"action-{i}"}
+
+def test_events_are_written_in_bulk_on_close(fake_db):
+    # Long interval: nothing is written until the size threshold or close()
+    sink = AuditSink(max_size=100, batch_size=10, flush_interval=60)
+    for i in range(25):
+        sink.emit(_event(i))
+    sink.close()
+
+    assert len(fake_db.tables["audit_logs"]) == 25
+    # Batches of at most 10 (the flusher may wake mid-burst and take a partial one)
+    assert 3 <= len(fake_db.calls_to("audit_logs")) <= 5
+
+def test_full_buffer_writes_through_instead_of_dropping(fake_db):
+    sink = AuditSink(max_size=2, batch_size=100, flush_interval=60)
+    sink._ensure_started = lambda: None  # no flusher: the queue just fills up
+    for i in range(5):
+        sink.emit(_event(i))
+
+    assert sink.overflow_writes == 3
+    sink.close()
+    assert sorted(r["action"] for r in fake_db.tables["audit_logs"]) == [f"action-{i}" for i in range(5)]
+
+def test_failed_insert_is_logged_not_lost(fake_db, capsys):
+    def boom(*_args, **_kwargs):
+        raise RuntimeError("db down")
+    fake_db.table = boom
+
+    sink = AuditSink(max_size=10, batch_size=10, flush_interval=60)
+    sink.emit(_event(1))
+    sink.close()
+
+    out = capsys.readouterr().out
+    assert "[Audit Log Lost]" in out and "action-1" in out
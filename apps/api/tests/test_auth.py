@@ -0,0 +1,72 @@
+import asyncio
+import time
+import jwt
+import pytest
+from fastapi import HTTPException
+from .. import auth, db, dependencies
+from ..auth import ProfileCache
+from .fakes import FakeSupabase
+
+SECRET = "test-jwt-secret-with-enough-bytes-for-hs256"
+
+def _token(sub="user-1", exp_in=3600, aud="authenticated", secret=SECRET):
+    return jwt.encode({"sub": sub, "email": "owner@gym.test", "aud": aud, "exp": int(time.time()) + exp_in}, secret, algorithm="HS256")
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeSupabase({"profiles": [{"user_id": "user-1", "gym_id": "gym-1", "role": "gym_owner"}]})
+    monkeypatch.setattr(db, "_supabase", fake)
+    monkeypatch.setattr(auth.settings, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(auth, "profile_cache", ProfileCache(100, 60))
+    monkeypatch.setattr(dependencies, "profile_cache", auth.profile_cache)
+    return fake
+
+def _authenticate(token, target_gym=None):
+    return asyncio.run(dependencies.get_current_user_gym(f"Bearer {token}", target_gym))
+
+def test_verify_token_checks_signature_expiry_and_audience(fake_db):
+    assert auth.verify_token(_token()).user_id == "user-1"
+    for bad in (_token(exp_in=-60), _token(aud="anon"), _token(secret="some-other-secret-with-enough-bytes")):
+        with pytest.raises(auth.InvalidToken):
+            auth.verify_token(bad)
+
+def test_warm_request_does_no_io(fake_db):
+    first = _authenticate(_token())
+    second = _authenticate(_token())
+
+    assert first == second
+    assert second.gym_id == "gym-1" and second.email == "owner@gym.test"
+    # One profile lookup for both requests, and no call to Supabase Auth
+    assert fake_db.calls == [("profiles", "select")]
+
+def test_invalidation_picks_up_role_change(fake_db):
+    _authenticate(_token())
+    fake_db.tables["profiles"][0]["role"] = "admin"
+
+    assert _authenticate(_token(), "gym-2").gym_id == "gym-1"
+    auth.profile_cache.invalidate("user-1")
+    assert _authenticate(_token(), "gym-2").gym_id == "gym-2"
+
+def test_bad_token_and_missing_profile(fake_db):
+    with pytest.raises(HTTPException) as exc:
+        _authenticate(_token(exp_in=-60))
+    assert exc.value.status_code == 401
+
+    with pytest.raises(HTTPException) as exc:
+        _authenticate(_token(sub="user-without-profile"))
+    assert exc.value.status_code == 403
+
+def test_profile_cache_ttl_and_lru():
+    now = [0.0]
+    cache = ProfileCache(max_size=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.set("a", "gym-a", "gym_owner")
+    cache.set("b", "gym-b", "gym_owner")
+    cache.get("a")
+    cache.set("c", "gym-c", "gym_owner")
+
+    # "b" was least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == ("gym-a", "gym_owner")
+
+    now[0] = 11
+    assert cache.get("a") is None
@@ -0,0 +1,54 @@
+import json
+from fastapi.testclient import TestClient
+from .. import campaign_progress
+from ..app import app
+from ..dependencies import get_current_user_gym, UserContext
+
+GYM = "gym-1"
+
+def _row(status, sent, failed=0, retrying=0):
+    return {"id": "c1", "gym_id": GYM, "status": status, "total_recipients": 4, "processed_count": sent + failed,
+            "sent_count": sent, "failed_count": failed, "skipped_count": 0, "retrying_count": retrying}
+
+def _client(monkeypatch, rows, gym_id=GYM):
+    reads = []
+    def fetch(campaign_id):
+        # Each read sees the campaign one step further along
+        reads.append(campaign_id)
+        return rows[min(len(reads), len(rows)) - 1]
+    monkeypatch.setattr(campaign_progress, "fetch_campaign_progress", fetch)
+    monkeypatch.setattr(campaign_progress.progress_hub, "poll_seconds", 0)
+    app.dependency_overrides[get_current_user_gym] = lambda: UserContext(user_id="u1", gym_id=gym_id, email="", role="gym_owner")
+    return reads, TestClient(app)
+
+def _events(body: str):
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+def test_streams_counters_until_the_campaign_completes(monkeypatch):
+    rows = [_row("running", 0), _row("running", 1, retrying=1), _row("running", 2, failed=1, retrying=1), _row("completed", 3, failed=1)]
+    reads, client = _client(monkeypatch, rows)
+    try:
+        res = client.get("/api/campaigns/c1/progress")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = _events(res.text)
+    assert events[0]["status"] == "running" and events[0]["queued_count"] == 4
+    assert events[-1] == {"id": "c1", "status": "completed", "total_recipients": 4, "processed_count": 4,
+                          "sent_count": 3, "failed_count": 1, "skipped_count": 0, "retrying_count": 0, "queued_count": 0}
+    # One event per change, never a repeat
+    assert all(a != b for a, b in zip(events, events[1:]))
+    assert campaign_progress.progress_hub._subscribers == {}
+    assert campaign_progress.progress_hub._pollers == {}
+
+def test_other_gyms_campaigns_are_not_found(monkeypatch):
+    _, client = _client(monkeypatch, [_row("running", 0)], gym_id="gym-2")
+    try:
+        res = client.get("/api/campaigns/c1/progress")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert res.status_code == 404
+    assert campaign_progress.progress_hub._subscribers == {}
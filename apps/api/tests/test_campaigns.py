@@ -0,0 +1,396 @@
+import asyncio
+import pytest
+from .. import campaigns, db, providers, retries, worker
+from ..ratelimit import LocalBucketStore, SendRateLimiter
+from ..retries import ProviderError
+from .fakes import FakeSupabase
+
+GYM = "gym-1"
+
+def _claim(db, params):
+    # Mirrors claim_campaign_recipients (migration 017) minus the locking
+    claimed = []
+    for r in db.tables["campaign_recipients"]:
+        if len(claimed) == params["p_limit"]:
+            break
+        if r["status"] == "queued" and r["channel"] == params["p_channel"]:
+            r.update({"status": "sending", "claimed_by": params["p_worker_id"]})
+            claimed.append(dict(r))
+    return claimed
+
+def _claim_retries(db, params):
+    # Treats every scheduled retry of the channel as due
+    due = [s for s in db.tables.get("message_sends", []) if s.get("next_retry_at") and s["channel"] == params["p_channel"]]
+    return [dict(s) for s in due[: params["p_limit"]]]
+
+def _release(db, params):
+    for r in db.tables["campaign_recipients"]:
+        if r["id"] in params["p_ids"] and r["status"] == "sending":
+            r.update({"status": "queued", "claimed_by": None})
+    return None
+
+def _set_statuses(db, params):
+    # Mirrors set_campaign_recipient_statuses (migration 033): unchanged rows don't count
+    counters = {"sent": "sent_count", "failed": "failed_count",
+                "skipped_opted_out": "skipped_count", "retrying": "retrying_count"}
+    rows = {r["id"]: r for r in db.tables["campaign_recipients"]}
+    campaigns = {c["id"]: c for c in db.tables["campaigns"]}
+    changed = 0
+    for update in params["p_updates"]:
+        r = rows[update["id"]]
+        if r["status"] == update["status"]:
+            continue
+        c = campaigns[r["campaign_id"]]
+        for status, delta in ((r["status"], -1), (update["status"], 1)):
+            if status in counters:
+                c[counters[status]] = c.get(counters[status], 0) + delta
+                if status != "retrying":
+                    c["processed_count"] = c.get("processed_count", 0) + delta
+        r["status"] = update["status"]
+        changed += 1
+    return changed
+
+def _refresh(db, params):
+    for c in db.tables["campaigns"]:
+        pending = [r for r in db.tables["campaign_recipients"]
+                   if r["campaign_id"] == c["id"] and r["status"] in ("queued", "sending", "retrying")]
+        if c["status"] in ("queued", "running") and not pending:
+            c["status"] = "completed"
+    return None
+
+def _seed(n_members=120):
+    members = []
+    recipients = []
+    for i in range(n_members):
+        members.append({
+            "gym_id": GYM,
+            "member_id": f"m{i}",
+            "phone": None if i % 40 == 1 else f"+1555000{i:04d}",
+            "sms_opted_out": i % 40 == 0,
+            "first_name": f"Member{i}",
+        })
+        recipients.append({
+            "id": f"r{i}",
+            "gym_id": GYM,
+            "campaign_id": "c1",
+            "member_id": f"m{i}",
+            "channel": "sms",
+            "status": "queued",
+        })
+    return FakeSupabase(
+        {
+            "campaigns": [{"id": "c1", "gym_id": GYM, "status": "queued", "message_body": "Hi {{first_name}}, from {{gym_name}}"}],
+            "gyms": [{"id": GYM, "name": "Iron Works"}],
+            "members": members,
+            "campaign_recipients": recipients,
+        },
+        rpc_handlers={
+            "claim_campaign_recipients": _claim,
+            "claim_due_retries": _claim_retries,
+            "release_campaign_recipients": _release,
+            "set_campaign_recipient_statuses": _set_statuses,
+            "refresh_campaign_statuses": _refresh,
+        },
+    )
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = _seed()
+    monkeypatch.setattr(db, "_supabase", fake)
+    # Effectively unlimited, in memory; throttling itself is covered by test_ratelimit.py
+    monkeypatch.setattr(worker, "sms_limiter", SendRateLimiter(LocalBucketStore(), 1e6, 1e6, 1e6))
+
+    # No latency, no errors; tests that need failures patch campaigns._send_sms
+    monkeypatch.setattr(providers, "_sms_provider", providers.FakeSmsProvider())
+    return fake
+
+def _drain(db):
+    w = worker.CampaignWorker("test-worker")
+    while asyncio.run(w.run_once()):
+        pass
+
+def test_worker_drains_queue(fake_db):
+    _drain(fake_db)
+
+    statuses = {r["member_id"]: r["status"] for r in fake_db.tables["campaign_recipients"]}
+    assert set(statuses.values()) == {"sent", "failed", "skipped_opted_out"}
+    assert statuses["m0"] == "skipped_opted_out"
+    assert statuses["m1"] == "failed"
+    assert statuses["m2"] == "sent"
+    campaign = fake_db.tables["campaigns"][0]
+    assert campaign["status"] == "completed"
+    assert (campaign["sent_count"], campaign["failed_count"], campaign["skipped_count"]) == (114, 3, 3)
+    assert campaign["processed_count"] == 120
+
+    sent = [s for s in fake_db.tables["message_sends"] if s["status"] == "sent"]
+    assert len(sent) == 120 - 3 - 3
+    m2 = next(s for s in sent if s["member_id"] == "m2")
+    assert (m2["message_body"], m2["segment_count"]) == ("Hi Member2, from Iron Works", 1)
+    # The gym's name is looked up once per campaign, not per batch
+    assert fake_db.calls_to("gyms") == ["select"]
+    assert all(s["provider_message_id"].startswith("mock-") for s in sent)
+    contacted = [m for m in fake_db.tables["members"] if m.get("last_contacted_at")]
+    assert len(contacted) == len(sent)
+
+def test_round_trips_are_per_batch_not_per_recipient(fake_db):
+    _drain(fake_db)
+
+    batches = 3  # 120 recipients / 50
+    assert fake_db.calls_to("members").count("select") == batches
+    assert fake_db.calls_to("members").count("update") == batches
+    assert fake_db.calls_to("message_sends").count("insert") == batches
+    assert len(fake_db.calls_to("set_campaign_recipient_statuses")) == batches
+
+def test_transient_failure_is_retried_not_dead_lettered(fake_db, monkeypatch):
+    attempts = {}
+
+    async def flaky(phone_number, message_body):
+        attempts[phone_number] = attempts.get(phone_number, 0) + 1
+        if attempts[phone_number] == 1:
+            raise ProviderError("Simulated Provider Rate Limit", status_code=429)
+        return {"provider_message_id": f"SM{phone_number}", "status": "queued"}
+    monkeypatch.setattr(campaigns, "_send_sms", flaky)
+
+    _drain(fake_db)
+
+    statuses = {r["member_id"]: r["status"] for r in fake_db.tables["campaign_recipients"]}
+    assert statuses["m2"] == "sent"
+    assert "retrying" not in statuses.values()
+    assert fake_db.tables["campaigns"][0]["retrying_count"] == 0
+    assert fake_db.tables["campaigns"][0]["sent_count"] == 114
+    assert fake_db.tables["campaigns"][0]["status"] == "completed"
+    assert fake_db.tables.get("dead_letter_messages", []) == []
+
+    m2_sends = [s for s in fake_db.tables["message_sends"] if s["member_id"] == "m2"]
+    assert len(m2_sends) == 1
+    assert m2_sends[0]["attempt_count"] == 2
+    assert m2_sends[0]["final_status"] == "sent"
+    assert m2_sends[0]["provider_message_id"] == "SM+15550000002"
+
+def test_gives_up_after_max_attempts(fake_db, monkeypatch):
+    async def always_429(phone_number, message_body):
+        raise ProviderError("Too Many Requests", status_code=429)
+    monkeypatch.setattr(campaigns, "_send_sms", always_429)
+    monkeypatch.setattr(retries.settings, "SEND_MAX_ATTEMPTS", 3)
+
+    _drain(fake_db)
+
+    sends = fake_db.tables["message_sends"]
+    assert {s["final_status"] for s in sends} == {"gave_up"}
+    assert {s["attempt_count"] for s in sends} == {3}
+    dlq = fake_db.tables["dead_letter_messages"]
+    assert len(dlq) == len(sends)
+    assert {d["original_send_id"] for d in dlq} == {s["id"] for s in sends}
+    assert fake_db.tables["campaigns"][0]["status"] == "completed"
+
+def test_opt_out_between_attempts_is_skipped_not_dead_lettered(fake_db, monkeypatch):
+    async def first_fails(phone_number, message_body):
+        raise ProviderError("Too Many Requests", status_code=429)
+    monkeypatch.setattr(campaigns, "_send_sms", first_fails)
+
+    w = worker.CampaignWorker("test-worker")
+    w.claim_retries = lambda limit, channel="sms": []
+    while asyncio.run(w.run_once()):
+        pass
+
+    # Everyone who could be sent is now retrying; m2 replies STOP before the retry
+    next(m for m in fake_db.tables["members"] if m["member_id"] == "m2")["sms_opted_out"] = True
+    retries_due = [dict(s) for s in fake_db.tables["message_sends"] if s["member_id"] == "m2"]
+    asyncio.run(campaigns.process_due_retries(retries_due))
+
+    statuses = {r["member_id"]: r["status"] for r in fake_db.tables["campaign_recipients"]}
+    assert statuses["m2"] == "skipped_opted_out"
+    m2_send = next(s for s in fake_db.tables["message_sends"] if s["member_id"] == "m2")
+    assert m2_send["final_status"] == "skipped_opted_out"
+    assert fake_db.tables.get("dead_letter_messages", []) == []
+
+def test_campaign_cache_is_bounded(fake_db, monkeypatch):
+    monkeypatch.setattr(worker, "CAMPAIGN_CACHE_SIZE", 3)
+    fake_db.tables["campaigns"] = [{"id": f"c{i}", "gym_id": GYM, "message_body": "hi"} for i in range(10)]
+    w = worker.CampaignWorker("test-worker")
+    for i in range(10):
+        w._campaign(f"c{i}")
+    assert list(w._campaigns) == ["c7", "c8", "c9"]
+
+def test_stop_flag_ends_worker_loop(fake_db):
+    w = worker.CampaignWorker("test-worker")
+    w.stopping = True
+    asyncio.run(w.run_forever())
+    # Never claimed anything once asked to stop
+    assert fake_db.calls_to("claim_campaign_recipients") == []
+
+def test_claim_is_sized_to_tokens_and_gym_overflow_is_released(fake_db, monkeypatch):
+    clock = lambda: 0.0  # no refill during the test
+    monkeypatch.setattr(worker, "sms_limiter", SendRateLimiter(LocalBucketStore(clock), 30, 30, 10))
+    w = worker.CampaignWorker("test-worker")
+
+    handled = asyncio.run(w.run_once())
+
+    # 30 global tokens -> claim of 30 -> 10 admitted by the gym bucket, 20 handed back
+    assert handled == 10
+    statuses = [r["status"] for r in fake_db.tables["campaign_recipients"]]
+    assert statuses.count("queued") == 110
+    assert "sending" not in statuses
+
+    # Gym is out of tokens: the next poll sends nothing and leaves no rows leased
+    assert asyncio.run(w.run_once()) == 0
+    statuses = [r["status"] for r in fake_db.tables["campaign_recipients"]]
+    assert statuses.count("queued") == 110
+    assert "sending" not in statuses
+
+def test_start_mass_outreach_creates_campaign_server_side(fake_db):
+    from fastapi.testclient import TestClient
+    from ..app import app
+    from ..audit import audit_sink
+    from ..db import get_supabase
+    from ..dependencies import get_current_user_gym, UserContext
+
+    def create(db, params):
+        assert params == {"p_gym_id": GYM, "p_message_body": "Come back!", "p_score_threshold": 70.0, "p_template_id": None,
+                          "p_channel": "sms", "p_email_subject": None}
+        return [{"campaign_id": "c2", "recipient_count": 118}]
+    fake_db.rpc_handlers["create_mass_outreach_campaign"] = create
+
+    app.dependency_overrides[get_supabase] = lambda: fake_db
+    app.dependency_overrides[get_current_user_gym] = lambda: UserContext(user_id="u1", gym_id=GYM, email="", role="gym_owner")
+    try:
+        response = TestClient(app).post("/api/campaigns/start-mass-outreach", json={"message_body": "Come back!"})
+    finally:
+        app.dependency_overrides.clear()
+    audit_sink.flush()
+
+    assert response.json() == {"status": "campaign_started", "campaign_id": "c2", "eligible_count": 118}
+    # One RPC, no member rows pulled into the API
+    assert fake_db.calls[0] == ("create_mass_outreach_campaign", "rpc")
+    assert "members" not in [t for t, _ in fake_db.calls]
+    assert fake_db.tables["audit_logs"][0]["entity_id"] == "c2"
+
+def _start(fake_db, path, body):
+    from fastapi.testclient import TestClient
+    from ..app import app
+    from ..db import get_supabase
+    from ..dependencies import get_current_user_gym, UserContext
+
+    app.dependency_overrides[get_supabase] = lambda: fake_db
+    app.dependency_overrides[get_current_user_gym] = lambda: UserContext(user_id="u1", gym_id=GYM, email="", role="gym_owner")
+    try:
+        return TestClient(app).post(path, json=body)
+    finally:
+        app.dependency_overrides.clear()
+
+def test_campaign_from_stored_template_copies_its_body(fake_db):
+    fake_db.tables["templates"] = [
+        {"id": "t1", "gym_id": GYM, "type": "sms", "body": "Hi {{ first_name }}!"},
+        {"id": "t2", "gym_id": GYM, "type": "sms", "body": "Hi {{nickname}}!"},
+        {"id": "t3", "gym_id": "gym-2", "type": "sms", "body": "Not yours"},
+    ]
+    created = []
+    fake_db.rpc_handlers["create_mass_outreach_campaign"] = lambda db, params: created.append(params) or [
+        {"campaign_id": "c2", "recipient_count": 1}]
+
+    ok = _start(fake_db, "/api/campaigns/start-mass-outreach", {"template_id": "t1"})
+    unknown = _start(fake_db, "/api/campaigns/start-mass-outreach", {"template_id": "t2"})
+    other_gym = _start(fake_db, "/api/campaigns/start-mass-outreach", {"template_id": "t3"})
+
+    assert ok.status_code == 200
+    assert created == [{"p_gym_id": GYM, "p_message_body": "Hi {{ first_name }}!", "p_score_threshold": 70.0,
+                        "p_template_id": "t1", "p_channel": "sms", "p_email_subject": None}]
+    assert unknown.status_code == 400 and "nickname" in unknown.json()["detail"]
+    assert other_gym.status_code == 404
+
+def test_estimate_counts_segments_from_name_lengths(fake_db, monkeypatch):
+    monkeypatch.setattr(campaigns.settings, "SMS_SEGMENT_PRICE_USD", 0.01)
+    fake_db.rpc_handlers["mass_outreach_audience_name_lengths"] = lambda db, params: [
+        {"first_name_length": 5, "last_name_length": 3, "gsm7": True, "members": 90},
+        # Pushes this body past 70 UCS-2 units
+        {"first_name_length": 60, "last_name_length": None, "gsm7": False, "members": 10},
+    ]
+
+    res = _start(fake_db, "/api/campaigns/estimate", {"message_body": "Hi {{first_name}}, the team at {{gym_name}} misses you!"})
+
+    assert res.json()["recipients"] == 100
+    assert res.json()["recipients_by_segments"] == {"1": 90, "2": 10}
+    assert res.json()["segments"] == 110
+    assert res.json()["estimated_cost_usd"] == 1.1
+
+class _RecordingEmailProvider(providers.FakeEmailProvider):
+    def __init__(self, fail_first_bulk=False):
+        super().__init__()
+        self.bulk_requests = []
+        self.single_sends = []
+        self.fail_first_bulk = fail_first_bulk
+
+    async def _send_bulk(self, subject, body, recipients):
+        self.bulk_requests.append((subject, body, recipients))
+        if self.fail_first_bulk and len(self.bulk_requests) == 1:
+            raise ProviderError("SendGrid HTTP 503", status_code=503)
+        return {"provider_message_id": f"bulk-{len(self.bulk_requests)}", "status": "queued"}
+
+    async def _send_email(self, to, subject, body, custom_args):
+        self.single_sends.append((to, subject, body, custom_args))
+        return {"provider_message_id": f"single-{len(self.single_sends)}", "status": "queued"}
+
+def _email_campaign(fake_db, monkeypatch, n, provider):
+    fake_db.tables["campaigns"].append({"id": "c2", "gym_id": GYM, "status": "queued",
+                                        "message_body": "Hi {{first_name}}, {{gym_name}} misses you",
+                                        "email_subject": "{{first_name}}, come back"})
+    for i in range(n):
+        fake_db.tables["members"].append({"gym_id": GYM, "member_id": f"e{i}", "first_name": f"Em{i}",
+                                          "email": None if i == 7 else f"e{i}@example.com"})
+        fake_db.tables["campaign_recipients"].append({"id": f"er{i}", "gym_id": GYM, "campaign_id": "c2",
+                                                      "member_id": f"e{i}", "channel": "email", "status": "queued"})
+    monkeypatch.setattr(providers, "_email_provider", provider)
+
+def test_email_campaign_goes_out_in_bulk_requests(fake_db, monkeypatch):
+    provider = _RecordingEmailProvider()
+    _email_campaign(fake_db, monkeypatch, 2500, provider)
+
+    _drain(fake_db)
+
+    # 2,500 recipients in 3 requests (1,000 claimed per poll; e7 has no address), not 2,500
+    assert [len(r) for _, _, r in provider.bulk_requests] == [999, 1000, 500]
+    subject, body, recipients = provider.bulk_requests[0]
+    assert (subject, body) == ("-first_name-, come back", "Hi -first_name-, -gym_name- misses you")
+    first = recipients[0]
+    assert first["to"] == "e0@example.com"
+    assert first["substitutions"] == {"-first_name-": "Em0", "-gym_name-": "Iron Works"}
+    assert first["custom_args"]["gym_id"] == GYM and first["custom_args"]["member_id"] == "e0"
+
+    email_sends = {s["member_id"]: s for s in fake_db.tables["message_sends"] if s["channel"] == "email"}
+    assert len(email_sends) == 2499
+    assert email_sends["e0"]["message_body"] == "Hi Em0, Iron Works misses you"
+    assert email_sends["e0"]["subject"] == "Em0, come back"
+    assert first["custom_args"]["message_send_id"] == email_sends["e0"]["id"]
+    c2 = next(c for c in fake_db.tables["campaigns"] if c["id"] == "c2")
+    assert (c2["status"], c2["sent_count"], c2["failed_count"]) == ("completed", 2499, 1)
+    assert not provider.single_sends
+
+def test_failed_bulk_request_is_retried_per_message(fake_db, monkeypatch):
+    provider = _RecordingEmailProvider(fail_first_bulk=True)
+    _email_campaign(fake_db, monkeypatch, 5, provider)
+
+    _drain(fake_db)
+
+    assert len(provider.bulk_requests) == 1
+    # Every message of the failed request was rescheduled, then re-sent one by one with its stored copy
+    assert sorted(to for to, _, _, _ in provider.single_sends) == [f"e{i}@example.com" for i in range(5)]
+    to, subject, body, custom_args = next(s for s in provider.single_sends if s[0] == "e1@example.com")
+    assert (subject, body) == ("Em1, come back", "Hi Em1, Iron Works misses you")
+    assert custom_args["member_id"] == "e1"
+    statuses = {r["member_id"]: r["status"] for r in fake_db.tables["campaign_recipients"] if r["channel"] == "email"}
+    assert set(statuses.values()) == {"sent"}
+
+def test_email_retries_dont_use_sms_tokens(fake_db, monkeypatch):
+    clock = lambda: 0.0  # no refill during the test
+    limiter = SendRateLimiter(LocalBucketStore(clock), 5, 5, 5)
+    limiter.reserve(5)  # SMS fully throttled
+    monkeypatch.setattr(worker, "sms_limiter", limiter)
+    fake_db.tables["campaign_recipients"] = []
+    provider = _RecordingEmailProvider(fail_first_bulk=True)
+    _email_campaign(fake_db, monkeypatch, 5, provider)
+
+    _drain(fake_db)
+
+    assert len(provider.single_sends) == 5
+    # The SMS bucket is exactly as drained as before: nothing was taken or handed back
+    assert limiter.store.buckets["sms:global"].tokens == 0
@@ -0,0 +1,179 @@
+import pytest
+from fastapi.testclient import TestClient
+from .. import churn_sync, db, scoring
+from ..app import app
+from ..settings import settings
+from .fakes import FakeSupabase
+from .test_scoring import _row
+
+HEADERS = {"X-API-KEY": settings.X_API_KEY or "test-api-key"}
+GYMS = ["00000000-0000-0000-0000-00000000000a", "00000000-0000-0000-0000-00000000000b"]
+
+class FlakyDatabase:
+    """
+    In-memory migrations 023/024: keyset pages, checkpointed chunk commits, per-gym watermarks,
+    and an optional failure on the Nth apply to simulate a crash mid-run.
+    Time is a counter that ticks on every feature change and run start.
+    """
+    def __init__(self, members_per_gym: int, fail_on_apply: int = 0):
+        self.now = 0
+        self.features = sorted(
+            ({**_row(i), "gym_id": gym, "member_id": f"m{i:03d}", "features_changed_at": 0}
+             for gym in GYMS for i in range(members_per_gym)),
+            key=lambda r: (r["gym_id"], r["member_id"]),
+        )
+        self.watermarks = {}
+        self.scores = {}
+        self.applies = 0
+        self.fail_on_apply = fail_on_apply
+        self.fake = FakeSupabase({"churn_sync_runs": [], "member_score_history": []}, rpc_handlers={
+            "begin_churn_sync_run": self.begin,
+            "member_features_page": self.page,
+            "apply_churn_scores": self.apply,
+            "finish_churn_sync_run": self.finish,
+        })
+
+    def change(self, member_id: str, **features):
+        self.now += 1
+        for row in self.features:
+            if row["member_id"] == member_id and row["gym_id"] == GYMS[0]:
+                row.update(features, features_changed_at=self.now)
+
+    def begin(self, fake, params):
+        if params["p_restart"]:
+            for r in fake.tables["churn_sync_runs"]:
+                if r["status"] == "running":
+                    r["status"] = "failed"
+        running = [r for r in fake.tables["churn_sync_runs"] if r["status"] == "running"]
+        if running:
+            return [dict(running[-1])]
+        self.now += 1
+        run = {"id": f"run-{len(fake.tables['churn_sync_runs']) + 1}", "status": "running", "model_version": params["p_model_version"],
+               "incremental": params["p_incremental"], "started_at": self.now,
+               "last_gym_id": None, "last_member_id": None, "rows_scored": 0, "rows_written": 0}
+        fake.tables["churn_sync_runs"].append(run)
+        return [dict(run)]
+
+    def page(self, fake, params):
+        after = (params["p_after_gym_id"], params["p_after_member_id"])
+        def changed(r):
+            mark = self.watermarks.get(r["gym_id"])
+            return (params["p_model_version"] is None or mark is None or mark[1] != params["p_model_version"]
+                    or r["features_changed_at"] >= mark[0])
+        rows = [r for r in self.features if (after[0] is None or (r["gym_id"], r["member_id"]) > after) and changed(r)]
+        return rows[: params["p_limit"]]
+
+    def apply(self, fake, params):
+        self.applies += 1
+        if self.applies == self.fail_on_apply:
+            raise RuntimeError("connection reset")
+        run = next(r for r in fake.tables["churn_sync_runs"] if r["id"] == params["p_run_id"])
+        assert (run["last_gym_id"], run["last_member_id"]) == (params["p_after_gym_id"], params["p_after_member_id"])
+        scores = params["p_scores"]
+        written = []
+        for s in scores:
+            key = (s["gym_id"], s["member_id"])
+            old = self.scores.get(key)
+            if old is None or abs(old - s["churn_score"]) >= params["p_min_change"] or (old >= 70) != s["is_high_risk"]:
+                self.scores[key] = s["churn_score"]
+                written.append(s)
+        fake.tables["member_score_history"].extend(written)
+        run.update(last_gym_id=scores[-1]["gym_id"], last_member_id=scores[-1]["member_id"],
+                   rows_scored=run["rows_scored"] + len(scores), rows_written=run["rows_written"] + len(written))
+        return len(written)
+
+    def finish(self, fake, params):
+        run = next(r for r in fake.tables["churn_sync_runs"] if r["id"] == params["p_run_id"])
+        run["status"] = "completed"
+        for gym in GYMS:
+            self.watermarks[gym] = (run["started_at"], run["model_version"])
+
+@pytest.fixture
+def database(monkeypatch):
+    # The bundled artifact is the placeholder baseline; these runs stand in for a trained export
+    monkeypatch.setattr(scoring.get_model(), "baseline", False)
+    def install(**kwargs):
+        d = FlakyDatabase(**kwargs)
+        monkeypatch.setattr(db, "_supabase", d.fake)
+        return d
+    return install
+
+def test_sync_scores_every_member_in_chunks(database):
+    d = database(members_per_gym=25)
+    result = churn_sync.run_churn_sync(chunk_size=10)
+
+    history = d.fake.tables["member_score_history"]
+    assert result["rows_scored"] == 50
+    assert [(h["gym_id"], h["member_id"]) for h in history] == [(r["gym_id"], r["member_id"]) for r in d.features]
+    assert [h["churn_score"] for h in history] == pytest.approx(scoring.score_rows(d.features).tolist())
+    assert all(h["is_high_risk"] == (h["churn_score"] >= 70) for h in history)
+    # One page read and one write per chunk, not three round trips per member
+    assert d.fake.calls_to("apply_churn_scores").count("rpc") == 5
+    assert d.fake.tables["churn_sync_runs"][0]["status"] == "completed"
+
+def test_crashed_run_resumes_after_last_committed_chunk(database):
+    d = database(members_per_gym=25, fail_on_apply=3)
+    with pytest.raises(RuntimeError):
+        churn_sync.run_churn_sync(chunk_size=10)
+
+    run = d.fake.tables["churn_sync_runs"][0]
+    assert run["status"] == "running" and run["rows_scored"] == 20
+    assert run["error"] == "connection reset"
+
+    result = churn_sync.run_churn_sync(chunk_size=10)
+
+    history = d.fake.tables["member_score_history"]
+    assert result["run_id"] == run["id"] and result["rows_scored"] == 50
+    # Every member exactly once across both invocations
+    assert sorted((h["gym_id"], h["member_id"]) for h in history) == [(r["gym_id"], r["member_id"]) for r in d.features]
+    assert run["status"] == "completed"
+
+def test_incremental_run_rescores_only_changed_members(database):
+    d = database(members_per_gym=25)
+    churn_sync.run_churn_sync(chunk_size=10)
+    assert len(d.fake.tables["member_score_history"]) == 50
+
+    d.change("m001", Days_Since_Last_Visit=90, Avg_class_frequency_current_month=0)
+    d.change("m002", Days_Since_Last_Visit=91, Avg_class_frequency_current_month=0)
+    d.change("m003", Days_Since_Last_Visit=_row(3)["Days_Since_Last_Visit"])  # score doesn't move
+    result = churn_sync.run_churn_sync(chunk_size=10)
+
+    assert result["rows_scored"] == 3
+    assert result["rows_written"] == 2
+    assert [h["member_id"] for h in d.fake.tables["member_score_history"][50:]] == ["m001", "m002"]
+
+    # Nothing changed: nothing read, scored or written
+    assert churn_sync.run_churn_sync(chunk_size=10)["rows_scored"] == 0
+
+def test_full_run_and_new_model_version_rescore_everyone(database, monkeypatch):
+    d = database(members_per_gym=5)
+    churn_sync.run_churn_sync()
+    assert churn_sync.run_churn_sync(full=True)["rows_scored"] == 10
+
+    model = scoring.get_model()
+    monkeypatch.setattr(model, "version", "retrained-2")
+    assert churn_sync.run_churn_sync()["rows_scored"] == 10
+
+def test_unfinished_run_from_another_model_version_starts_over(database, monkeypatch):
+    d = database(members_per_gym=25, fail_on_apply=2)
+    with pytest.raises(RuntimeError):
+        churn_sync.run_churn_sync(chunk_size=10)
+
+    monkeypatch.setattr(scoring.get_model(), "version", "retrained-2")
+    result = churn_sync.run_churn_sync(chunk_size=10)
+
+    runs = d.fake.tables["churn_sync_runs"]
+    assert [r["status"] for r in runs] == ["failed", "completed"]
+    assert result["run_id"] == runs[1]["id"] and result["rows_scored"] == 50
+
+def test_placeholder_baseline_model_writes_nothing(monkeypatch):
+    d = FlakyDatabase(members_per_gym=5)
+    monkeypatch.setattr(db, "_supabase", d.fake)
+    assert scoring.get_model().baseline
+
+    with pytest.raises(RuntimeError, match="placeholder baseline"):
+        churn_sync.run_churn_sync()
+    response = TestClient(app).post("/api/churn-sync", headers=HEADERS)
+
+    assert response.status_code == 409
+    assert d.fake.calls == []
@@ -0,0 +1,89 @@
+from datetime import date
+import numpy as np
+import pytest
+from .. import db, drift
+from ..drift import GymFeatureStats, ks, psi
+from ..model_registry import FEATURE_COLUMNS
+from .fakes import FakeSupabase
+
+GYM_A = "00000000-0000-0000-0000-00000000000a"
+GYM_B = "00000000-0000-0000-0000-00000000000b"
+
+def test_streaming_stats_match_a_single_pass_and_stay_bounded():
+    rng = np.random.default_rng(1)
+    X = rng.normal(50, 10, size=(10_000, 3))
+    X[::97, 1] = np.nan
+    stats = GymFeatureStats(3, sketch_size=256, rng=rng)
+    for chunk in np.array_split(X, 37):
+        stats.add(chunk)
+
+    np.testing.assert_allclose(stats.mean, np.nanmean(X, axis=0))
+    np.testing.assert_allclose(stats.variance, np.nanvar(X, axis=0, ddof=1))
+    np.testing.assert_allclose(stats.min, np.nanmin(X, axis=0))
+    np.testing.assert_allclose(stats.max, np.nanmax(X, axis=0))
+    assert stats.nulls.tolist() == [0, len(X[::97]), 0]
+    assert stats.sample.shape == (256, 3)
+    # The reservoir is a uniform sample: its median lands near the true one
+    assert abs(np.median(stats.column_sample(0)) - np.median(X[:, 0])) < 2.5
+
+def test_psi_and_ks_separate_same_from_shifted():
+    rng = np.random.default_rng(2)
+    reference = rng.normal(0, 1, 5000)
+    quantiles = np.quantile(reference, drift.QUANTILE_POINTS)
+    edges = drift.reference_edges(quantiles)
+    fractions = np.bincount(np.searchsorted(edges, reference, side="right"), minlength=len(edges) + 1) / len(reference)
+
+    def counts(values):
+        return np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+
+    same, shifted = rng.normal(0, 1, 5000), rng.normal(0.8, 1, 5000)
+    assert psi(fractions, counts(same)) < 0.05 and ks(quantiles, same) < 0.05
+    assert psi(fractions, counts(shifted)) > 0.25 and ks(quantiles, shifted) > 0.2
+
+def _features(gym_id, n, age_shift=0, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        row = {c: int(rng.integers(0, 2)) for c in FEATURE_COLUMNS}
+        row.update(gym_id=gym_id, member_id=f"m{i:05d}", Age=float(rng.normal(30 + age_shift, 5)),
+                   Avg_class_frequency_total=float(rng.gamma(2, 1)))
+        rows.append(row)
+    return rows
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeSupabase({"model_monitor_reference": [], "model_monitor_feature_stats": [], "model_monitor_runs": []})
+    fake.features = []
+
+    def page(_db, params):
+        after = (params["p_after_gym_id"], params["p_after_member_id"])
+        rows = [r for r in fake.features if after[0] is None or (r["gym_id"], r["member_id"]) > after]
+        return rows[: params["p_limit"]]
+
+    fake.rpc_handlers["member_features_page"] = page
+    monkeypatch.setattr(db, "_supabase", fake)
+    monkeypatch.setattr(drift.settings, "DRIFT_MIN_MEMBERS", 100)
+    return fake
+
+def test_first_run_sets_baseline_then_drift_sets_run_status(fake_db):
+    fake_db.features = _features(GYM_A, 1500, seed=1) + _features(GYM_B, 1500, seed=2)
+    first = drift.run_drift_monitor(run_date=date(2026, 1, 1), chunk_size=400)
+
+    assert first["gyms"] == 2 and first["ok"] == 2
+    assert len(fake_db.tables["model_monitor_reference"]) == 2 * len(FEATURE_COLUMNS)
+    assert len(fake_db.tables["model_monitor_feature_stats"]) == 2 * len(FEATURE_COLUMNS)
+
+    # Gym A's members got older; gym B is a fresh draw from the same distribution
+    fake_db.features = _features(GYM_A, 1500, age_shift=6, seed=3) + _features(GYM_B, 1500, seed=4)
+    second = drift.run_drift_monitor(run_date=date(2026, 1, 2), chunk_size=400)
+
+    runs = {r["gym_id"]: r for r in fake_db.tables["model_monitor_runs"] if r["run_date"] == "2026-01-02"}
+    assert second["error"] == 1 and second["ok"] == 1
+    assert runs[GYM_A]["status"] == "error" and runs[GYM_A]["notes"].startswith("Drift: Age psi=")
+    assert runs[GYM_B]["status"] == "ok"
+
+    age = next(r for r in fake_db.tables["model_monitor_feature_stats"]
+               if r["gym_id"] == GYM_A and r["run_date"] == "2026-01-02" and r["feature_name"] == "Age")
+    assert age["mean_value"] == pytest.approx(36, abs=0.5)
+    assert age["psi"] > 0.25 and age["drift_status"] == "error"
+    assert sum(age["histogram"]["counts"]) == 1500
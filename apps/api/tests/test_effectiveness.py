@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from .. import db
+from ..app import app
+from ..settings import settings
+from .fakes import FakeSupabase
+from .pg import pg_test, seed_gym
+
+client = TestClient(app)
+HEADERS = {"X-API-KEY": settings.X_API_KEY or "test-api-key"}
+
+def test_effectiveness_is_one_rpc(monkeypatch):
+    seen = []
+    fake = FakeSupabase(rpc_handlers={
+        "measure_outreach_effectiveness": lambda _db, params: seen.append(params) or [{"outcome_count": 12, "day_count": 3}],
+    })
+    monkeypatch.setattr(db, "_supabase", fake)
+
+    response = client.post("/api/effectiveness/run?lookback_days=45", headers=HEADERS)
+
+    assert response.status_code == 200
+    assert response.json()["outcome_count"] == 12
+    assert seen == [{"p_lookback": "45 days"}]
+    assert fake.calls == [("measure_outreach_effectiveness", "rpc")]
+
+def test_effectiveness_requires_api_key():
+    assert client.post("/api/effectiveness/run").status_code == 401
+
+# --- measure_outreach_effectiveness (migration 028) against Postgres ---
+
+async def _contact(conn, gym_id, member_id, contacted_at):
+    return await conn.fetchval("""
+        insert into public.contacted_log (gym_id, member_id, channel, message_body, created_at)
+        values ($1, $2, 'sms', 'hi', $3) returning id""", gym_id, member_id, contacted_at)
+
+async def _scores(conn, gym_id, member_id, contacted_at, scores):
+    # scores: offset from the contact -> churn score
+    await conn.executemany(
+        "insert into public.member_score_history (gym_id, member_id, churn_score, score_date) values ($1, $2, $3, $4)",
+        [(gym_id, member_id, score, contacted_at + offset) for offset, score in scores.items()])
+
+async def _measure(conn):
+    await conn.execute("select * from public.measure_outreach_effectiveness(interval '30 days')")
+    # Each RPC call is its own transaction in production; its temp table goes at commit
+    await conn.execute("drop table measured_days")
+
+async def _outcomes(conn, gym_id):
+    rows = await conn.fetch("select * from public.outreach_outcomes where gym_id = $1", gym_id)
+    return {r["contacted_log_id"]: r for r in rows}
+
+async def _date(conn, at):
+    # Days are the database's, as in the function (contacted_at::date)
+    return await conn.fetchval("select $1::timestamptz::date", at)
+
+async def _daily(conn, gym_id, day):
+    return await conn.fetchrow(
+        "select * from public.gym_outreach_effectiveness_daily where gym_id = $1 and metric_date = $2", gym_id, day)
+
+@pg_test
+async def test_outcomes_use_last_score_before_and_last_within_7_days_after(conn):
+    gym_id = await seed_gym(conn)
+    other_gym = await seed_gym(conn, "Other Gym")
+    now = await conn.fetchval("select now()")
+    at = now - timedelta(days=10)
+
+    improved = await _contact(conn, gym_id, "m1", at)
+    await _scores(conn, gym_id, "m1", at, {
+        timedelta(days=-2): 80.0,
+        timedelta(hours=-1): 85.0,     # before: the latest at or before the contact
+        timedelta(hours=12): 40.0,     # under a day after: neither
+        timedelta(days=3): 78.0,
+        timedelta(days=6): 72.0,       # after: the latest 1-7 days out
+        timedelta(days=8): 10.0,       # past the window
+    })
+    await _scores(conn, other_gym, "m1", at, {timedelta(days=-1): 5.0, timedelta(days=2): 1.0})
+
+    # Both window edges are inclusive; a score at the contact's own time counts as before
+    edges = await _contact(conn, gym_id, "m2", now - timedelta(days=12))
+    await _scores(conn, gym_id, "m2", now - timedelta(days=12), {
+        timedelta(0): 50.0, timedelta(days=1): 52.0, timedelta(days=7): 48.0, timedelta(days=7, seconds=1): 1.0,
+    })
+
+    # No history after the contact: stored with nulls, not retried
+    unscored = await _contact(conn, gym_id, "m3", at)
+    await _scores(conn, gym_id, "m3", at, {timedelta(days=-1): 70.0})
+
+    # Window still open / outside the lookback: not measured
+    await _contact(conn, gym_id, "m4", now - timedelta(days=3))
+    await _contact(conn, gym_id, "m5", now - timedelta(days=40))
+
+    await _measure(conn)
+
+    outcomes = await _outcomes(conn, gym_id)
+    assert set(outcomes) == {improved, edges, unscored}
+    o = outcomes[improved]
+    assert (o["score_before"], o["score_after_7d"], o["delta_7d"], o["improved_7d"]) == (85.0, 72.0, -13.0, True)
+    o = outcomes[edges]
+    assert (o["score_before"], o["score_after_7d"], o["delta_7d"], o["improved_7d"]) == (50.0, 48.0, -2.0, False)
+    o = outcomes[unscored]
+    assert (o["score_before"], o["score_after_7d"], o["delta_7d"], o["improved_7d"]) == (70.0, None, None, False)
+
+    day = await _daily(conn, gym_id, await _date(conn, at))
+    assert (day["contacts_count"], day["measured_count"], day["avg_delta_7d"], day["improved_percent_7d"]) == (2, 1, -13.0, 100.0)
+
+@pg_test
+async def test_contacts_are_measured_once_and_only_touched_days_reaggregate(conn):
+    gym_id = await seed_gym(conn)
+    now = await conn.fetchval("select now()")
+    first_at, second_at = now - timedelta(days=10), now - timedelta(days=14)
+
+    first = await _contact(conn, gym_id, "m1", first_at)
+    await _scores(conn, gym_id, "m1", first_at, {timedelta(days=-1): 80.0, timedelta(days=2): 70.0})
+    unscored = await _contact(conn, gym_id, "m2", first_at)
+    await _contact(conn, gym_id, "m3", second_at)
+    await _measure(conn)
+
+    first_day, second_day = await _date(conn, first_at), await _date(conn, second_at)
+    assert (await _daily(conn, gym_id, second_day))["contacts_count"] == 1
+    # Marks the second day's row: a later run must leave it alone unless that day gets new outcomes
+    await conn.execute("""
+        update public.gym_outreach_effectiveness_daily set contacts_count = 99
+        where gym_id = $1 and metric_date = $2""", gym_id, second_day)
+
+    # History arriving late for an already-measured contact doesn't re-measure it
+    await _scores(conn, gym_id, "m2", first_at, {timedelta(days=-1): 60.0, timedelta(days=3): 30.0})
+    created = {k: o["created_at"] for k, o in (await _outcomes(conn, gym_id)).items()}
+    await _measure(conn)
+    outcomes = await _outcomes(conn, gym_id)
+    assert len(outcomes) == 3
+    assert outcomes[unscored]["delta_7d"] is None
+    assert {k: o["created_at"] for k, o in outcomes.items()} == created
+
+    # A new contact on the first day re-aggregates that day from all of its outcomes
+    await _contact(conn, gym_id, "m4", first_at)
+    await _scores(conn, gym_id, "m4", first_at, {timedelta(days=-1): 50.0, timedelta(days=5): 53.0})
+    await _measure(conn)
+
+    assert len(await _outcomes(conn, gym_id)) == 4
+    day = await _daily(conn, gym_id, first_day)
+    assert (day["contacts_count"], day["measured_count"]) == (3, 2)
+    assert day["avg_delta_7d"] == pytest.approx(-3.5)  # (-10 + 3) / 2
+    assert day["improved_percent_7d"] == pytest.approx(50.0)
+    assert (await _daily(conn, gym_id, second_day))["contacts_count"] == 99
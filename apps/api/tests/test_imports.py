@@ -0,0 +1,81 @@
+import asyncio
+from fastapi.testclient import TestClient
+from .. import db, imports
+from ..app import app
+from ..audit import audit_sink
+from ..dependencies import get_current_user_gym, UserContext
+from ..model_registry import FEATURE_COLUMNS
+from .fakes import FakeSupabase
+
+GYM = "gym-1"
+
+def _merge(fake, params):
+    # Mirrors merge_member_import (migration 029): first row per member_id wins
+    staged = [r for r in fake.tables.pop("member_import_staging", []) if r["import_job_id"] == params["p_job_id"]]
+    first, duplicates = {}, 0
+    for r in staged:
+        if r["member_id"] in first:
+            duplicates += 1
+        else:
+            first[r["member_id"]] = r
+    fake.tables.setdefault("members", []).extend(first.values())
+    return [{"imported_count": len(first), "duplicate_count": duplicates}]
+
+def _fake():
+    return FakeSupabase(rpc_handlers={"merge_member_import": _merge, "fail_member_import": lambda _db, _p: None})
+
+def test_rows_are_validated_in_chunks_and_only_invalid_rows_recorded(monkeypatch):
+    fake = _fake()
+    monkeypatch.setattr(db, "_supabase", fake)
+    rows = iter([
+        {"member_id": "m1", "first_name": "Ann", "last_name": "A", "phone": "", "email": "a@x.io", "last_churn_score": "12.5"},
+        {"member_id": "", "first_name": "No", "last_name": "Id", "phone": "", "email": ""},
+        {"member_id": "m2", "first_name": "Bob", "last_name": "B", "phone": "", "email": "", "last_churn_score": "140"},
+        {"member_id": "m3", "first_name": "Cy", "last_name": "C", "phone": "555", "email": ""},
+        {"member_id": "m1", "first_name": "Ann", "last_name": "Again", "phone": "", "email": ""},
+    ])
+    fake.tables["member_import_jobs"] = [{"id": "job-1", "status": "uploaded"}]
+
+    summary = asyncio.run(imports.run_member_import("job-1", GYM, "members", rows, chunk_size=2))
+
+    assert summary == {"job_id": "job-1", "rows_processed": 5, "rows_imported": 2, "rows_invalid": 3}
+    # 3 chunks -> 3 staging loads; invalid rows never reach staging
+    assert fake.calls_to("member_import_staging") == ["insert"] * 3
+    assert [r["member_id"] for r in fake.tables["members"]] == ["m1", "m3"]
+    assert fake.tables["members"][0]["last_churn_score"] == 12.5
+    assert [(r["row_number"], r["error_message"]) for r in fake.tables["member_import_rows"]] == [
+        (2, "Missing member_id"), (3, "last_churn_score must be between 0 and 100"),
+    ]
+    assert fake.tables["member_import_jobs"][0]["rows_processed"] == 5
+
+def test_feature_rows_must_be_numeric():
+    row = {c: "1" for c in FEATURE_COLUMNS}
+    row.update(member_id="m1", Avg_class_frequency_total="2.5")
+    record, error = imports.validate_row("member_features", row)
+    assert error is None and record["Age"] == 1 and record["Avg_class_frequency_total"] == 2.5
+
+    assert imports.validate_row("member_features", {**row, "Age": "1.5"})[1] == "Age must be a whole number"
+    assert imports.validate_row("member_features", {**row, "Month_3": ""})[1] == "Missing values: Month_3"
+
+def test_csv_upload_starts_a_job(monkeypatch):
+    fake = _fake()
+    monkeypatch.setattr(db, "_supabase", fake)
+    app.dependency_overrides[get_current_user_gym] = lambda: UserContext(user_id="u1", gym_id=GYM, email="", role="gym_owner")
+    body = "member_id,first_name,last_name,phone,email\nm1,Ann,A,,\nm2,Bob,B,,\n"
+    try:
+        client = TestClient(app)
+        response = client.post("/api/imports/csv?import_type=members", content=body, headers={"Content-Type": "text/csv"})
+        bad = client.post("/api/imports/csv?import_type=member_features", content=body, headers={"Content-Type": "text/csv"})
+    finally:
+        app.dependency_overrides.clear()
+    audit_sink.flush()
+
+    assert response.status_code == 202
+    job = fake.tables["member_import_jobs"][0]
+    assert response.json()["job_id"] == job["id"]
+    # The background import ran after the response
+    assert job["status"] == "validated" and job["rows_processed"] == 2
+    assert [r["member_id"] for r in fake.tables["members"]] == ["m1", "m2"]
+
+    assert bad.status_code == 400
+    assert "Missing columns" in bad.json()["detail"]
@@ -0,0 +1,81 @@
+from fastapi.testclient import TestClient
+from .. import db, members
+from ..app import app
+from ..dependencies import get_current_user_gym, UserContext
+from .fakes import FakeSupabase
+
+GYM = "gym-1"
+
+def _page(fake, params):
+    # Mirrors at_risk_members_page (migration 032): score desc, id desc, after the cursor
+    rows = sorted(
+        (m for m in fake.tables.get("members", []) if m["gym_id"] == params["p_gym_id"] and m["is_high_risk"]),
+        key=lambda m: (m["last_churn_score"], m["id"]), reverse=True,
+    )
+    if params["p_after_id"] is not None:
+        rows = [m for m in rows if (m["last_churn_score"], m["id"]) < (params["p_after_score"], params["p_after_id"])]
+    total = len(rows) if params["p_with_total"] else None
+    return [
+        {"id": m["id"], "member_id": m["member_id"], "last_churn_score": m["last_churn_score"], "total_count": total}
+        for m in rows[: params["p_limit"]]
+    ]
+
+def _client(monkeypatch, scores):
+    fake = FakeSupabase(
+        tables={"members": [
+            {"id": f"id-{i}", "gym_id": GYM, "member_id": f"m{i}", "last_churn_score": s, "is_high_risk": s >= 70}
+            for i, s in enumerate(scores)
+        ]},
+        rpc_handlers={"at_risk_members_page": _page},
+    )
+    monkeypatch.setattr(db, "_supabase", fake)
+    members.at_risk_cache.invalidate()
+    app.dependency_overrides[get_current_user_gym] = lambda: UserContext(user_id="u1", gym_id=GYM, email="", role="gym_owner")
+    return fake, TestClient(app)
+
+def test_pages_follow_the_cursor(monkeypatch):
+    fake, client = _client(monkeypatch, [91.0, 75.5, 40.0, 91.0, 88.0])
+    try:
+        first = client.get("/api/members/at-risk?limit=2").json()
+        second = client.get(f"/api/members/at-risk?limit=2&cursor={first['next_cursor']}").json()
+        bad = client.get("/api/members/at-risk?cursor=not-a-cursor")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [m["member_id"] for m in first["members"]] == ["m3", "m0"]
+    assert first["total_count"] == 4
+    assert [m["member_id"] for m in second["members"]] == ["m4", "m1"]
+    assert second["next_cursor"] is None and "total_count" not in second
+    assert "total_count" not in first["members"][0]
+    assert bad.status_code == 400
+
+def test_first_page_is_cached_until_the_gym_changes(monkeypatch):
+    fake, client = _client(monkeypatch, [91.0, 75.5])
+    try:
+        first = client.get("/api/members/at-risk")
+        again = client.get("/api/members/at-risk")
+        unchanged = client.get("/api/members/at-risk", headers={"If-None-Match": first.headers["ETag"]})
+        assert fake.calls_to("at_risk_members_page") == ["rpc"]
+
+        fake.tables["members"][0]["is_high_risk"] = False
+        members.at_risk_cache.invalidate([GYM])
+        changed = client.get("/api/members/at-risk", headers={"If-None-Match": first.headers["ETag"]})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert again.content == first.content
+    assert unchanged.status_code == 304 and unchanged.content == b""
+    assert changed.status_code == 200 and changed.headers["ETag"] != first.headers["ETag"]
+    assert [m["member_id"] for m in changed.json()["members"]] == ["m1"]
+    assert fake.calls_to("at_risk_members_page") == ["rpc", "rpc"]
+
+def test_a_page_read_before_an_invalidation_is_not_cached():
+    cache = members.FirstPageCache(max_size=10, ttl_seconds=30)
+    generation = cache.generation(GYM)
+    cache.invalidate([GYM])
+    cache.set(GYM, 50, '"stale"', b"{}", generation)
+    assert cache.get(GYM, 50) is None
+
+    cache.set(GYM, 50, '"fresh"', b"{}", cache.generation(GYM))
+    assert cache.get(GYM, 50) == ('"fresh"', b"{}")
+    assert cache.get(GYM, 20) is None
@@ -0,0 +1,50 @@
+from ..message_templates import compile_template, gsm7_septets, segments_for
+
+def test_renders_fields_with_fallbacks_and_keeps_literal_braces():
+    template = compile_template("Hi {{first_name}} {x} {{ nickname }}, {{gym_name}} misses you")
+
+    body, segments = template.render(template.values({"first_name": " Ana "}, None))
+
+    assert body == "Hi Ana {x} {{ nickname }}, your gym misses you"
+    assert segments == 1
+    assert template.unknown_fields == ["nickname"]
+
+def test_segment_boundaries():
+    assert segments_for("a" * 160) == 1
+    assert segments_for("a" * 161) == 2
+    assert segments_for("a" * 306) == 2
+    assert segments_for("a" * 307) == 3
+    # Extension characters take two septets
+    assert gsm7_septets("€[]") == 6
+    assert segments_for("a" * 158 + "€") == 1
+    assert segments_for("a" * 159 + "€") == 2
+    # One non-GSM character turns the whole message into UCS-2
+    assert segments_for("ë" * 70) == 1
+    assert segments_for("ë" + "a" * 70) == 2
+    assert segments_for("👋" * 35) == 1  # two UTF-16 units each
+    assert segments_for("👋" * 36) == 2
+
+def test_name_encoding_changes_the_rendered_segments():
+    template = compile_template("Hi {{first_name}}, " + "x" * 65)
+
+    _, ascii_segments = template.render(template.values({"first_name": "Zoe"}, "Gym"))
+    _, ucs2_segments = template.render(template.values({"first_name": "Zoë"}, "Gym"))
+
+    assert (ascii_segments, ucs2_segments) == (1, 2)
+
+def test_estimate_matches_rendering():
+    template = compile_template("{{first_name}} {{last_name}}: {{gym_name}} has a class for you" + "!" * 80)
+    members = [
+        {"member_id": "a", "first_name": "Ana", "last_name": "Li"},
+        {"member_id": "b", "first_name": "Zoë", "last_name": "O'Brien"},
+        {"member_id": "c", "first_name": "", "last_name": None},
+        {"member_id": "d", "first_name": "Maximilian-Alexander", "last_name": "Featherstonehaugh"},
+    ]
+
+    rendered = template.render_batch(members, "Iron Works")
+
+    for m in members:
+        first, last = (m["first_name"] or "").strip(), (m["last_name"] or "").strip()
+        lengths = {"first_name": len(first) or None, "last_name": len(last) or None}
+        gsm7 = gsm7_septets(first + last) is not None
+        assert template.estimate_segments(lengths, gsm7, "Iron Works") == rendered[m["member_id"]][1]
@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+import numpy as np
+import pytest
+from ..model_registry import FEATURE_COLUMNS, ModelRegistry
+from ..settings import settings
+
+def _artifact(path, version, intercept=-1.1):
+    with open(settings.CHURN_MODEL_PATH) as f:
+        artifact = json.load(f)
+    artifact.update(version=version, intercept=intercept)
+    path.write_text(json.dumps(artifact))
+    # Make the change visible to the mtime check even on coarse filesystem clocks
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1 + len(version)))
+
+def test_loads_once_and_model_is_immutable(tmp_path):
+    path = tmp_path / "churn_model.json"
+    _artifact(path, "v1")
+    registry = ModelRegistry(str(path), reload_interval=0)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.current())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(m) for m in results}) == 1
+    with pytest.raises(ValueError):
+        results[0].weights[0] = 1.0
+
+def test_changed_artifact_is_swapped_in_without_disturbing_pinned_callers(tmp_path):
+    path = tmp_path / "churn_model.json"
+    _artifact(path, "v1")
+    registry = ModelRegistry(str(path), reload_interval=0)
+    pinned = registry.current()
+
+    _artifact(path, "v2", intercept=2.0)
+    registry._run()  # one watcher poll
+
+    X = np.zeros((3, len(FEATURE_COLUMNS)))
+    assert registry.current().version == "v2"
+    assert pinned.version == "v1"
+    assert (registry.current().score(X) > pinned.score(X)).all()
+
+def test_bad_artifact_keeps_serving_current_model(tmp_path):
+    path = tmp_path / "churn_model.json"
+    _artifact(path, "v1")
+    registry = ModelRegistry(str(path), reload_interval=0)
+    registry.current()
+
+    path.write_text("{not json")
+    with pytest.raises(ValueError):
+        registry.reload()
+    assert registry.current().version == "v1"
+
+def test_start_warms_up_in_background(tmp_path):
+    path = tmp_path / "churn_model.json"
+    _artifact(path, "v1")
+    registry = ModelRegistry(str(path), reload_interval=0)
+
+    registry.start()
+    registry._thread.join(timeout=5)
+
+    assert registry.ready and registry.current().version == "v1"
@@ -0,0 +1,170 @@
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+from .. import db
+from ..app import app
+from ..settings import settings
+from .fakes import FakeSupabase
+from .pg import pg_test, seed_gym
+
+client = TestClient(app)
+HEADERS = {"X-API-KEY": settings.X_API_KEY or "test-api-key"}
+
+def test_partition_maintenance_is_one_rpc(monkeypatch):
+    seen = []
+    def maintain(_db, params):
+        seen.append(params)
+        return [{"table_name": "audit_logs", "created_count": 1, "archived_count": 1, "dropped_count": 0}]
+    fake = FakeSupabase(rpc_handlers={"maintain_partitions": maintain})
+    monkeypatch.setattr(db, "_supabase", fake)
+
+    response = client.post("/api/maintenance/partitions", headers=HEADERS)
+
+    assert response.status_code == 200
+    assert response.json()["tables"][0]["archived_count"] == 1
+    assert seen == [{"p_months_ahead": settings.PARTITION_MONTHS_AHEAD}]
+
+def test_partition_maintenance_requires_api_key():
+    assert client.post("/api/maintenance/partitions").status_code == 401
+
+# --- private.partition_by_month / maintain_partitions (migration 030) against Postgres ---
+
+TABLE = "partition_test_events"
+
+async def _month(conn, offset: int) -> date:
+    return await conn.fetchval("select (date_trunc('month', now()) + make_interval(months => $1))::date", offset)
+
+async def _partitions(conn, table: str = TABLE, schema: str = "partitions") -> list:
+    return [r["relname"] for r in await conn.fetch("""
+        select c.relname from pg_inherits i
+        join pg_class c on c.oid = i.inhrelid
+        where i.inhparent = $1::regclass and c.relnamespace = $2::regnamespace
+        order by 1""", f"public.{table}", schema)]
+
+def _name(month: date, table: str = TABLE) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+async def _seed_plain_table(conn, table: str = TABLE):
+    """
+    A plain event table shaped like the production ones: defaults, a check, a foreign key,
+    a secondary index, RLS with a policy and grants, plus rows across past months.
+    """
+    gym_id = await seed_gym(conn)
+    await conn.execute(f"""
+        create table public.{table} (
+          id uuid primary key default gen_random_uuid(),
+          gym_id uuid not null references public.gyms(id) on delete cascade,
+          kind text not null default 'event' check (kind <> ''),
+          created_at timestamptz not null default now()
+        );
+        create index {table}_gym_created_idx on public.{table} (gym_id, created_at desc);
+        alter table public.{table} enable row level security;
+        create policy "Test events: select own gym" on public.{table} for select to authenticated
+          using (gym_id = any ((select private.visible_gym_ids())::uuid[]));
+        grant select, insert on public.{table} to authenticated;""")
+    for offset in (-12, -3, -1, 0):
+        month = await _month(conn, offset)
+        await conn.executemany(f"insert into public.{table} (gym_id, created_at) values ($1, $2::date + $3::interval)",
+                               [(gym_id, month, timedelta(days=day)) for day in (0, 14)])
+    return gym_id
+
+@pg_test
+async def test_partition_by_month_converts_a_table_in_place(conn):
+    gym_id = await _seed_plain_table(conn)
+    rows = await conn.fetch(f"select * from public.{TABLE} order by created_at")
+
+    await conn.execute("select private.partition_by_month($1, 'created_at', 2)", TABLE)
+
+    assert await conn.fetchval("select count(*) from pg_partitioned_table where partrelid = $1::regclass", f"public.{TABLE}") == 1
+    assert await conn.fetchval("select to_regclass($1)", f"public.{TABLE}_unpartitioned") is None
+    # Every month from the oldest row through two ahead, plus the default
+    expected = [_name(await _month(conn, offset)) for offset in range(-12, 3)] + [f"{TABLE}_default"]
+    assert await _partitions(conn) == sorted(expected)
+
+    # Same rows, each in its month
+    assert await conn.fetch(f"select * from public.{TABLE} order by created_at") == rows
+    assert await conn.fetchval(f"select count(*) from partitions.{TABLE}_default") == 0
+    assert await conn.fetchval(f"select count(*) from partitions.{_name(await _month(conn, -3))}") == 2
+
+    # Defaults, check, foreign key, indexes
+    id_ = await conn.fetchval(f"insert into public.{TABLE} (gym_id) values ($1) returning id", gym_id)
+    assert await conn.fetchval(f"select kind from public.{TABLE} where id = $1", id_) == "event"
+    constraints = {r["contype"]: r["def"] for r in await conn.fetch(
+        "select contype::text, pg_get_constraintdef(oid) as def from pg_constraint where conrelid = $1::regclass", f"public.{TABLE}")}
+    assert constraints["p"] == "PRIMARY KEY (id, created_at)"
+    assert "REFERENCES gyms(id) ON DELETE CASCADE" in constraints["f"]
+    assert "kind <> ''" in constraints["c"]
+    indexes = [r["indexdef"] for r in await conn.fetch("select indexdef from pg_indexes where schemaname = 'public' and tablename = $1", TABLE)]
+    assert any(f"{TABLE}_gym_created_idx" in d and "(gym_id, created_at DESC)" in d for d in indexes)
+
+    # RLS, the policy and the grants carried over
+    assert await conn.fetchval("select relrowsecurity from pg_class where oid = $1::regclass", f"public.{TABLE}")
+    policy = await conn.fetchrow("select * from pg_policies where schemaname = 'public' and tablename = $1", TABLE)
+    assert (policy["policyname"], policy["cmd"], policy["roles"]) == ("Test events: select own gym", "SELECT", ["authenticated"])
+    assert "visible_gym_ids" in policy["qual"]
+    grants = {r["privilege_type"] for r in await conn.fetch("""
+        select privilege_type from information_schema.role_table_grants
+        where table_schema = 'public' and table_name = $1 and grantee = 'authenticated'""", TABLE)}
+    assert grants == {"SELECT", "INSERT"}
+
+    # Already partitioned: a no-op
+    await conn.execute("select private.partition_by_month($1, 'created_at', 2)", TABLE)
+    assert len(await _partitions(conn)) == len(expected)
+
+@pg_test
+async def test_production_event_tables_are_partitioned_with_their_policies(conn):
+    for table in ("member_score_history", "message_sends", "provider_webhook_events", "engagement_events", "audit_logs"):
+        assert await conn.fetchval("select count(*) from pg_partitioned_table where partrelid = $1::regclass", f"public.{table}") == 1
+        assert f"{table}_default" in await _partitions(conn, table)
+        assert await conn.fetchval("select to_regclass($1)", f"public.{table}_unpartitioned") is None
+    assert await conn.fetchval("select count(*) from pg_policies where schemaname = 'public' and tablename = 'audit_logs'") > 0
+
+@pg_test
+async def test_maintenance_creates_ahead_moves_default_rows_and_expires_old_months(conn):
+    gym_id = await _seed_plain_table(conn)
+    await conn.execute("select private.partition_by_month($1, 'created_at', 1)", TABLE)
+    # Rows for months without a partition land in the default: one ahead of the created months,
+    # one in a past month whose partition is gone
+    ahead = await _month(conn, 4)
+    await conn.execute(f"insert into public.{TABLE} (gym_id, created_at) values ($1, $2::date + interval '3 days')", gym_id, ahead)
+    await conn.execute(f"""
+        alter table public.{TABLE} detach partition partitions.{_name(await _month(conn, -12))};
+        drop table partitions.{_name(await _month(conn, -12))}""")
+    await conn.execute(f"insert into public.{TABLE} (gym_id, created_at) values ($1, $2)", gym_id, await _month(conn, -12))
+    assert await conn.fetchval(f"select count(*) from partitions.{TABLE}_default") == 2
+
+    await conn.execute("insert into public.partition_policies (table_name, partition_column, retention_months) values ($1, 'created_at', 2)", TABLE)
+    result = {r["table_name"]: r for r in await conn.fetch("select * from public.maintain_partitions(4)")}
+
+    # Months 2..4 ahead created; the row waiting in the default moved into its month
+    assert result[TABLE]["created_count"] == 3
+    assert await conn.fetchval(f"select count(*) from partitions.{_name(ahead)}") == 1
+    # Older than 2 months before this one: months -11..-3 dropped with their rows,
+    # and the expired row in the default purged. -2 and later are kept.
+    assert (result[TABLE]["dropped_count"], result[TABLE]["archived_count"]) == (9, 0)
+    assert await conn.fetchval(f"select count(*) from partitions.{TABLE}_default") == 0
+    partitions = await _partitions(conn)
+    assert _name(await _month(conn, -3)) not in partitions
+    assert _name(await _month(conn, -2)) in partitions
+    assert await conn.fetchval(f"select count(*) from public.{TABLE} where created_at >= $1", await _month(conn, -1)) == 5
+    assert await conn.fetchval(f"select count(*) from public.{TABLE} where created_at < $1", await _month(conn, -2)) == 0
+
+    # Nothing left to do on a second run
+    again = {r["table_name"]: r for r in await conn.fetch("select * from public.maintain_partitions(4)")}[TABLE]
+    assert (again["created_count"], again["dropped_count"]) == (0, 0)
+
+@pg_test
+async def test_archived_months_are_detached_with_their_rows(conn):
+    await _seed_plain_table(conn)
+    await conn.execute("select private.partition_by_month($1, 'created_at', 1)", TABLE)
+    await conn.execute("insert into public.partition_policies (table_name, partition_column, retention_months, archive) values ($1, 'created_at', 2, true)", TABLE)
+
+    result = {r["table_name"]: r for r in await conn.fetch("select * from public.maintain_partitions(1)")}[TABLE]
+
+    # Months -12..-3 moved to the archive schema, rows included
+    assert (result["archived_count"], result["dropped_count"]) == (10, 0)
+    for offset in (-12, -3):
+        name = _name(await _month(conn, offset))
+        assert await conn.fetchval(f"select count(*) from archive.{name}") == 2
+        assert name not in await _partitions(conn)
+    assert await conn.fetchval(f"select count(*) from public.{TABLE}") == 4
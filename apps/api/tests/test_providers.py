@@ -0,0 +1,85 @@
+import asyncio
+import json
+import httpx
+import pytest
+from .. import providers
+from ..retries import ProviderError
+
+def _twilio(handler):
+    provider = providers.TwilioSmsProvider("AC123", "token", "+15550001111", max_concurrency=2)
+    provider.client = httpx.AsyncClient(
+        base_url="https://api.twilio.com/2010-04-01/Accounts/AC123",
+        transport=httpx.MockTransport(handler),
+    )
+    return provider
+
+def test_twilio_send_returns_sid():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(201, json={"sid": "SM1", "status": "queued"})
+
+    result = asyncio.run(_twilio(handler).send_sms("+15550002222", "hi"))
+
+    assert result == {"provider_message_id": "SM1", "status": "queued"}
+    assert seen[0].url.path.endswith("/Accounts/AC123/Messages.json")
+    assert b"To=%2B15550002222" in seen[0].content
+
+def test_twilio_http_error_carries_status():
+    def handler(request):
+        return httpx.Response(429, json={"code": 20429, "message": "Too Many Requests"})
+
+    with pytest.raises(ProviderError) as exc:
+        asyncio.run(_twilio(handler).send_sms("+15550002222", "hi"))
+    assert exc.value.status_code == 429
+
+def test_sendgrid_bulk_is_one_request_of_personalizations():
+    seen = []
+
+    def handler(request):
+        seen.append(json.loads(request.content))
+        return httpx.Response(202, headers={"X-Message-Id": "batch-1"})
+
+    provider = providers.SendGridEmailProvider("key", "gym@example.com", max_concurrency=2)
+    provider.client = httpx.AsyncClient(base_url="https://api.sendgrid.com/v3", transport=httpx.MockTransport(handler))
+    recipients = [{"to": f"m{i}@example.com", "substitutions": {"-first_name-": f"M{i}"},
+                   "custom_args": {"gym_id": "g1", "member_id": f"m{i}"}} for i in range(3)]
+
+    result = asyncio.run(provider.send_bulk("Hi -first_name-", "Body", recipients))
+
+    assert result == {"provider_message_id": "batch-1", "status": "queued"}
+    assert len(seen) == 1
+    assert seen[0]["subject"] == "Hi -first_name-"
+    assert seen[0]["personalizations"][2] == {"to": [{"email": "m2@example.com"}], "substitutions": {"-first_name-": "M2"},
+                                              "custom_args": {"gym_id": "g1", "member_id": "m2"}}
+    with pytest.raises(ValueError):
+        asyncio.run(provider.send_bulk("s", "b", recipients * 334))
+
+def test_concurrency_is_bounded():
+    in_flight = peak = 0
+
+    class Probe(providers.SmsProvider):
+        async def _send_sms(self, to, body):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return {"provider_message_id": to, "status": "sent"}
+
+    async def run():
+        probe = Probe(max_concurrency=3)
+        await asyncio.gather(*[probe.send_sms(str(i), "hi") for i in range(20)])
+    asyncio.run(run())
+
+    assert peak == 3
+
+def test_fake_provider_injects_rate_limit_errors():
+    failing = providers.FakeSmsProvider(error_rate=1.0)
+    with pytest.raises(ProviderError) as exc:
+        asyncio.run(failing.send_sms("+15550002222", "hi"))
+    assert exc.value.status_code == 429
+
+    ok = asyncio.run(providers.FakeSmsProvider().send_sms("+15550002222", "hi"))
+    assert ok["status"] == "sent"
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import pytest
+from ..ratelimit import TokenBucket, LocalBucketStore, SendRateLimiter, RateLimitExceeded, GLOBAL_KEY, RECOVERY_PER_SECOND
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _limiter(clock, global_rate=10, global_burst=10, per_gym_rate=5):
+    async def fake_sleep(seconds):
+        clock.now += seconds
+    return SendRateLimiter(LocalBucketStore(clock), global_rate, global_burst, per_gym_rate, sleep=fake_sleep, clock=clock)
+
+def test_bucket_grants_burst_then_reports_wait():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, burst=5, clock=clock)
+
+    assert bucket.take(8) == (5, 0.1)
+    assert bucket.take(1) == (0, 0.1)
+
+    clock.now = 0.35
+    granted, _ = bucket.take(10)
+    assert granted == 3
+
+def test_set_rate_keeps_tokens_earned_at_old_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, burst=10, clock=clock)
+    bucket.take(10)
+
+    clock.now = 0.5
+    bucket.set_rate(2)
+    # 5 tokens earned at 10/s before the change, then 1 more at 2/s
+    clock.now = 1.0
+    assert bucket.take(10)[0] == 6
+
+def test_reserve_and_release_share_the_global_bucket():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+
+    assert limiter.reserve(50)[0] == 10
+    granted, wait = limiter.reserve(1)
+    assert granted == 0 and wait == pytest.approx(0.1)
+
+    limiter.release(4)
+    assert limiter.reserve(50)[0] == 4
+
+def test_admit_defers_rows_over_a_gyms_share():
+    clock = FakeClock()
+    limiter = _limiter(clock, global_rate=100, global_burst=100, per_gym_rate=5)
+    rows = [{"id": f"a{i}", "gym_id": "busy"} for i in range(8)] + [{"id": "b0", "gym_id": "quiet"}]
+
+    admitted, deferred = limiter.admit(rows)
+
+    assert [r["id"] for r in admitted] == ["a0", "a1", "a2", "a3", "a4", "b0"]
+    assert [r["id"] for r in deferred] == ["a5", "a6", "a7"]
+
+def test_acquire_paces_to_the_configured_rate():
+    clock = FakeClock()
+    limiter = _limiter(clock, global_rate=10, global_burst=1, per_gym_rate=100)
+
+    async def send_all():
+        for _ in range(21):
+            await limiter.acquire("gym-1", timeout=60)
+    asyncio.run(send_all())
+
+    # First send uses the burst token, the other 20 arrive at 10/s
+    assert clock.now == pytest.approx(2.0)
+
+def test_acquire_gives_up_after_timeout():
+    clock = FakeClock()
+    limiter = _limiter(clock, global_rate=100, global_burst=100, per_gym_rate=0.1)
+
+    async def run():
+        await limiter.acquire("gym-1")
+        await limiter.acquire("gym-1", timeout=5)
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(run())
+
+def test_429_halves_rate_and_successes_recover_over_time():
+    clock = FakeClock()
+    store = LocalBucketStore(clock)
+    limiter = SendRateLimiter(store, 20, 20, 10, clock=clock)
+
+    limiter.report(0, rate_limited=True)
+    # Bucket is drained and refills at half speed
+    assert limiter.reserve(1)[0] == 0
+    clock.now = 1.0
+    assert limiter.reserve(100)[0] == 10
+
+    # A big batch alone doesn't undo the halving; time spent sending does
+    limiter.report(500, rate_limited=False)
+    assert store.factors[GLOBAL_KEY] == pytest.approx(0.5 + RECOVERY_PER_SECOND)
+    clock.now = 30.0
+    limiter.report(1, rate_limited=False)
+    assert store.factors[GLOBAL_KEY] == 1.0
+
+def test_successes_are_reported_once_per_interval():
+    clock = FakeClock()
+    store = LocalBucketStore(clock)
+    adjusts = []
+    adjust = store.adjust
+    store.adjust = lambda *args: adjusts.append(args[3]) or adjust(*args)
+    limiter = SendRateLimiter(store, 20, 20, 10, clock=clock)
+
+    for i in range(100):
+        clock.now = i * 0.05
+        limiter.report(1, rate_limited=False)
+    limiter.report(0, rate_limited=True)
+
+    # 5s of single sends: one report per second, and the 429 right away
+    assert adjusts == [False] * 4 + [True]
+
+def test_blocking_store_calls_leave_the_event_loop():
+    clock = FakeClock()
+    store = LocalBucketStore(clock)
+    store.blocking = True
+    threads = []
+    take = store.take
+    store.take = lambda *args: threads.append(threading.get_ident()) or take(*args)
+    limiter = SendRateLimiter(store, 10, 10, 10, clock=clock)
+
+    asyncio.run(limiter.acquire("gym-1"))
+
+    assert len(threads) == 2 and threading.get_ident() not in threads
@@ -0,0 +1,41 @@
+from datetime import datetime
+from ..retries import ProviderError, backoff_seconds, failure_update, is_retryable
+
+def http_error(status_code):
+    return ProviderError(f"HTTP {status_code}", status_code=status_code)
+
+def test_retryable_classification():
+    assert is_retryable(http_error(429))
+    assert is_retryable(http_error(503))
+    assert not is_retryable(http_error(400))
+    assert is_retryable(Exception("Too Many Requests"))
+    assert is_retryable(Exception("Upstream returned HTTP 503"))
+    assert not is_retryable(Exception("Invalid 'To' phone number"))
+
+def test_phone_numbers_are_not_status_codes():
+    assert not is_retryable(Exception("The 'To' number +15005550001 is not a valid phone number"))
+    assert not is_retryable(Exception("Invalid number +14295551234"))
+    assert not is_retryable(Exception("Invalid number 429-555-1234"))
+
+def test_backoff_grows_and_is_capped():
+    for attempt in range(1, 8):
+        window = min(600, 10 * 2 ** (attempt - 1))
+        for _ in range(50):
+            delay = backoff_seconds(attempt, base=10, cap=600)
+            assert window / 2 <= delay <= window
+
+def test_failure_update_schedules_then_gives_up(monkeypatch):
+    from .. import retries
+    monkeypatch.setattr(retries.settings, "SEND_MAX_ATTEMPTS", 3)
+    now = datetime(2026, 1, 1)
+
+    first = failure_update(1, http_error(429), now)
+    assert first["final_status"] == "pending"
+    assert first["next_retry_at"] > now.isoformat()
+
+    last = failure_update(3, http_error(429), now)
+    assert last["final_status"] == "gave_up"
+    assert last["next_retry_at"] is None
+
+    permanent = failure_update(1, http_error(400), now)
+    assert permanent["final_status"] == "gave_up"
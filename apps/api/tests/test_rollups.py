@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from .. import db
+from ..app import app
+from ..model_registry import FEATURE_COLUMNS
+from ..settings import settings
+from .fakes import FakeSupabase
+from .pg import pg_test, seed_gym
+
+client = TestClient(app)
+HEADERS = {"X-API-KEY": settings.X_API_KEY or "test-api-key"}
+
+def test_daily_rollup_is_one_rpc_for_all_gyms(monkeypatch):
+    seen = []
+    fake = FakeSupabase(rpc_handlers={
+        "rollup_daily_metrics": lambda _db, params: seen.append(params) or [{"gym_count": 40, "feature_row_count": 1080}],
+    })
+    monkeypatch.setattr(db, "_supabase", fake)
+
+    response = client.post("/api/rollups/daily?metric_date=2026-01-29", headers=HEADERS)
+
+    assert response.status_code == 200
+    assert response.json()["gym_count"] == 40
+    assert seen == [{"p_metric_date": "2026-01-29"}]
+    assert fake.calls == [("rollup_daily_metrics", "rpc")]
+
+def test_daily_rollup_requires_api_key():
+    assert client.post("/api/rollups/daily").status_code == 401
+
+# --- rollup_daily_metrics (migration 026) against Postgres ---
+
+DAY = date(2026, 1, 29)
+COUNTS = ["high_risk_count", "contacted_last_1d_count", "sms_sent_count", "email_sent_count",
+          "sms_click_count", "email_open_count", "email_click_count"]
+
+async def _seed_day(conn, gym_id):
+    # Scores 10..100, four at or above the 70 high-risk line; two contacted on DAY, one the day before
+    await conn.execute("""
+        insert into public.members (gym_id, member_id, first_name, last_name, last_churn_score, last_contacted_at)
+        select $1, 'm' || i, 'F', 'L', i * 10.0,
+               case when i <= 2 then $2::date + interval '9 hours' when i = 3 then $2::date - interval '1 hour' end
+        from generate_series(1, 10) i""", gym_id, DAY)
+    await conn.execute("insert into public.members (gym_id, member_id, first_name, last_name) values ($1, 'unscored', 'F', 'L')", gym_id)
+    await conn.executemany("""
+        insert into public.message_sends (gym_id, member_id, channel, provider, status, created_at)
+        values ($1, 'm1', $2, 'test', $3, $4::date + $5::interval)""", [
+        (gym_id, "sms", "delivered", DAY, timedelta(hours=1)),
+        (gym_id, "sms", "sent", DAY, timedelta(hours=23)),
+        (gym_id, "sms", "failed", DAY, timedelta(hours=2)),          # failed attempts aren't sends
+        (gym_id, "email", "queued", DAY, timedelta(hours=3)),
+        (gym_id, "sms", "delivered", DAY, timedelta(hours=-1)),       # the day before
+        (gym_id, "sms", "delivered", DAY, timedelta(hours=24)),      # the day after
+    ])
+    await conn.executemany("""
+        insert into public.engagement_events (gym_id, member_id, channel, event_type, created_at)
+        values ($1, 'm1', $2, $3, $4::date + interval '12 hours')""", [
+        (gym_id, "sms", "click", DAY), (gym_id, "email", "open", DAY),
+        (gym_id, "email", "open", DAY), (gym_id, "email", "click", DAY),
+    ])
+    columns = ", ".join(f'"{c}"' for c in FEATURE_COLUMNS)
+    for member_id, age in (("m1", 20), ("m2", 30), ("m3", 40)):
+        values = [1.0 if c.startswith("Avg_") else (age if c == "Age" else 1) for c in FEATURE_COLUMNS]
+        placeholders = ", ".join(f"${i + 3}" for i in range(len(values)))
+        await conn.execute(f"insert into public.member_features (gym_id, member_id, {columns}) values ($1, $2, {placeholders})",
+                           gym_id, member_id, *values)
+
+async def _rollup(conn):
+    result = await conn.fetchrow("select * from public.rollup_daily_metrics($1)", DAY)
+    # Each RPC call is its own transaction in production; its temp tables go at commit
+    await conn.execute("drop table rollup_members, rollup_sends, rollup_engagement")
+    return result
+
+@pg_test
+async def test_rollup_metrics_score_and_feature_stats_per_gym(conn):
+    gym_id = await seed_gym(conn, "Busy Gym")
+    quiet_id = await seed_gym(conn, "Quiet Gym")
+    await _seed_day(conn, gym_id)
+
+    await _rollup(conn)
+
+    metrics = await conn.fetchrow("select * from public.gym_daily_metrics where gym_id = $1 and metric_date = $2", gym_id, DAY)
+    assert {k: metrics[k] for k in COUNTS} == {
+        "high_risk_count": 4, "contacted_last_1d_count": 2,
+        "sms_sent_count": 2, "email_sent_count": 1,
+        "sms_click_count": 1, "email_open_count": 2, "email_click_count": 1,
+    }
+    # A gym with nothing going on still gets its row of zeros
+    quiet = await conn.fetchrow("select * from public.gym_daily_metrics where gym_id = $1 and metric_date = $2", quiet_id, DAY)
+    assert [quiet[k] for k in COUNTS] == [0] * len(COUNTS)
+
+    stats = await conn.fetchrow("select * from public.model_monitor_score_stats where gym_id = $1 and run_date = $2", gym_id, DAY)
+    assert stats["count"] == 10  # the unscored member isn't counted
+    assert stats["mean_score"] == pytest.approx(55.0)
+    assert stats["p90_score"] == pytest.approx(91.0)  # percentile_cont over 10..100
+    assert stats["high_risk_count"] == 4
+
+    features = {r["feature_name"]: r for r in await conn.fetch(
+        "select * from public.model_monitor_feature_stats where gym_id = $1 and run_date = $2", gym_id, DAY)}
+    assert sorted(features) == sorted(FEATURE_COLUMNS)
+    age = features["Age"]
+    assert (age["count"], age["min_value"], age["max_value"], age["null_count"]) == (3, 20, 40, 0)
+    assert age["mean_value"] == pytest.approx(30.0)
+
+@pg_test
+async def test_rollup_rerun_overwrites_the_day(conn):
+    gym_id = await seed_gym(conn)
+    await _seed_day(conn, gym_id)
+    await _rollup(conn)
+
+    await conn.execute("update public.members set last_churn_score = 95 where gym_id = $1 and member_id = 'm1'", gym_id)
+    await conn.execute("delete from public.member_features where gym_id = $1 and member_id = 'm3'", gym_id)
+    await _rollup(conn)
+
+    counts = await conn.fetchrow("""
+        select (select count(*) from public.gym_daily_metrics where gym_id = $1 and metric_date = $2) as daily,
+               (select count(*) from public.model_monitor_score_stats where gym_id = $1 and run_date = $2) as scores,
+               (select count(*) from public.model_monitor_feature_stats where gym_id = $1 and run_date = $2) as features""",
+        gym_id, DAY)
+    assert dict(counts) == {"daily": 1, "scores": 1, "features": len(FEATURE_COLUMNS)}
+    assert await conn.fetchval(
+        "select high_risk_count from public.gym_daily_metrics where gym_id = $1 and metric_date = $2", gym_id, DAY) == 5
+    age = await conn.fetchrow(
+        "select count, max_value from public.model_monitor_feature_stats where gym_id = $1 and run_date = $2 and feature_name = 'Age'",
+        gym_id, DAY)
+    assert (age["count"], age["max_value"]) == (2, 30)
@@ -0,0 +1,65 @@
+import random
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from .. import scoring
+from ..app import app
+from ..settings import settings
+
+client = TestClient(app)
+HEADERS = {"X-API-KEY": settings.X_API_KEY or "test-api-key"}
+
+def _row(seed: int) -> dict:
+    rng = random.Random(seed)
+    row = {
+        "gym_id": "gym-1", "member_id": f"m{seed}",
+        "Gender": rng.randint(0, 1), "Near_Location": rng.randint(0, 1), "Partner": rng.randint(0, 1),
+        "Promo_friends": rng.randint(0, 1), "Phone": 1, "Age": rng.randint(18, 60),
+        "Lifetime_Tenure": rng.randint(0, 30), "Contract_period": rng.choice([1, 6, 12]),
+        "Month_to_end_contract": rng.randint(1, 12), "Group_visits": rng.randint(0, 1),
+        "Avg_class_frequency_total": rng.uniform(0, 4), "Avg_class_frequency_current_month": rng.uniform(0, 4),
+        "Avg_additional_charges_total": rng.uniform(0, 300), "Days_Since_Last_Visit": rng.randint(0, 60),
+    }
+    row.update({f"Month_{i}": rng.randint(0, 1) for i in range(1, 14)})
+    return row
+
+def test_batch_preserves_order_and_matches_single_rows():
+    rows = [_row(i) for i in range(50)]
+    batch = scoring.score_rows(rows)
+    single = [scoring.score_rows([row])[0] for row in rows]
+
+    assert batch.shape == (50,)
+    np.testing.assert_allclose(batch, single)
+    assert ((batch >= 0) & (batch <= 100)).all()
+
+def test_model_matches_unfolded_logistic_regression():
+    model = scoring.get_model()
+    X = scoring.to_matrix([_row(i) for i in range(10)])
+    logits = ((X - model.mean) / model.scale) @ model.coef + model.intercept
+    np.testing.assert_allclose(model.score(X), 100 / (1 + np.exp(-logits)))
+
+def test_missing_feature_names_the_row():
+    rows = [_row(0), _row(1)]
+    del rows[1]["Month_13"]
+    with pytest.raises(scoring.FeatureError, match="Row 1 .*Month_13"):
+        scoring.score_rows(rows)
+
+def test_score_endpoint_returns_n8n_shape():
+    row = _row(7)
+    response = client.post("/api/score", json=row, headers=HEADERS)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["churn_probability_score"] == pytest.approx(scoring.score_rows([row])[0])
+    assert body["is_high_risk"] == (body["churn_probability_score"] >= 70)
+
+def test_batch_endpoint():
+    rows = [_row(i) for i in range(20)]
+    response = client.post("/api/score/batch", json={"rows": rows}, headers=HEADERS)
+
+    assert response.status_code == 200
+    assert response.json()["scores"] == pytest.approx(scoring.score_rows(rows).tolist())
+
+    bad = client.post("/api/score/batch", json={"rows": [{"Age": 30}]}, headers=HEADERS)
+    assert bad.status_code == 422
+    assert client.post("/api/score/batch", json={"rows": rows}).status_code == 401
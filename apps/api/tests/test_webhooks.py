@@ -0,0 +1,100 @@
+import pytest
+from fastapi.testclient import TestClient
+from .. import db, phones, webhook_ingest, webhooks
+from ..app import app
+from ..webhook_ingest import WebhookIngestor
+from .fakes import FakeSupabase
+
+def _opt_out_phone(fake, params):
+    hits = [m for m in fake.tables["members"] if m["phone_e164"] == params["p_phone_e164"]]
+    for m in hits:
+        m["sms_opted_out"] = True
+    return [{"gym_id": m["gym_id"], "member_id": m["member_id"]} for m in hits]
+
+def _apply(fake, params):
+    applied = fake.tables.setdefault("applied_statuses", [])
+    applied.extend(params["p_updates"])
+    return len(params["p_updates"])
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeSupabase({}, rpc_handlers={"apply_message_status_updates": _apply, "opt_out_phone": _opt_out_phone})
+    monkeypatch.setattr(db, "_supabase", fake)
+    # Long interval: tests flush explicitly
+    ingestor = WebhookIngestor(max_pending=1000, batch_size=1000, flush_interval=60)
+    monkeypatch.setattr(webhook_ingest, "webhook_ingestor", ingestor)
+    monkeypatch.setattr(webhooks, "webhook_ingestor", ingestor)
+    return fake
+
+def test_status_callbacks_are_acked_then_coalesced(fake_db):
+    client = TestClient(app)
+    for sid, status in [("SM1", "queued"), ("SM1", "delivered"), ("SM1", "sent"), ("SM2", "sent"), ("SM2", "undelivered")]:
+        data = {"MessageSid": sid, "MessageStatus": status}
+        if status == "undelivered":
+            data["ErrorCode"] = "30003"
+        assert client.post("/api/webhooks/twilio/status", data=data).json() == {"status": "received"}
+
+    # Nothing written on the request path
+    assert fake_db.calls == []
+    webhook_ingest.webhook_ingestor.flush()
+
+    # Out-of-order "sent" doesn't undo "delivered"; one RPC for the whole batch
+    assert sorted(fake_db.tables["applied_statuses"], key=lambda u: u["provider_message_id"]) == [
+        {"provider_message_id": "SM1", "status": "delivered", "error_code": None},
+        {"provider_message_id": "SM2", "status": "undelivered", "error_code": "30003"},
+    ]
+    assert len(fake_db.tables["provider_webhook_events"]) == 5
+    assert fake_db.calls == [("provider_webhook_events", "insert"), ("apply_message_status_updates", "rpc")]
+
+def test_email_events_are_batched(fake_db):
+    events = [
+        {"event": "open", "gym_id": "gym-1", "member_id": "m1", "sg_message_id": "e1"},
+        {"event": "click", "gym_id": "gym-1", "member_id": "m2", "url": "https://gym.test", "sg_message_id": "e2"},
+        {"event": "delivered", "sg_message_id": "e3"},
+    ]
+    TestClient(app).post("/api/webhooks/email/events", json=events)
+    webhook_ingest.webhook_ingestor.flush()
+
+    assert [e["event_type"] for e in fake_db.tables["engagement_events"]] == ["open", "click"]
+    assert len(fake_db.tables["provider_webhook_events"]) == 3
+    assert fake_db.calls_to("engagement_events") == ["insert"]
+
+def test_full_buffer_flushes_on_the_request_path(fake_db):
+    ingestor = WebhookIngestor(max_pending=3, batch_size=1000, flush_interval=60)
+    for i in range(3):
+        ingestor.add_status({"provider": "twilio", "i": i}, f"SM{i}", "sent", None)
+
+    # Third event hit the cap and was applied right away instead of being dropped
+    assert len(fake_db.tables["applied_statuses"]) == 3
+    ingestor.close()
+
+def test_stop_opts_out_every_gym_by_normalized_number(fake_db):
+    # phone_e164 is what the migration 022 trigger derives from "(555) 010-1234" etc.
+    fake_db.tables["members"] = [
+        {"gym_id": "gym-1", "member_id": "m1", "phone_e164": "+15550101234", "sms_opted_out": False},
+        {"gym_id": "gym-2", "member_id": "m9", "phone_e164": "+15550101234", "sms_opted_out": False},
+        {"gym_id": "gym-1", "member_id": "m2", "phone_e164": "+15550109999", "sms_opted_out": False},
+    ]
+    client = TestClient(app)
+    client.post("/api/webhooks/twilio/inbound", data={"From": "+15550101234", "Body": " stop "})
+
+    assert [m["sms_opted_out"] for m in fake_db.tables["members"]] == [True, True, False]
+
+    # Re-imported with the same number: the next STOP opts the new row out too
+    fake_db.tables["members"].append({"gym_id": "gym-3", "member_id": "m5", "phone_e164": "+15550101234", "sms_opted_out": False})
+    client.post("/api/webhooks/twilio/inbound", data={"From": "+15550101234", "Body": "STOP"})
+
+    assert fake_db.tables["members"][-1]["sms_opted_out"] is True
+    assert fake_db.calls_to("opt_out_phone") == ["rpc", "rpc"]
+
+def test_normalize_e164():
+    cases = {
+        "(555) 010-1234": "+15550101234",
+        "1-555-010-1234": "+15550101234",
+        "+1 555 010 1234": "+15550101234",
+        "0044 20 7946 0018": "+442079460018",
+        "12345": None,
+        "": None,
+        None: None,
+    }
+    assert {raw: phones.normalize_e164(raw) for raw in cases} == cases
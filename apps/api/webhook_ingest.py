@@ -0,0 +1,137 @@
+"""
+Buffered webhook ingestion.
+
+Provider callbacks are acknowledged as soon as they are queued here; a background
+thread applies them in batches every WEBHOOK_FLUSH_INTERVAL_SECONDS (or sooner
+once WEBHOOK_BATCH_SIZE events are waiting):
+  - raw events       -> one provider_webhook_events insert
+  - status callbacks -> coalesced to the furthest-along status per message, then one
+                        apply_message_status_updates RPC (migration 021)
+  - email open/click -> one engagement_events insert
+
+Same delivery rules as audit.py: a full buffer is flushed by the caller (backpressure),
+and a failed write prints the affected events under [Webhook Lost] for replay.
+"""
+import atexit
+import json
+import threading
+from typing import Dict, List, Optional
+
+from .db import get_supabase
+from .settings import settings
+
+# Mirrors public.message_status_rank (migration 021): callbacks can arrive out of order
+STATUS_RANK = {
+    "accepted": 1, "scheduled": 1, "queued": 2, "sending": 3, "sent": 4,
+    "delivered": 5, "undelivered": 5, "failed": 5, "read": 6,
+}
+
+class WebhookIngestor:
+    def __init__(self, max_pending: int, batch_size: int, flush_interval: float):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Serializes flushes so batches are applied in arrival order
+        self._flush_lock = threading.Lock()
+        self._raw: List[dict] = []
+        self._statuses: Dict[str, dict] = {}
+        self._engagement: List[dict] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.received = 0
+        self.coalesced = 0
+
+    def _ensure_started(self):
+        # Started on first use, so every process (after fork) runs its own flusher
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="webhook-ingest", daemon=True)
+                self._thread.start()
+
+    def _after_add(self, pending: int):
+        if pending >= self.max_pending:
+            # Backpressure: this request pays for the flush rather than events being dropped
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wake.set()
+
+    def add_status(self, raw_event: dict, provider_message_id: str, status: str, error_code: Optional[str]):
+        self._ensure_started()
+        with self._lock:
+            self.received += 1
+            self._raw.append(raw_event)
+            current = self._statuses.get(provider_message_id)
+            if current is not None:
+                self.coalesced += 1
+            if current is None or STATUS_RANK.get(status, 0) >= STATUS_RANK.get(current["status"], 0):
+                self._statuses[provider_message_id] = {
+                    "provider_message_id": provider_message_id,
+                    "status": status,
+                    "error_code": error_code or (current or {}).get("error_code"),
+                }
+            pending = len(self._raw)
+        self._after_add(pending)
+
+    def add_events(self, raw_events: List[dict], engagement_events: List[dict]):
+        self._ensure_started()
+        with self._lock:
+            self.received += len(raw_events)
+            self._raw.extend(raw_events)
+            self._engagement.extend(engagement_events)
+            pending = len(self._raw)
+        self._after_add(pending)
+
+    def _write(self, label: str, rows: List[dict], write):
+        if not rows:
+            return
+        try:
+            write(rows)
+        except Exception as e:
+            print(f"[Webhook Error] Failed to write {len(rows)} {label}: {e}")
+            for row in rows:
+                print(f"[Webhook Lost] {label} {json.dumps(row, default=str)}")
+
+    def flush(self):
+        """
+        Applies everything queued so far. Safe to call from any thread.
+        """
+        with self._flush_lock:
+            with self._lock:
+                raw, self._raw = self._raw, []
+                statuses, self._statuses = list(self._statuses.values()), {}
+                engagement, self._engagement = self._engagement, []
+
+            supabase = get_supabase()
+            self._write("provider_webhook_events", raw,
+                        lambda rows: supabase.table("provider_webhook_events").insert(rows).execute())
+            self._write("status updates", statuses,
+                        lambda rows: supabase.rpc("apply_message_status_updates", {"p_updates": rows}).execute())
+            self._write("engagement_events", engagement,
+                        lambda rows: supabase.table("engagement_events").insert(rows).execute())
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """
+        Stops the flusher and applies whatever is still queued.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 10)
+            self._thread = None
+        self.flush()
+
+webhook_ingestor = WebhookIngestor(
+    settings.WEBHOOK_MAX_PENDING,
+    settings.WEBHOOK_BATCH_SIZE,
+    settings.WEBHOOK_FLUSH_INTERVAL_SECONDS,
+)
+atexit.register(webhook_ingestor.close)
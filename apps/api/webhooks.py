@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Request, HTTPException, Form
-from supabase import create_client, Client
-from .settings import Settings
+from fastapi import APIRouter, Request, HTTPException, Form, Depends
+from supabase import Client
+from .settings import settings
+from .db import get_supabase
+from .webhook_ingest import webhook_ingestor
+from .phones import normalize_e164
 from datetime import datetime
+from typing import Optional
 
 router = APIRouter()
-settings = Settings()
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
 
 # Twilio Inbound Webhook (STOP handling)
 @router.post("/webhooks/twilio/inbound")
 async def twilio_inbound(
     From: str = Form(...),
-    Body: str = Form(...)
+    Body: str = Form(...),
+    supabase: Client = Depends(get_supabase)
 ):
     # Log Raw Event
     try:
@@ -26,51 +29,35 @@ async def twilio_inbound(
 
     # Check for STOP keywords
     if Body.strip().upper() in ["STOP", "UNSUBSCRIBE", "CANCEL", "END", "QUIT"]:
-        # Find member by phone number and opt them out
-        # Note: Phone numbers can be tricky (formatting). Assuming exact match or doing a flexible search would be better.
-        # For this phase, we assume exact match or partial.
-        
-        # We need to find the member. Since phone implies uniqueness roughly in context or we block all members with that phone.
-        # Let's block all members with this phone number across all gyms (safe default for compliance).
-        try:
-            supabase.table("members").update({
-                "sms_opted_out": True, 
-                "sms_opted_out_at": datetime.now().isoformat()
-            }).eq("phone", From).execute()
-        except Exception as e:
-            print(f"Error handling STOP opt-out: {e}")
+        # Block every member with this number across all gyms (safe default for compliance).
+        # Matches on the normalized, indexed members.phone_e164 (migration 022), so
+        # "(555) 010-1234" on file still matches Twilio's "+15550101234".
+        # Every STOP is applied, repeats included: the number may belong to a member added since.
+        phone_e164 = normalize_e164(From)
+        if not phone_e164:
+            print(f"Error handling STOP opt-out: can't normalize {From!r}")
+        else:
+            try:
+                supabase.rpc("opt_out_phone", {"p_phone_e164": phone_e164}).execute()
+            except Exception as e:
+                print(f"Error handling STOP opt-out: {e}")
             
     return {"status": "received"}
 
 # Twilio Status Callback
+# Acknowledged immediately; applied in coalesced batches by webhook_ingest.py
 @router.post("/webhooks/twilio/status")
 async def twilio_status(
     MessageSid: str = Form(...),
     MessageStatus: str = Form(...),
     ErrorCode: str = Form(None)
 ):
-    try:
-        # Log Raw Event
-        try:
-            supabase.table("provider_webhook_events").insert({
-                "provider": "twilio",
-                "event_type": "status_callback",
-                "provider_message_id": MessageSid,
-                "payload": {"MessageSid": MessageSid, "MessageStatus": MessageStatus, "ErrorCode": ErrorCode},
-                "received_at": datetime.now().isoformat()
-            }).execute()
-        except Exception as e:
-            print(f"Error logging raw webhook: {e}")
-
-        update_data = {"status": MessageStatus, "updated_at": datetime.now().isoformat()}
-        if ErrorCode:
-            update_data["error_code"] = ErrorCode
-            
-        supabase.table("message_sends").update(update_data).eq("provider_message_id", MessageSid).execute()
-    except Exception as e:
-        print(f"Error processing Twilio status: {e}")
-        
-    return {"status": "updated"}
+    webhook_ingestor.add_status(
+        _raw_event("twilio", "status_callback", MessageSid,
+                   {"MessageSid": MessageSid, "MessageStatus": MessageStatus, "ErrorCode": ErrorCode}),
+        MessageSid, MessageStatus, ErrorCode
+    )
+    return {"status": "received"}
 
 # Email Event Webhook (SendGrid style stub)
 @router.post("/webhooks/email/events")
@@ -78,41 +65,34 @@ async def email_events(request: Request):
     events = await request.json()
     if not isinstance(events, list):
         events = [events]
-        
-    # Log Raw Events Batch
-    try:
-         supabase.table("provider_webhook_events").insert([{
-            "provider": "email_provider",
-            "event_type": event.get("event"),
-            "payload": event,
-            "received_at": datetime.now().isoformat()
-         } for event in events]).execute()
-    except Exception as e:
-        print(f"Error logging raw webhook: {e}")
-        
+
+    raw_events = []
+    engagement_events = []
     for event in events:
-        # Expected structure depends on provider. Assuming SendGrid-like:
-        # { email, event, gym_id (custom arg?), member_id (custom arg?) }
-        # Often custom args are passed in X-Headers or included in the event payload if we tagged the email.
-        # For this Phase, we stub the recording if we can identify the user.
-        # We will check for 'gym_id' and 'member_id' in custom_args.
-        
+        raw_events.append(_raw_event("email_provider", event.get("event"), event.get("sg_message_id"), event))
+
+        # SendGrid-style: custom args are flattened into each event. Campaign emails carry
+        # gym_id, member_id and message_send_id (campaigns._email_custom_args).
         event_type = event.get("event")
-        if event_type in ["open", "click"]:
-            gym_id = event.get("gym_id")
-            member_id = event.get("member_id")
-            
-            if gym_id and member_id:
-                try:
-                    supabase.table("engagement_events").insert({
-                        "gym_id": gym_id,
-                        "member_id": member_id,
-                        "channel": "email",
-                        "event_type": event_type,
-                        "url": event.get("url"),
-                        "created_at": datetime.now().isoformat()
-                    }).execute()
-                except Exception as e:
-                    print(f"Error logging email event: {e}")
+        if event_type in ["open", "click"] and event.get("gym_id") and event.get("member_id"):
+            engagement_events.append({
+                "gym_id": event["gym_id"],
+                "member_id": event["member_id"],
+                "channel": "email",
+                "event_type": event_type,
+                "url": event.get("url"),
+                "created_at": datetime.now().isoformat()
+            })
 
+    webhook_ingestor.add_events(raw_events, engagement_events)
     return {"status": "processed"}
+
+def _raw_event(provider: str, event_type: Optional[str], provider_message_id: Optional[str], payload: dict) -> dict:
+    # Same keys for every provider: raw events from both endpoints share one bulk insert
+    return {
+        "provider": provider,
+        "event_type": event_type,
+        "provider_message_id": provider_message_id,
+        "payload": payload,
+        "received_at": datetime.now().isoformat()
+    }
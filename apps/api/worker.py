@@ -0,0 +1,273 @@
+"""
+Campaign worker pool.
+
+Runs outside the web process and drains campaign_recipients through the
+lease-based queue from migration 017. Any number of processes (and containers)
+can run this at once: claim_campaign_recipients uses FOR UPDATE SKIP LOCKED, and
+rows whose lease expires (worker killed mid-batch) are re-claimed automatically.
+Each poll also drains message_sends rows whose next_retry_at has come due (migration 018).
+
+Sends are throttled by the shared token buckets in ratelimit.py (migration 019).
+Tokens are taken *before* claiming and a claim is never larger than the tokens in
+hand, so nothing waits on the limiter while holding a lease.
+Email recipients (migration 035) don't use SMS tokens: each poll claims up to one
+provider bulk request's worth (EMAIL_BATCH_SIZE) and sends them in that one request.
+Due retries are claimed per channel (migration 037), so email retries don't either.
+
+Usage:
+    python -m apps.api.worker --processes 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from .campaigns import (
+    process_recipients, process_email_recipients, process_due_retries, gym_name,
+    BATCH_SIZE, EMAIL_BATCH_SIZE, DEFAULT_MESSAGE_BODY, DEFAULT_EMAIL_SUBJECT,
+)
+from .message_templates import compile_template
+from .db import get_supabase, close_db
+from .ratelimit import sms_limiter
+from .providers import close_providers
+from .audit import audit_sink
+
+LEASE_SECONDS = 120
+IDLE_SLEEP_SECONDS = 2.0
+# Campaign rows kept per worker; only active campaigns are ever looked up, so this stays small
+CAMPAIGN_CACHE_SIZE = 256
+
+class CampaignWorker:
+    def __init__(self, worker_id: str, batch_size: int = BATCH_SIZE, lease_seconds: int = LEASE_SECONDS):
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.stopping = False
+        # How long to back off when a poll handled nothing (shorter when we're only waiting on tokens)
+        self.idle_wait = IDLE_SLEEP_SECONDS
+        # LRU of campaign_id -> campaigns row (gym_id, compiled template, gym name); bodies don't change once queued
+        self._campaigns: "OrderedDict[str, dict]" = OrderedDict()
+
+    def _campaign(self, campaign_id: str) -> dict:
+        if campaign_id in self._campaigns:
+            self._campaigns.move_to_end(campaign_id)
+            return self._campaigns[campaign_id]
+
+        supabase = get_supabase()
+        campaign = supabase.table("campaigns").select("id, gym_id, message_body, email_subject").eq("id", campaign_id).single().execute().data
+        # Compiled once per campaign, then rendered for every batch
+        campaign["template"] = compile_template(campaign.get("message_body") or DEFAULT_MESSAGE_BODY)
+        campaign["subject"] = compile_template(campaign.get("email_subject") or DEFAULT_EMAIL_SUBJECT)
+        campaign["gym_name"] = gym_name(supabase, campaign["gym_id"])
+        self._campaigns[campaign_id] = campaign
+        if len(self._campaigns) > CAMPAIGN_CACHE_SIZE:
+            self._campaigns.popitem(last=False)
+        return campaign
+
+    def claim(self, limit: int, channel: str = "sms") -> List[dict]:
+        res = get_supabase().rpc("claim_campaign_recipients", {
+            "p_worker_id": self.worker_id,
+            "p_limit": limit,
+            "p_lease_seconds": self.lease_seconds,
+            "p_channel": channel,
+        }).execute()
+        return res.data or []
+
+    def claim_retries(self, limit: int, channel: str = "sms") -> List[dict]:
+        res = get_supabase().rpc("claim_due_retries", {
+            "p_limit": limit,
+            "p_lease_seconds": self.lease_seconds,
+            "p_channel": channel,
+        }).execute()
+        return res.data or []
+
+    def _admit(self, rows: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """
+        Applies the per-gym buckets to rows already covered by global tokens.
+        Returns (send now, defer); deferred rows must go back to their queue.
+        """
+        admitted, deferred = sms_limiter.admit(rows)
+        if deferred:
+            sms_limiter.release(len(deferred))
+        return admitted, deferred
+
+    async def run_once(self) -> int:
+        """
+        Claims and processes one batch of recipients plus one batch of due retries per channel;
+        SMS batches are sized to the send tokens available. Returns the number of rows handled.
+        """
+        self.idle_wait = IDLE_SLEEP_SECONDS
+        sent = rate_limited = 0
+
+        # 1. Recipients: tokens first, then claim at most that many
+        granted, wait = sms_limiter.reserve(self.batch_size)
+        recipients = self.claim(granted) if granted else []
+        sms_limiter.release(granted - len(recipients))
+        recipients, deferred = self._admit(recipients)
+        if deferred:
+            # Out of per-gym tokens: hand the rows straight back instead of holding their lease
+            get_supabase().rpc("release_campaign_recipients", {"p_ids": [r["id"] for r in deferred]}).execute()
+
+        # A claim can span campaigns; each campaign has its own gym + body
+        for campaign_id, rows in _by_campaign(recipients).items():
+            campaign = self._campaign(campaign_id)
+            timings = await process_recipients(rows, campaign["gym_id"], campaign["template"], campaign["gym_name"])
+            sent += timings["sent"]
+            rate_limited += timings["rate_limited"]
+            print(
+                f"[Campaign Worker {self.worker_id}] {campaign_id}: {len(rows)} recipients | "
+                f"fetch {timings['fetch_ms']:.0f}ms, render {timings['render_ms']:.1f}ms, send {timings['send_ms']:.0f}ms, "
+                f"write {timings['write_ms']:.0f}ms, total {timings['total_ms']:.0f}ms"
+            )
+
+        # 2. Email recipients: bulk requests, no SMS tokens
+        emails = self.claim(EMAIL_BATCH_SIZE, channel="email")
+        for campaign_id, rows in _by_campaign(emails).items():
+            campaign = self._campaign(campaign_id)
+            timings = await process_email_recipients(rows, campaign["gym_id"], campaign["template"], campaign["subject"], campaign["gym_name"])
+            print(
+                f"[Campaign Worker {self.worker_id}] {campaign_id}: {len(rows)} emails in {timings['requests']} requests | "
+                f"fetch {timings['fetch_ms']:.0f}ms, send {timings['send_ms']:.0f}ms, "
+                f"write {timings['write_ms']:.0f}ms, total {timings['total_ms']:.0f}ms"
+            )
+
+        # 3. Due SMS retries, same token rules
+        granted, wait = sms_limiter.reserve(self.batch_size)
+        retries = self.claim_retries(granted) if granted else []
+        sms_limiter.release(granted - len(retries))
+        retries, deferred = self._admit(retries)
+        if deferred:
+            # Claiming pushed next_retry_at out by a lease; make them due again
+            get_supabase().table("message_sends")\
+                .update({"next_retry_at": datetime.now().isoformat()})\
+                .in_("id", [s["id"] for s in deferred])\
+                .execute()
+
+        if retries:
+            outcome = await process_due_retries(retries)
+            sent += outcome["sent"]
+            rate_limited += outcome["rate_limited"]
+            print(
+                f"[Campaign Worker {self.worker_id}] Retries: {outcome['sent']} sent, "
+                f"{outcome['rescheduled']} rescheduled, {outcome['gave_up']} gave up"
+            )
+
+        # 4. Due email retries: sent one by one, outside the SMS buckets
+        email_retries = self.claim_retries(self.batch_size, channel="email")
+        if email_retries:
+            outcome = await process_due_retries(email_retries)
+            print(
+                f"[Campaign Worker {self.worker_id}] Email retries: {outcome['sent']} sent, "
+                f"{outcome['rescheduled']} rescheduled, {outcome['gave_up']} gave up"
+            )
+
+        # 5. One adaptive-rate update per poll (SMS only)
+        sms_limiter.report(sent, rate_limited > 0)
+
+        # Marks campaigns running/completed (also completes re-triggered campaigns with nothing left)
+        get_supabase().rpc("refresh_campaign_statuses", {}).execute()
+
+        if not granted:
+            # Throttled rather than idle: come back as soon as the next token is due
+            self.idle_wait = min(IDLE_SLEEP_SECONDS, max(wait, 0.05))
+        return len(recipients) + len(emails) + len(retries) + len(email_retries)
+
+    async def run_forever(self):
+        print(f"[Campaign Worker {self.worker_id}] Started")
+        # Checked between batches, so a stop never abandons claimed rows mid-send
+        while not self.stopping:
+            try:
+                handled = await self.run_once()
+            except Exception as e:
+                # Leases make this safe: anything we claimed is re-claimable once it expires
+                print(f"[Campaign Worker {self.worker_id}] Error: {e}")
+                handled = 0
+            if not handled and not self.stopping:
+                await asyncio.sleep(self.idle_wait)
+        audit_sink.close()
+        await close_providers()
+        await close_db()
+        print(f"[Campaign Worker {self.worker_id}] Stopped")
+
+def _by_campaign(rows: List[dict]) -> Dict[str, List[dict]]:
+    by_campaign: Dict[str, List[dict]] = {}
+    for r in rows:
+        by_campaign.setdefault(r["campaign_id"], []).append(r)
+    return by_campaign
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _run_process():
+    worker = CampaignWorker(_worker_id())
+
+    def _stop(signum, frame):
+        worker.stopping = True
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    asyncio.run(worker.run_forever())
+
+def _shutdown(procs: List[multiprocessing.Process]):
+    """
+    Forwards the stop to every child and waits for them to finish their current batch.
+    Anything still running after a lease period is killed; its leases expire as usual.
+    """
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+    deadline = time.monotonic() + LEASE_SECONDS
+    for p in procs:
+        p.join(max(0.0, deadline - time.monotonic()))
+        if p.is_alive():
+            print(f"[Campaign Worker] Process {p.pid} did not stop in time, killing")
+            p.kill()
+            p.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="GymGuard campaign worker pool")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(os.environ.get("WORKER_PROCESSES", os.cpu_count() or 1)),
+        help="Worker processes to run in this container (default: WORKER_PROCESSES or CPU count)",
+    )
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _run_process()
+        return
+
+    procs = []
+    for _ in range(args.processes):
+        p = multiprocessing.Process(target=_run_process, daemon=True)
+        p.start()
+        procs.append(p)
+
+    # Container stops send SIGTERM to this process only; turn it into an orderly shutdown of the pool
+    stopping = []
+    def _stop(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    # Supervise: restart any process that dies so the pool stays at size
+    try:
+        while not stopping:
+            for i, p in enumerate(procs):
+                if not p.is_alive():
+                    print(f"[Campaign Worker] Process {p.pid} exited ({p.exitcode}), restarting")
+                    procs[i] = multiprocessing.Process(target=_run_process, daemon=True)
+                    procs[i].start()
+            time.sleep(1)
+    finally:
+        _shutdown(procs)
+
+if __name__ == "__main__":
+    main()
@@ -5,65 +5,73 @@ import { supabase } from '@/src/lib/supabaseClient';
 import Link from 'next/link';
 import { useParams } from 'next/navigation';
 
-interface Campaign {
+interface CampaignProgress {
     id: string;
     status: string;
     total_recipients: number;
-    created_at: string;
-}
-
-interface CampaignCounts {
-    queued: number;
-    sent: number;
-    failed: number;
-    skipped: number;
+    processed_count: number;
+    queued_count: number;
+    sent_count: number;
+    failed_count: number;
+    skipped_count: number;
+    retrying_count: number;
 }
 
 export default function CampaignProgressPage() {
     const params = useParams();
     const campaignId = params.id as string;
     
-    const [campaign, setCampaign] = useState<Campaign | null>(null);
-    const [counts, setCounts] = useState<CampaignCounts>({ queued: 0, sent: 0, failed: 0, skipped: 0 });
+    const [campaign, setCampaign] = useState<CampaignProgress | null>(null);
     const [loading, setLoading] = useState(true);
 
-    const fetchProgress = async () => {
+    useEffect(() => {
         if (!campaignId) return;
-        
-        // Fetch Campaign
-        const { data: c } = await supabase.from('campaigns').select('*').eq('id', campaignId).single();
-        if (c) setCampaign(c);
+        const controller = new AbortController();
 
-        // Fetch Counts
-        // Queued
-        const { count: queued } = await supabase.from('campaign_recipients').select('*', { count: 'exact', head: true }).eq('campaign_id', campaignId).eq('status', 'queued');
-        // Sent
-        const { count: sent } = await supabase.from('campaign_recipients').select('*', { count: 'exact', head: true }).eq('campaign_id', campaignId).eq('status', 'sent');
-        // Failed
-        const { count: failed } = await supabase.from('campaign_recipients').select('*', { count: 'exact', head: true }).eq('campaign_id', campaignId).eq('status', 'failed');
-        // Skipped
-        const { count: skipped } = await supabase.from('campaign_recipients').select('*', { count: 'exact', head: true }).eq('campaign_id', campaignId).eq('status', 'skipped_opted_out');
+        // Server-sent events from the API (counters kept by the workers). EventSource can't send
+        // the Authorization header, so the stream is read with fetch.
+        const streamProgress = async () => {
+            try {
+                const { data: { session } } = await supabase.auth.getSession();
+                if (!session) throw new Error("Not authenticated");
 
-        setCounts({
-            queued: queued || 0,
-            sent: sent || 0,
-            failed: failed || 0,
-            skipped: skipped || 0
-        });
-        setLoading(false);
-    };
+                const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/api/campaigns/${campaignId}/progress`, {
+                    headers: { 'Authorization': `Bearer ${session.access_token}` },
+                    signal: controller.signal
+                });
+                if (!response.ok || !response.body) throw new Error(`Progress stream failed (${response.status})`);
 
-    useEffect(() => {
-        fetchProgress();
-        const interval = setInterval(fetchProgress, 3000); // Poll every 3s
-        return () => clearInterval(interval);
+                const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += value;
+                    const events = buffer.split('\n\n');
+                    buffer = events.pop() || '';
+                    for (const event of events) {
+                        const data = event.split('\n').find(line => line.startsWith('data: '));
+                        if (!data) continue;  // keepalive comment
+                        setCampaign(JSON.parse(data.slice('data: '.length)));
+                        setLoading(false);
+                    }
+                }
+            } catch (error: any) {
+                if (error.name !== 'AbortError') console.error('Error streaming progress:', error.message);
+            } finally {
+                setLoading(false);
+            }
+        };
+
+        streamProgress();
+        return () => controller.abort();
     }, [campaignId]);
 
     if (loading) return <div className="p-8">Loading campaign...</div>;
     if (!campaign) return <div className="p-8">Campaign not found.</div>;
 
     const percentComplete = campaign.total_recipients > 0 
-        ? Math.round(((counts.sent + counts.failed + counts.skipped) / campaign.total_recipients) * 100)
+        ? Math.round((campaign.processed_count / campaign.total_recipients) * 100)
         : 0;
 
     return (
@@ -84,19 +92,19 @@ export default function CampaignProgressPage() {
 
                 <div className="grid grid-cols-2 gap-4">
                     <div className="bg-gray-100 p-4 rounded text-center">
-                        <span className="block text-2xl font-bold">{counts.queued}</span>
+                        <span className="block text-2xl font-bold">{campaign.queued_count}</span>
                         <span className="text-sm text-gray-500">Queued</span>
                     </div>
                     <div className="bg-green-100 p-4 rounded text-center">
-                        <span className="block text-2xl font-bold text-green-700">{counts.sent}</span>
+                        <span className="block text-2xl font-bold text-green-700">{campaign.sent_count}</span>
                         <span className="text-sm text-green-700">Sent</span>
                     </div>
                     <div className="bg-red-100 p-4 rounded text-center">
-                        <span className="block text-2xl font-bold text-red-700">{counts.failed}</span>
+                        <span className="block text-2xl font-bold text-red-700">{campaign.failed_count}</span>
                         <span className="text-sm text-red-700">Failed</span>
                     </div>
                     <div className="bg-yellow-100 p-4 rounded text-center">
-                        <span className="block text-2xl font-bold text-yellow-700">{counts.skipped}</span>
+                        <span className="block text-2xl font-bold text-yellow-700">{campaign.skipped_count}</span>
                         <span className="text-sm text-yellow-700">Skipped (Opt-out)</span>
                     </div>
                 </div>
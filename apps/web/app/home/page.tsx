@@ -6,7 +6,7 @@ import { useRouter } from 'next/navigation';
 import Link from 'next/link';
 import { Megaphone, RefreshCw } from 'lucide-react';
 
-// Update Member interface to match exact schema
+// Member as returned by GET /api/members/at-risk (projected columns only)
 interface Member {
   id: string;
   member_id: string;
@@ -14,17 +14,22 @@ interface Member {
   last_name: string;
   last_churn_score: number | null;
   last_score_date: string | null;
-  is_high_risk: boolean;
   last_contacted_at: string | null;
-  email?: string;
-  phone?: string;
-  gym_id: string;
   sms_opted_out: boolean;
 }
 
+interface AtRiskPage {
+  members: Member[];
+  next_cursor: string | null;
+  total_count?: number;
+}
+
 export default function HomePage() {
   const [members, setMembers] = useState<Member[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [totalCount, setTotalCount] = useState(0);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedMember, setSelectedMember] = useState<Member | null>(null);
   const [message, setMessage] = useState('');
   const [sending, setSending] = useState(false);
@@ -44,25 +49,30 @@ export default function HomePage() {
   }, [router]);
 
   // Fetch Logic
+  // The API filters (is_high_risk, not contacted in 24h), sorts by last_churn_score desc
+  // and pages with a cursor; the first page also carries the total.
+  const fetchPage = async (cursor: string | null): Promise<AtRiskPage> => {
+    const { data: { session } } = await supabase.auth.getSession();
+    if (!session) throw new Error("Not authenticated");
+
+    const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/api/members/at-risk${params}`, {
+        headers: { 'Authorization': `Bearer ${session.access_token}` }
+    });
+    if (!response.ok) {
+        const err = await response.json();
+        throw new Error(err.detail || "Failed to load members");
+    }
+    return response.json();
+  };
+
   const fetchMembers = async () => {
     try {
         setLoading(true);
-        // Requirement: filtered by is_high_risk=true
-        // Requirement: filtered by last_contacted_at is null or > 24h ago
-        // Requirement: sort by last_churn_score desc
-
-        // Calculate 24 hours ago
-        const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000).toISOString();
-
-        const { data, error } = await supabase
-            .from('members')
-            .select('*')
-            .eq('is_high_risk', true)
-            .or(`last_contacted_at.is.null,last_contacted_at.lt.${oneDayAgo}`)
-            .order('last_churn_score', { ascending: false });
-
-        if (error) throw error;
-        setMembers(data as Member[]);
+        const page = await fetchPage(null);
+        setMembers(page.members);
+        setNextCursor(page.next_cursor);
+        setTotalCount(page.total_count ?? page.members.length);
     } catch (error: any) {
         console.error('Error fetching members:', error.message);
     } finally {
@@ -70,6 +80,20 @@ export default function HomePage() {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+        setLoadingMore(true);
+        const page = await fetchPage(nextCursor);
+        setMembers(prev => [...prev, ...page.members]);
+        setNextCursor(page.next_cursor);
+    } catch (error: any) {
+        console.error('Error fetching members:', error.message);
+    } finally {
+        setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchMembers();
   }, []);
@@ -110,6 +134,7 @@ export default function HomePage() {
 
         // Optimistic UI update: Remove member from list
         setMembers(members.filter(m => m.id !== selectedMember.id));
+        setTotalCount(count => Math.max(count - 1, 0));
         setSelectedMember(null);
 
     } catch (error: any) {
@@ -138,7 +163,8 @@ export default function HomePage() {
                     'Authorization': `Bearer ${session.access_token}`
                 },
                 body: JSON.stringify({
-                    message_body: "Hi from Gym! Checking in. Reply STOP to unsubscribe." // Default template
+                    // Personalized per member by the workers (apps/api/message_templates.py)
+                    message_body: "Hi {{first_name}}, checking in from {{gym_name}}! Reply STOP to unsubscribe."
                 })
            });
 
@@ -185,7 +211,7 @@ export default function HomePage() {
       return 'No action needed.';
   };
 
-  const eligibleCount = members.length; // Approximate, API will re-verify.
+  const eligibleCount = totalCount; // Approximate, API will re-verify.
 
   // Fetch Role
   const [role, setRole] = useState<string>('gym_owner');
@@ -256,6 +282,15 @@ export default function HomePage() {
                     </div>
                 ))}
                 {members.length === 0 && <p className="text-gray-500">No high-risk members found requiring contact.</p>}
+                {nextCursor && (
+                    <button
+                        onClick={loadMore}
+                        disabled={loadingMore}
+                        className="w-full p-2 border rounded bg-white hover:bg-gray-50 disabled:opacity-50"
+                    >
+                        {loadingMore ? 'Loading...' : `Load more (${members.length} of ${totalCount})`}
+                    </button>
+                )}
             </div>
         )}
 
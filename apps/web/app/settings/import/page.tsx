@@ -16,6 +16,8 @@ const FEATURE_COLUMNS = [
     'Month_8', 'Month_9', 'Month_10', 'Month_11', 'Month_12', 'Month_13'
 ];
 
+const PREVIEW_ROWS = 200;
+
 export default function ImportPage() {
     const [activeTab, setActiveTab] = useState<'csv' | 'sheets'>('csv');
     const [importType, setImportType] = useState<'members' | 'member_features'>('members');
@@ -79,9 +81,11 @@ export default function ImportPage() {
     };
 
     const parseFile = (file: File) => {
+        // Preview only: the API validates the whole file while it streams it in
         Papa.parse(file, {
             header: true,
             skipEmptyLines: true,
+            preview: PREVIEW_ROWS,
             complete: (results) => {
                 validateRows(results.data);
             }
@@ -120,60 +124,38 @@ export default function ImportPage() {
         try {
             const { data: { session } } = await supabase.auth.getSession();
             if (!session) throw new Error("Not authenticated");
-            const { data: profile } = await supabase.from('profiles').select('gym_id').eq('user_id', session.user.id).single();
-            const gymId = profile?.gym_id;
-            if (!gymId) throw new Error("No gym profile");
-
-            // 1. Create Job
-            const { data: job, error: jobError } = await supabase.from('member_import_jobs').insert({
-                gym_id: gymId,
-                created_by_user_id: session.user.id,
-                source_type: 'csv',
-                import_type: importType,
-                status: 'uploaded'
-            }).select().single();
 
-            if (jobError) throw jobError;
-
-            // 2. Insert Staging
-            const validRows = preview.filter(r => r._isValid);
-            const stagingPayload = preview.map((r, i) => ({
-                gym_id: gymId,
-                import_job_id: job.id,
-                row_number: i + 1,
-                raw_row: r,
-                is_valid: r._isValid,
-                error_message: r._error
-            }));
-            await supabase.from('member_import_rows').insert(stagingPayload);
+            // 1. Stream the file to the API (it creates the job and validates every row)
+            const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+            const response = await fetch(`${apiUrl}/api/imports/csv?import_type=${importType}`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'text/csv',
+                    'Authorization': `Bearer ${session.access_token}`
+                },
+                body: file
+            });
+            if (!response.ok) {
+                const err = await response.json();
+                throw new Error(err.detail || "Import failed to start");
+            }
+            const { job_id } = await response.json();
 
-            // 3. Upsert Real Data
+            // 2. Follow the job until it finishes
             setStatusMessage("Importing data...");
-             if (importType === 'members') {
-                const upsertPayload = validRows.map(r => ({
-                    gym_id: gymId,
-                    member_id: r.member_id,
-                    first_name: r.first_name,
-                    last_name: r.last_name,
-                    phone: r.phone,
-                    email: r.email,
-                    is_high_risk: false
-                }));
-                const { error } = await supabase.from('members').upsert(upsertPayload, { onConflict: 'gym_id,member_id' });
-                if (error) throw error;
-            } else {
-                const upsertPayload = validRows.map(r => {
-                    const clean: any = { gym_id: gymId, member_id: r.member_id };
-                    FEATURE_COLUMNS.slice(1).forEach(col => clean[col.toLowerCase()] = r[col]);
-                    return clean;
-                });
-                const { error } = await supabase.from('member_features').upsert(upsertPayload, { onConflict: 'gym_id,member_id' });
-                 if (error) throw error;
+            let job: any = null;
+            while (!job || !['imported', 'failed'].includes(job.status)) {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                const { data } = await supabase.from('member_import_jobs')
+                    .select('status, rows_processed, rows_imported, rows_invalid, error_summary')
+                    .eq('id', job_id)
+                    .single();
+                job = data;
+                if (job?.status === 'uploaded') setStatusMessage(`Validated ${job.rows_processed} rows...`);
             }
+            if (job.status === 'failed') throw new Error(job.error_summary || "Import failed");
 
-            // 4. Update Job
-            await supabase.from('member_import_jobs').update({ status: 'imported' }).eq('id', job.id);
-            setStatusMessage(`Successfully imported ${validCount} rows!`);
+            setStatusMessage(`Successfully imported ${job.rows_imported} rows! (${job.rows_invalid} invalid)`);
             setFile(null);
             setPreview([]);
 
@@ -313,7 +295,7 @@ export default function ImportPage() {
                             {file && (
                                 <div>
                                     <div className="flex justify-between items-center mb-4">
-                                        <h2 className="text-lg font-bold">Preview</h2>
+                                        <h2 className="text-lg font-bold">Preview <span className="text-sm font-normal text-gray-500">(first {PREVIEW_ROWS} rows)</span></h2>
                                         <div className="text-sm">
                                             <span className="text-green-600 font-bold mr-4">Valid: {validCount}</span>
                                             <span className="text-red-600 font-bold">Invalid: {errorCount}</span>
@@ -354,7 +336,7 @@ export default function ImportPage() {
                                             disabled={validCount === 0 || isProcessing}
                                             className="bg-blue-600 text-white px-6 py-2 rounded hover:bg-blue-700 disabled:opacity-50"
                                         >
-                                            {isProcessing ? 'Importing...' : `Import ${validCount} Valid Rows`}
+                                            {isProcessing ? 'Importing...' : 'Import File'}
                                         </button>
                                     </div>
                                 </div>
@@ -0,0 +1,93 @@
+-- supabase/migrations/017_campaign_job_queue.sql
+
+-- Durable campaign queue: workers claim campaign_recipients rows with a lease
+-- instead of running inside the web process (FastAPI BackgroundTasks).
+-- Campaign status: draft -> queued -> running -> completed
+
+-- 1) Store the body on the campaign so any worker (or a restarted one) can send it
+alter table public.campaigns
+add column if not exists message_body text null;
+
+-- 2) Lease columns on recipients
+-- status 'sending' = claimed by a worker; the claim is only valid until lease_expires_at
+alter table public.campaign_recipients
+add column if not exists claimed_by text null,
+add column if not exists lease_expires_at timestamptz null;
+
+-- Only the claimable slice of the table is indexed (queued rows + in-flight leases)
+create index if not exists campaign_recipients_claimable_idx
+on public.campaign_recipients (campaign_id, created_at)
+where status in ('queued', 'sending');
+
+create index if not exists campaigns_active_idx
+on public.campaigns (created_at)
+where status in ('queued', 'running');
+
+-- 3) Claim a batch of recipients
+-- FOR UPDATE SKIP LOCKED lets any number of workers (processes or containers) call this
+-- concurrently without ever handing the same row to two of them.
+-- Rows whose lease expired (worker crashed mid-batch) are claimable again automatically.
+create or replace function public.claim_campaign_recipients(
+  p_worker_id text,
+  p_limit int default 50,
+  p_lease_seconds int default 120,
+  p_channel text default 'sms'
+)
+returns setof public.campaign_recipients
+language plpgsql
+set search_path = public
+as $$
+begin
+  return query
+  with candidates as (
+    select cr.id
+    from public.campaign_recipients cr
+    join public.campaigns c on c.id = cr.campaign_id
+    where c.status in ('queued', 'running')
+      and cr.channel = p_channel
+      and (
+        cr.status = 'queued'
+        or (cr.status = 'sending' and cr.lease_expires_at < now())
+      )
+    order by cr.created_at
+    limit p_limit
+    for update of cr skip locked
+  )
+  update public.campaign_recipients cr
+  set status = 'sending',
+      claimed_by = p_worker_id,
+      lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+      updated_at = now()
+  from candidates
+  where cr.id = candidates.id
+  returning cr.*;
+end;
+$$;
+
+-- 4) Flip campaigns between queued/running/completed based on their recipients
+-- Called by workers after each poll; cheap thanks to campaign_recipients_claimable_idx.
+create or replace function public.refresh_campaign_statuses()
+returns void
+language sql
+set search_path = public
+as $$
+  update public.campaigns c
+  set status = 'running', updated_at = now()
+  where c.status = 'queued'
+    and exists (
+      select 1 from public.campaign_recipients cr
+      where cr.campaign_id = c.id and cr.status = 'sending'
+    );
+
+  update public.campaigns c
+  set status = 'completed', updated_at = now()
+  where c.status in ('queued', 'running')
+    and not exists (
+      select 1 from public.campaign_recipients cr
+      where cr.campaign_id = c.id and cr.status in ('queued', 'sending')
+    );
+$$;
+
+-- Workers use the service role; nobody else should be able to claim rows.
+revoke execute on function public.claim_campaign_recipients(text, int, int, text) from public, anon, authenticated;
+revoke execute on function public.refresh_campaign_statuses() from public, anon, authenticated;
@@ -0,0 +1,73 @@
+-- supabase/migrations/018_message_retries.sql
+
+-- Retry scheduling on top of the columns added in 007_reliability.sql
+-- (attempt_count, next_retry_at, final_status, last_error + message_sends_retry_idx).
+-- A failed send with final_status = 'pending' and next_retry_at set is waiting for a retry;
+-- final_status becomes 'sent' or 'gave_up' once it resolves.
+
+-- 1) What a retry needs to re-send without going back to the campaign
+alter table public.message_sends
+add column if not exists message_body text null,
+add column if not exists campaign_recipient_id uuid null references public.campaign_recipients(id) on delete set null;
+
+-- 2) Claim due retries
+-- Pushing next_retry_at forward by the lease doubles as the lock: a crashed worker's rows
+-- simply come due again once the lease passes. Walks message_sends_retry_idx (partial index).
+create or replace function public.claim_due_retries(
+  p_limit int default 50,
+  p_lease_seconds int default 120
+)
+returns setof public.message_sends
+language plpgsql
+set search_path = public
+as $$
+begin
+  return query
+  with due as (
+    select ms.id
+    from public.message_sends ms
+    where ms.next_retry_at is not null
+      and ms.next_retry_at <= now()
+    order by ms.next_retry_at
+    limit p_limit
+    for update skip locked
+  )
+  update public.message_sends ms
+  set next_retry_at = now() + make_interval(secs => p_lease_seconds),
+      updated_at = now()
+  from due
+  where ms.id = due.id
+  returning ms.*;
+end;
+$$;
+
+-- 3) Campaigns aren't complete while recipients are waiting on a retry
+create or replace function public.refresh_campaign_statuses()
+returns void
+language sql
+set search_path = public
+as $$
+  update public.campaigns c
+  set status = 'running', updated_at = now()
+  where c.status = 'queued'
+    and exists (
+      select 1 from public.campaign_recipients cr
+      where cr.campaign_id = c.id and cr.status = 'sending'
+    );
+
+  update public.campaigns c
+  set status = 'completed', updated_at = now()
+  where c.status in ('queued', 'running')
+    and not exists (
+      select 1 from public.campaign_recipients cr
+      where cr.campaign_id = c.id and cr.status in ('queued', 'sending', 'retrying')
+    );
+$$;
+
+drop index if exists public.campaign_recipients_claimable_idx;
+create index if not exists campaign_recipients_claimable_idx
+on public.campaign_recipients (campaign_id, created_at)
+where status in ('queued', 'sending', 'retrying');
+
+revoke execute on function public.claim_due_retries(int, int) from public, anon, authenticated;
+revoke execute on function public.refresh_campaign_statuses() from public, anon, authenticated;
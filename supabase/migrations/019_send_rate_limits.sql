@@ -0,0 +1,204 @@
+-- supabase/migrations/019_send_rate_limits.sql
+
+-- Shared token buckets for provider sends.
+-- One row per bucket ('sms:global' for the provider account, 'sms:gym:<id>' per gym).
+-- The API process, every worker process and every container take tokens from the same rows,
+-- so together they can never exceed the account limit.
+-- Rates/bursts are passed in by the caller (settings), the table only holds state.
+
+create table if not exists public.send_rate_buckets (
+  key text primary key,
+  tokens double precision not null,
+  -- Adaptive slow-down: effective rate = configured rate * rate_factor (1.0 = full speed)
+  rate_factor double precision not null default 1.0,
+  updated_at timestamptz not null default clock_timestamp()
+);
+
+-- Service role only (no policies)
+alter table public.send_rate_buckets enable row level security;
+
+-- Refill a bucket up to now and lock its row. Used by the functions below.
+create or replace function private.settle_send_bucket(p_key text, p_rate double precision, p_burst double precision)
+returns public.send_rate_buckets
+language plpgsql
+set search_path = public
+as $$
+declare
+  b public.send_rate_buckets;
+  v_now timestamptz := clock_timestamp();
+begin
+  insert into public.send_rate_buckets (key, tokens, updated_at)
+  values (p_key, p_burst, v_now)
+  on conflict (key) do nothing;
+
+  select * into b from public.send_rate_buckets where key = p_key for update;
+
+  b.tokens := least(p_burst, b.tokens + extract(epoch from (v_now - b.updated_at)) * p_rate * b.rate_factor);
+  b.updated_at := v_now;
+  return b;
+end;
+$$;
+
+-- Take up to p_requested tokens without waiting.
+-- Returns how many were granted and how long until the next token is available.
+create or replace function public.take_send_tokens(
+  p_key text,
+  p_rate double precision,
+  p_burst double precision,
+  p_requested int
+)
+returns table (granted int, wait_seconds double precision)
+language plpgsql
+set search_path = public
+as $$
+declare
+  b public.send_rate_buckets;
+begin
+  b := private.settle_send_bucket(p_key, p_rate, p_burst);
+
+  granted := greatest(0, least(p_requested, floor(b.tokens + 1e-9)::int));
+  b.tokens := b.tokens - granted;
+
+  update public.send_rate_buckets
+  set tokens = b.tokens, updated_at = b.updated_at
+  where key = p_key;
+
+  wait_seconds := case when b.tokens >= 1 then 0 else (1 - b.tokens) / (p_rate * b.rate_factor) end;
+  return next;
+end;
+$$;
+
+-- Hand back tokens that were taken but not used (e.g. the queue had fewer rows than granted).
+create or replace function public.return_send_tokens(
+  p_key text,
+  p_rate double precision,
+  p_burst double precision,
+  p_count int
+)
+returns void
+language plpgsql
+set search_path = public
+as $$
+declare
+  b public.send_rate_buckets;
+begin
+  b := private.settle_send_bucket(p_key, p_rate, p_burst);
+
+  update public.send_rate_buckets
+  set tokens = least(p_burst, b.tokens + p_count), updated_at = b.updated_at
+  where key = p_key;
+end;
+$$;
+
+-- AIMD on the shared rate: a provider 429 halves it (and drains the bucket) for everyone,
+-- successful sends step it back toward the configured ceiling.
+create or replace function public.adjust_send_rate(
+  p_key text,
+  p_rate double precision,
+  p_burst double precision,
+  p_rate_limited boolean,
+  p_successes int,
+  p_min_factor double precision default 0.05,
+  p_step double precision default 0.02
+)
+returns double precision
+language plpgsql
+set search_path = public
+as $$
+declare
+  b public.send_rate_buckets;
+begin
+  b := private.settle_send_bucket(p_key, p_rate, p_burst);
+
+  if p_rate_limited then
+    b.rate_factor := greatest(p_min_factor, b.rate_factor / 2);
+    b.tokens := least(b.tokens, 0);
+  else
+    b.rate_factor := least(1.0, b.rate_factor + p_successes * p_step);
+  end if;
+
+  update public.send_rate_buckets
+  set tokens = b.tokens, rate_factor = b.rate_factor, updated_at = b.updated_at
+  where key = p_key;
+
+  return b.rate_factor;
+end;
+$$;
+
+-- Fair claim: round-robin across gyms.
+-- Each gym's oldest queued row comes first, then each gym's second row, and so on,
+-- so a gym with a huge campaign can't starve the others.
+-- (Replaces the FIFO version from 017; the lease semantics are unchanged.)
+create or replace function public.claim_campaign_recipients(
+  p_worker_id text,
+  p_limit int default 50,
+  p_lease_seconds int default 120,
+  p_channel text default 'sms'
+)
+returns setof public.campaign_recipients
+language plpgsql
+set search_path = public
+as $$
+begin
+  return query
+  with per_campaign as (
+    -- At most p_limit claimable rows per active campaign (walks campaign_recipients_claimable_idx)
+    select cr.id, cr.gym_id, cr.created_at
+    from public.campaigns c
+    cross join lateral (
+      select r.id, r.gym_id, r.created_at
+      from public.campaign_recipients r
+      where r.campaign_id = c.id
+        and r.channel = p_channel
+        and (
+          r.status = 'queued'
+          or (r.status = 'sending' and r.lease_expires_at < now())
+        )
+      order by r.created_at
+      limit p_limit
+    ) cr
+    where c.status in ('queued', 'running')
+  ),
+  ranked as (
+    select id, created_at, row_number() over (partition by gym_id order by created_at) as gym_rank
+    from per_campaign
+  ),
+  candidates as (
+    select cr.id
+    from public.campaign_recipients cr
+    join ranked on ranked.id = cr.id
+    -- Re-checked under the lock: another worker may have claimed it since
+    where cr.status = 'queued'
+       or (cr.status = 'sending' and cr.lease_expires_at < now())
+    order by ranked.gym_rank, ranked.created_at
+    limit p_limit
+    for update of cr skip locked
+  )
+  update public.campaign_recipients cr
+  set status = 'sending',
+      claimed_by = p_worker_id,
+      lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+      updated_at = now()
+  from candidates
+  where cr.id = candidates.id
+  returning cr.*;
+end;
+$$;
+
+-- Put claimed rows back when their gym is out of tokens.
+create or replace function public.release_campaign_recipients(p_ids uuid[])
+returns void
+language sql
+set search_path = public
+as $$
+  update public.campaign_recipients
+  set status = 'queued', claimed_by = null, lease_expires_at = null, updated_at = now()
+  where id = any(p_ids) and status = 'sending';
+$$;
+
+revoke execute on function private.settle_send_bucket(text, double precision, double precision) from public, anon, authenticated;
+revoke execute on function public.take_send_tokens(text, double precision, double precision, int) from public, anon, authenticated;
+revoke execute on function public.return_send_tokens(text, double precision, double precision, int) from public, anon, authenticated;
+revoke execute on function public.adjust_send_rate(text, double precision, double precision, boolean, int, double precision, double precision) from public, anon, authenticated;
+revoke execute on function public.claim_campaign_recipients(text, int, int, text) from public, anon, authenticated;
+revoke execute on function public.release_campaign_recipients(uuid[]) from public, anon, authenticated;
@@ -0,0 +1,53 @@
+-- supabase/migrations/020_create_mass_outreach_campaign.sql
+
+-- Create a campaign and all of its recipients server-side, in one transaction.
+-- Replaces select-everything-into-the-API + one giant insert: no PostgREST row cap
+-- (which silently truncated big campaigns) and nothing proportional to gym size in memory.
+-- Eligibility (same as before): score >= threshold, not opted out, not contacted within the cooldown.
+-- Returns no row when nobody is eligible (no campaign is created).
+create or replace function public.create_mass_outreach_campaign(
+  p_gym_id uuid,
+  p_message_body text,
+  p_score_threshold double precision default 70.0,
+  p_cooldown interval default interval '24 hours'
+)
+returns table (campaign_id uuid, recipient_count int)
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_campaign_id uuid;
+  v_count int;
+begin
+  insert into public.campaigns (gym_id, type, score_threshold, status, message_body, total_recipients)
+  values (p_gym_id, 'mass_risk_outreach', p_score_threshold, 'draft', p_message_body, 0)
+  returning id into v_campaign_id;
+
+  -- Walks members_gym_score_idx (gym_id, last_churn_score desc)
+  insert into public.campaign_recipients (gym_id, campaign_id, member_id, channel, status)
+  select m.gym_id, v_campaign_id, m.member_id, 'sms', 'queued'
+  from public.members m
+  where m.gym_id = p_gym_id
+    and m.last_churn_score >= p_score_threshold
+    and not coalesce(m.sms_opted_out, false)
+    and (m.last_contacted_at is null or m.last_contacted_at < now() - p_cooldown);
+
+  get diagnostics v_count = row_count;
+
+  if v_count = 0 then
+    delete from public.campaigns where id = v_campaign_id;
+    return;
+  end if;
+
+  -- Hand off to the worker pool (worker.py)
+  update public.campaigns
+  set total_recipients = v_count, status = 'queued', updated_at = now()
+  where id = v_campaign_id;
+
+  campaign_id := v_campaign_id;
+  recipient_count := v_count;
+  return next;
+end;
+$$;
+
+revoke execute on function public.create_mass_outreach_campaign(uuid, text, double precision, interval) from public, anon, authenticated;
@@ -0,0 +1,48 @@
+-- supabase/migrations/021_webhook_status_batches.sql
+
+-- Apply provider status callbacks in batches (webhook_ingest.py).
+-- Callbacks for one message can arrive out of order (delivered before sent), so a status
+-- only replaces one that is no further along. Ranks mirror webhook_ingest.STATUS_RANK.
+create or replace function public.message_status_rank(p_status text)
+returns int
+language sql
+immutable
+as $$
+  select case p_status
+    when 'accepted' then 1
+    when 'scheduled' then 1
+    when 'queued' then 2
+    when 'sending' then 3
+    when 'sent' then 4
+    when 'delivered' then 5
+    when 'undelivered' then 5
+    when 'failed' then 5
+    when 'read' then 6
+    else 0
+  end;
+$$;
+
+-- p_updates: [{"provider_message_id": "...", "status": "...", "error_code": "..."}], one entry per message
+-- (already coalesced by the API). Walks message_sends_provider_id_idx. Returns rows updated.
+create or replace function public.apply_message_status_updates(p_updates jsonb)
+returns int
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_count int;
+begin
+  update public.message_sends ms
+  set status = u.status,
+      error_code = coalesce(u.error_code, ms.error_code),
+      updated_at = now()
+  from jsonb_to_recordset(p_updates) as u(provider_message_id text, status text, error_code text)
+  where ms.provider_message_id = u.provider_message_id
+    and public.message_status_rank(u.status) >= public.message_status_rank(ms.status);
+
+  get diagnostics v_count = row_count;
+  return v_count;
+end;
+$$;
+
+revoke execute on function public.apply_message_status_updates(jsonb) from public, anon, authenticated;
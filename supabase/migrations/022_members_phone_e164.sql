@@ -0,0 +1,83 @@
+-- supabase/migrations/022_members_phone_e164.sql
+
+-- Normalized phone numbers for opt-out lookups.
+-- members.phone is free text from imports ("(555) 010-1234", "555.010.1234", "+1 555 010 1234"),
+-- so STOP handling by exact match on phone both scanned the whole table and missed numbers.
+-- phone_e164 is derived by trigger on every insert/update (n8n sync, CSV import, API alike).
+-- Mirrors apps/api/phones.py normalize_e164.
+
+-- 1) Normalizer: E.164 or null when the number can't be made unambiguous
+-- Bare 10-digit numbers are assumed to be in the default country (NANP, +1).
+create or replace function private.normalize_phone_e164(p_phone text, p_default_country text default '1')
+returns text
+language plpgsql
+immutable
+as $$
+declare
+  v_raw text := btrim(coalesce(p_phone, ''));
+  v_digits text := regexp_replace(v_raw, '\D', '', 'g');
+begin
+  if v_digits = '' then
+    return null;
+  end if;
+
+  if left(v_raw, 1) = '+' then
+    null; -- already international
+  elsif left(v_digits, 2) = '00' then
+    v_digits := substr(v_digits, 3); -- international dialing prefix
+  elsif length(v_digits) = 10 then
+    v_digits := p_default_country || v_digits;
+  elsif not (length(v_digits) = 11 and left(v_digits, 1) = p_default_country) then
+    return null;
+  end if;
+
+  -- E.164: up to 15 digits, no leading zero
+  if length(v_digits) < 8 or length(v_digits) > 15 or left(v_digits, 1) = '0' then
+    return null;
+  end if;
+  return '+' || v_digits;
+end;
+$$;
+
+-- 2) Column + trigger
+alter table public.members
+add column if not exists phone_e164 text null;
+
+create or replace function private.set_member_phone_e164()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.phone_e164 := private.normalize_phone_e164(new.phone);
+  return new;
+end;
+$$;
+
+drop trigger if exists members_phone_e164 on public.members;
+create trigger members_phone_e164
+before insert or update of phone on public.members
+for each row execute function private.set_member_phone_e164();
+
+-- Backfill (fires the trigger)
+update public.members set phone = phone where phone is not null and phone_e164 is null;
+
+-- 3) Index: one number can belong to members of several gyms
+create index if not exists members_phone_e164_idx
+on public.members (phone_e164)
+where phone_e164 is not null;
+
+-- 4) Opt a number out everywhere in one indexed statement; returns who was affected
+create or replace function public.opt_out_phone(p_phone_e164 text)
+returns table (gym_id uuid, member_id text)
+language sql
+set search_path = public
+as $$
+  update public.members m
+  set sms_opted_out = true,
+      sms_opted_out_at = coalesce(m.sms_opted_out_at, now()),
+      updated_at = now()
+  where m.phone_e164 = p_phone_e164
+  returning m.gym_id, m.member_id;
+$$;
+
+revoke execute on function public.opt_out_phone(text) from public, anon, authenticated;
@@ -0,0 +1,142 @@
+-- supabase/migrations/023_churn_sync.sql
+
+-- Nightly churn sync (apps/api/churn_sync.py), replacing the per-member n8n loop.
+-- The job walks member_features in (gym_id, member_id) order, scores each chunk in one pass,
+-- and commits the chunk's results together with its checkpoint, so a crashed run resumes
+-- exactly after the last committed chunk.
+
+-- 1) Runs + checkpoint (keyset cursor of the last committed chunk)
+create table if not exists public.churn_sync_runs (
+  id uuid primary key default gen_random_uuid(),
+
+  -- running (including crashed, resumable) | completed | failed (abandoned by a restart)
+  status text not null default 'running',
+  model_version text null,
+
+  last_gym_id uuid null,
+  last_member_id text null,
+  rows_scored int not null default 0,
+  chunks int not null default 0,
+  error text null,
+
+  -- Shared score_date for every row of the run, including after a resume
+  started_at timestamptz not null default now(),
+  updated_at timestamptz not null default now(),
+  finished_at timestamptz null,
+
+  constraint churn_sync_runs_status_check check (status in ('running', 'completed', 'failed'))
+);
+
+create index if not exists churn_sync_runs_status_started_idx
+on public.churn_sync_runs (status, started_at desc);
+
+-- Service role only
+alter table public.churn_sync_runs enable row level security;
+
+-- 2) Resume the latest unfinished run, or start a new one
+create or replace function public.begin_churn_sync_run(p_model_version text, p_restart boolean default false)
+returns setof public.churn_sync_runs
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_run public.churn_sync_runs;
+begin
+  if p_restart then
+    update public.churn_sync_runs
+    set status = 'failed', error = 'superseded by a restart', finished_at = now(), updated_at = now()
+    where status = 'running';
+  end if;
+
+  -- A run that crashed (or recorded an error) stays 'running'; its checkpoint is still valid
+  select * into v_run
+  from public.churn_sync_runs
+  where status = 'running'
+  order by started_at desc
+  limit 1
+  for update;
+
+  if found then
+    return next v_run;
+    return;
+  end if;
+
+  return query
+  insert into public.churn_sync_runs (model_version)
+  values (p_model_version)
+  returning *;
+end;
+$$;
+
+-- 3) Keyset page: walks member_features_gym_member_unique, no offset scans
+create or replace function public.member_features_page(p_after_gym_id uuid, p_after_member_id text, p_limit int)
+returns setof public.member_features
+language sql
+stable
+set search_path = public
+as $$
+  select f.*
+  from public.member_features f
+  where p_after_gym_id is null
+     or (f.gym_id, f.member_id) > (p_after_gym_id, p_after_member_id)
+  order by f.gym_id, f.member_id
+  limit p_limit;
+$$;
+
+-- 4) Commit one scored chunk: members + history + checkpoint in a single transaction.
+-- p_scores: [{"gym_id", "member_id", "churn_score", "is_high_risk"}] in keyset order.
+-- p_after_* must equal the run's current checkpoint, so two processes can't both apply a chunk.
+create or replace function public.apply_churn_scores(
+  p_run_id uuid,
+  p_after_gym_id uuid,
+  p_after_member_id text,
+  p_scores jsonb
+)
+returns int
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_run public.churn_sync_runs;
+  v_count int;
+begin
+  select * into v_run from public.churn_sync_runs where id = p_run_id for update;
+
+  if not found or v_run.status <> 'running' then
+    raise exception 'churn sync run % is not running', p_run_id;
+  end if;
+  if v_run.last_gym_id is distinct from p_after_gym_id
+     or v_run.last_member_id is distinct from p_after_member_id then
+    raise exception 'churn sync run % checkpoint moved (another process is applying it)', p_run_id;
+  end if;
+
+  update public.members m
+  set last_churn_score = s.churn_score,
+      is_high_risk = s.is_high_risk,
+      last_score_date = v_run.started_at,
+      updated_at = now()
+  from jsonb_to_recordset(p_scores) as s(gym_id uuid, member_id text, churn_score double precision, is_high_risk boolean)
+  where m.gym_id = s.gym_id
+    and m.member_id = s.member_id;
+
+  insert into public.member_score_history (gym_id, member_id, churn_score, score_date)
+  select s.gym_id, s.member_id, s.churn_score, v_run.started_at
+  from jsonb_to_recordset(p_scores) as s(gym_id uuid, member_id text, churn_score double precision);
+
+  get diagnostics v_count = row_count;
+
+  update public.churn_sync_runs
+  set last_gym_id = (p_scores -> -1 ->> 'gym_id')::uuid,
+      last_member_id = p_scores -> -1 ->> 'member_id',
+      rows_scored = rows_scored + v_count,
+      chunks = chunks + 1,
+      updated_at = now()
+  where id = p_run_id;
+
+  return v_count;
+end;
+$$;
+
+revoke execute on function public.begin_churn_sync_run(text, boolean) from public, anon, authenticated;
+revoke execute on function public.member_features_page(uuid, text, int) from public, anon, authenticated;
+revoke execute on function public.apply_churn_scores(uuid, uuid, text, jsonb) from public, anon, authenticated;
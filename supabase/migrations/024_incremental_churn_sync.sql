@@ -0,0 +1,225 @@
+-- supabase/migrations/024_incremental_churn_sync.sql
+
+-- Incremental churn sync: rescore only members whose feature vector changed.
+-- member_features.updated_at isn't reliable for this (imports rewrite every row nightly), so a
+-- trigger hashes the 27 model inputs and moves features_changed_at only when the hash changes.
+-- Time-dependent inputs (Days_Since_Last_Visit, Month_to_end_contract, ...) are part of the
+-- hash, so a member whose values moved is rescored even if nothing else changed.
+-- Each gym keeps a watermark: everything changed before it has been scored with its model_version.
+
+-- 1) Feature hash + change time
+alter table public.member_features
+add column if not exists features_hash text null,
+add column if not exists features_changed_at timestamptz not null default now();
+
+create or replace function private.set_member_features_hash()
+returns trigger
+language plpgsql
+as $$
+declare
+  v_hash text := md5(concat_ws('|',
+    new."Gender", new."Near_Location", new."Partner", new."Promo_friends", new."Phone", new."Age",
+    new."Lifetime_Tenure", new."Contract_period", new."Month_to_end_contract", new."Group_visits",
+    new."Avg_class_frequency_total", new."Avg_class_frequency_current_month",
+    new."Avg_additional_charges_total", new."Days_Since_Last_Visit",
+    new."Month_1", new."Month_2", new."Month_3", new."Month_4", new."Month_5", new."Month_6", new."Month_7",
+    new."Month_8", new."Month_9", new."Month_10", new."Month_11", new."Month_12", new."Month_13"
+  ));
+begin
+  if tg_op = 'INSERT' or v_hash is distinct from old.features_hash then
+    new.features_hash := v_hash;
+    new.features_changed_at := now();
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists member_features_hash on public.member_features;
+create trigger member_features_hash
+before insert or update on public.member_features
+for each row execute function private.set_member_features_hash();
+
+-- Backfill (fires the trigger)
+update public.member_features set "Gender" = "Gender" where features_hash is null;
+
+-- 2) Per-gym watermarks
+create table if not exists public.churn_sync_watermarks (
+  gym_id uuid primary key,
+  -- Start of the last completed run: every change before it is scored
+  scored_through timestamptz not null,
+  model_version text not null,
+  updated_at timestamptz not null default now()
+);
+
+-- Service role only
+alter table public.churn_sync_watermarks enable row level security;
+
+alter table public.churn_sync_runs
+add column if not exists incremental boolean not null default true,
+add column if not exists rows_written int not null default 0;
+
+-- 3) Runs remember their mode, so a resumed run keeps scanning the same way
+drop function if exists public.begin_churn_sync_run(text, boolean);
+create or replace function public.begin_churn_sync_run(
+  p_model_version text,
+  p_restart boolean default false,
+  p_incremental boolean default true
+)
+returns setof public.churn_sync_runs
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_run public.churn_sync_runs;
+begin
+  if p_restart then
+    update public.churn_sync_runs
+    set status = 'failed', error = 'superseded by a restart', finished_at = now(), updated_at = now()
+    where status = 'running';
+  end if;
+
+  -- A run that crashed (or recorded an error) stays 'running'; its checkpoint is still valid
+  select * into v_run
+  from public.churn_sync_runs
+  where status = 'running'
+  order by started_at desc
+  limit 1
+  for update;
+
+  if found then
+    return next v_run;
+    return;
+  end if;
+
+  return query
+  insert into public.churn_sync_runs (model_version, incremental)
+  values (p_model_version, p_incremental)
+  returning *;
+end;
+$$;
+
+-- 4) Keyset page. With p_model_version set, only rows changed since their gym's watermark
+-- (or every row of a gym last scored by another model version).
+drop function if exists public.member_features_page(uuid, text, int);
+create or replace function public.member_features_page(
+  p_after_gym_id uuid,
+  p_after_member_id text,
+  p_limit int,
+  p_model_version text default null
+)
+returns setof public.member_features
+language sql
+stable
+set search_path = public
+as $$
+  select f.*
+  from public.member_features f
+  left join public.churn_sync_watermarks w on w.gym_id = f.gym_id
+  where (p_after_gym_id is null
+         or (f.gym_id, f.member_id) > (p_after_gym_id, p_after_member_id))
+    and (p_model_version is null
+         or w.gym_id is null
+         or w.model_version is distinct from p_model_version
+         or f.features_changed_at >= w.scored_through)
+  order by f.gym_id, f.member_id
+  limit p_limit;
+$$;
+
+-- 5) Commit one scored chunk. Scores that moved less than p_min_change (and didn't cross the
+-- high-risk line) are neither written to members nor recorded in member_score_history.
+-- Returns the number of members whose score was written.
+drop function if exists public.apply_churn_scores(uuid, uuid, text, jsonb);
+create or replace function public.apply_churn_scores(
+  p_run_id uuid,
+  p_after_gym_id uuid,
+  p_after_member_id text,
+  p_scores jsonb,
+  p_min_change double precision default 0
+)
+returns int
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_run public.churn_sync_runs;
+  v_written int;
+begin
+  select * into v_run from public.churn_sync_runs where id = p_run_id for update;
+
+  if not found or v_run.status <> 'running' then
+    raise exception 'churn sync run % is not running', p_run_id;
+  end if;
+  if v_run.last_gym_id is distinct from p_after_gym_id
+     or v_run.last_member_id is distinct from p_after_member_id then
+    raise exception 'churn sync run % checkpoint moved (another process is applying it)', p_run_id;
+  end if;
+
+  with changed as (
+    select s.gym_id, s.member_id, s.churn_score, s.is_high_risk
+    from jsonb_to_recordset(p_scores) as s(gym_id uuid, member_id text, churn_score double precision, is_high_risk boolean)
+    left join public.members m on m.gym_id = s.gym_id and m.member_id = s.member_id
+    where m.last_churn_score is null
+       or abs(m.last_churn_score - s.churn_score) >= p_min_change
+       or m.is_high_risk is distinct from s.is_high_risk
+  ),
+  updated as (
+    update public.members m
+    set last_churn_score = c.churn_score,
+        is_high_risk = c.is_high_risk,
+        last_score_date = v_run.started_at,
+        updated_at = now()
+    from changed c
+    where m.gym_id = c.gym_id
+      and m.member_id = c.member_id
+  )
+  insert into public.member_score_history (gym_id, member_id, churn_score, score_date)
+  select c.gym_id, c.member_id, c.churn_score, v_run.started_at
+  from changed c;
+
+  get diagnostics v_written = row_count;
+
+  update public.churn_sync_runs
+  set last_gym_id = (p_scores -> -1 ->> 'gym_id')::uuid,
+      last_member_id = p_scores -> -1 ->> 'member_id',
+      rows_scored = rows_scored + jsonb_array_length(p_scores),
+      rows_written = rows_written + v_written,
+      chunks = chunks + 1,
+      updated_at = now()
+  where id = p_run_id;
+
+  return v_written;
+end;
+$$;
+
+-- 6) Finish: complete the run and move every gym's watermark to its start
+create or replace function public.finish_churn_sync_run(p_run_id uuid)
+returns void
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_run public.churn_sync_runs;
+begin
+  update public.churn_sync_runs
+  set status = 'completed', error = null, finished_at = now(), updated_at = now()
+  where id = p_run_id and status = 'running'
+  returning * into v_run;
+
+  if not found then
+    raise exception 'churn sync run % is not running', p_run_id;
+  end if;
+
+  insert into public.churn_sync_watermarks (gym_id, scored_through, model_version)
+  select distinct f.gym_id, v_run.started_at, v_run.model_version
+  from public.member_features f
+  on conflict (gym_id) do update
+  set scored_through = excluded.scored_through,
+      model_version = excluded.model_version,
+      updated_at = now();
+end;
+$$;
+
+revoke execute on function public.begin_churn_sync_run(text, boolean, boolean) from public, anon, authenticated;
+revoke execute on function public.member_features_page(uuid, text, int, text) from public, anon, authenticated;
+revoke execute on function public.apply_churn_scores(uuid, uuid, text, jsonb, double precision) from public, anon, authenticated;
+revoke execute on function public.finish_churn_sync_run(uuid) from public, anon, authenticated;
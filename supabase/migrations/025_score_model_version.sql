@@ -0,0 +1,71 @@
+-- supabase/migrations/025_score_model_version.sql
+
+-- Record which churn model produced each score (model_registry.py swaps versions without a restart).
+-- Rows written before this migration keep model_version null.
+alter table public.member_score_history
+add column if not exists model_version text null;
+
+-- Same as 024, plus model_version on history rows. A run pins one model for all its chunks.
+create or replace function public.apply_churn_scores(
+  p_run_id uuid,
+  p_after_gym_id uuid,
+  p_after_member_id text,
+  p_scores jsonb,
+  p_min_change double precision default 0
+)
+returns int
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_run public.churn_sync_runs;
+  v_written int;
+begin
+  select * into v_run from public.churn_sync_runs where id = p_run_id for update;
+
+  if not found or v_run.status <> 'running' then
+    raise exception 'churn sync run % is not running', p_run_id;
+  end if;
+  if v_run.last_gym_id is distinct from p_after_gym_id
+     or v_run.last_member_id is distinct from p_after_member_id then
+    raise exception 'churn sync run % checkpoint moved (another process is applying it)', p_run_id;
+  end if;
+
+  with changed as (
+    select s.gym_id, s.member_id, s.churn_score, s.is_high_risk
+    from jsonb_to_recordset(p_scores) as s(gym_id uuid, member_id text, churn_score double precision, is_high_risk boolean)
+    left join public.members m on m.gym_id = s.gym_id and m.member_id = s.member_id
+    where m.last_churn_score is null
+       or abs(m.last_churn_score - s.churn_score) >= p_min_change
+       or m.is_high_risk is distinct from s.is_high_risk
+  ),
+  updated as (
+    update public.members m
+    set last_churn_score = c.churn_score,
+        is_high_risk = c.is_high_risk,
+        last_score_date = v_run.started_at,
+        updated_at = now()
+    from changed c
+    where m.gym_id = c.gym_id
+      and m.member_id = c.member_id
+  )
+  insert into public.member_score_history (gym_id, member_id, churn_score, score_date, model_version)
+  select c.gym_id, c.member_id, c.churn_score, v_run.started_at, v_run.model_version
+  from changed c;
+
+  get diagnostics v_written = row_count;
+
+  update public.churn_sync_runs
+  set last_gym_id = (p_scores -> -1 ->> 'gym_id')::uuid,
+      last_member_id = p_scores -> -1 ->> 'member_id',
+      rows_scored = rows_scored + jsonb_array_length(p_scores),
+      rows_written = rows_written + v_written,
+      chunks = chunks + 1,
+      updated_at = now()
+  where id = p_run_id;
+
+  return v_written;
+end;
+$$;
+
+revoke execute on function public.apply_churn_scores(uuid, uuid, text, jsonb, double precision) from public, anon, authenticated;
@@ -0,0 +1,162 @@
+-- supabase/migrations/026_daily_rollups.sql
+
+-- Daily metrics + model monitoring for every gym in one pass per source table (apps/api/rollups.py).
+-- Replaces the per-gym loops in n8n/daily_metrics_workflow.json and daily_monitor_workflow.json,
+-- which ran a handful of count(*) subqueries per gym and rescanned each table for every gym.
+
+-- 1) Upsert keys. The monitor workflow only ever inserted, so keep the latest row per gym/day first.
+delete from public.model_monitor_score_stats s
+using public.model_monitor_score_stats newer
+where newer.gym_id = s.gym_id
+  and newer.run_date = s.run_date
+  and (newer.created_at, newer.id) > (s.created_at, s.id);
+
+create unique index if not exists model_monitor_score_stats_gym_date_key
+on public.model_monitor_score_stats (gym_id, run_date);
+
+delete from public.model_monitor_feature_stats s
+using public.model_monitor_feature_stats newer
+where newer.gym_id = s.gym_id
+  and newer.run_date = s.run_date
+  and newer.feature_name = s.feature_name
+  and (newer.created_at, newer.id) > (s.created_at, s.id);
+
+create unique index if not exists model_monitor_feature_stats_gym_date_feature_key
+on public.model_monitor_feature_stats (gym_id, run_date, feature_name);
+
+-- 2) One day's rows across all gyms are a range scan
+create index if not exists message_sends_created_at_idx on public.message_sends (created_at);
+create index if not exists engagement_events_created_at_idx on public.engagement_events (created_at);
+
+-- 3) Rollup for one day (default: yesterday). Safe to re-run: every write is an upsert.
+-- Returns the number of gyms and feature rows written.
+create or replace function public.rollup_daily_metrics(p_metric_date date default current_date - 1)
+returns table (gym_count int, feature_row_count int)
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_from timestamptz := p_metric_date::timestamptz;
+  v_to timestamptz := (p_metric_date + 1)::timestamptz;
+  v_gyms int;
+  v_features int;
+begin
+  -- members: risk snapshot + score distribution, one grouped scan
+  create temporary table rollup_members on commit drop as
+  select m.gym_id,
+         count(*) filter (where m.last_churn_score >= 70.0) as high_risk_count,
+         count(*) filter (where m.last_contacted_at >= v_from and m.last_contacted_at < v_to) as contacted_count,
+         count(m.last_churn_score) as scored_count,
+         avg(m.last_churn_score) as mean_score,
+         percentile_cont(0.9) within group (order by m.last_churn_score) as p90_score
+  from public.members m
+  group by m.gym_id;
+
+  -- message_sends: the day's sends per channel (failed attempts don't count as sent)
+  create temporary table rollup_sends on commit drop as
+  select s.gym_id,
+         count(*) filter (where s.channel = 'sms') as sms_sent_count,
+         count(*) filter (where s.channel = 'email') as email_sent_count
+  from public.message_sends s
+  where s.created_at >= v_from and s.created_at < v_to
+    and s.status not in ('failed', 'undelivered')
+  group by s.gym_id;
+
+  -- engagement_events: the day's opens/clicks
+  create temporary table rollup_engagement on commit drop as
+  select e.gym_id,
+         count(*) filter (where e.channel = 'sms' and e.event_type = 'click') as sms_click_count,
+         count(*) filter (where e.channel = 'email' and e.event_type = 'open') as email_open_count,
+         count(*) filter (where e.channel = 'email' and e.event_type = 'click') as email_click_count
+  from public.engagement_events e
+  where e.created_at >= v_from and e.created_at < v_to
+  group by e.gym_id;
+
+  insert into public.gym_daily_metrics (
+    gym_id, metric_date, high_risk_count, contacted_last_1d_count,
+    sms_sent_count, email_sent_count, sms_click_count, email_open_count, email_click_count
+  )
+  select g.id, p_metric_date,
+         coalesce(m.high_risk_count, 0), coalesce(m.contacted_count, 0),
+         coalesce(s.sms_sent_count, 0), coalesce(s.email_sent_count, 0),
+         coalesce(e.sms_click_count, 0), coalesce(e.email_open_count, 0), coalesce(e.email_click_count, 0)
+  from public.gyms g
+  left join rollup_members m on m.gym_id = g.id
+  left join rollup_sends s on s.gym_id = g.id
+  left join rollup_engagement e on e.gym_id = g.id
+  on conflict (gym_id, metric_date) do update
+  set high_risk_count = excluded.high_risk_count,
+      contacted_last_1d_count = excluded.contacted_last_1d_count,
+      sms_sent_count = excluded.sms_sent_count,
+      email_sent_count = excluded.email_sent_count,
+      sms_click_count = excluded.sms_click_count,
+      email_open_count = excluded.email_open_count,
+      email_click_count = excluded.email_click_count;
+
+  get diagnostics v_gyms = row_count;
+
+  insert into public.model_monitor_score_stats (gym_id, run_date, count, mean_score, p90_score, high_risk_count)
+  select m.gym_id, p_metric_date, m.scored_count, m.mean_score, m.p90_score, m.high_risk_count
+  from rollup_members m
+  join public.gyms g on g.id = m.gym_id
+  on conflict (gym_id, run_date) do update
+  set count = excluded.count,
+      mean_score = excluded.mean_score,
+      p90_score = excluded.p90_score,
+      high_risk_count = excluded.high_risk_count;
+
+  -- member_features: all 27 inputs in one scan (each row unpivoted in place)
+  insert into public.model_monitor_feature_stats (gym_id, run_date, feature_name, count, min_value, max_value, mean_value, null_count)
+  select f.gym_id, p_metric_date, v.feature_name,
+         count(v.value), min(v.value), max(v.value), avg(v.value),
+         count(*) filter (where v.value is null)
+  from public.member_features f
+  join public.gyms g on g.id = f.gym_id
+  cross join lateral (values
+    ('Gender', f."Gender"::float8),
+    ('Near_Location', f."Near_Location"::float8),
+    ('Partner', f."Partner"::float8),
+    ('Promo_friends', f."Promo_friends"::float8),
+    ('Phone', f."Phone"::float8),
+    ('Age', f."Age"::float8),
+    ('Lifetime_Tenure', f."Lifetime_Tenure"::float8),
+    ('Contract_period', f."Contract_period"::float8),
+    ('Month_to_end_contract', f."Month_to_end_contract"::float8),
+    ('Group_visits', f."Group_visits"::float8),
+    ('Avg_class_frequency_total', f."Avg_class_frequency_total"),
+    ('Avg_class_frequency_current_month', f."Avg_class_frequency_current_month"),
+    ('Avg_additional_charges_total', f."Avg_additional_charges_total"),
+    ('Days_Since_Last_Visit', f."Days_Since_Last_Visit"::float8),
+    ('Month_1', f."Month_1"::float8),
+    ('Month_2', f."Month_2"::float8),
+    ('Month_3', f."Month_3"::float8),
+    ('Month_4', f."Month_4"::float8),
+    ('Month_5', f."Month_5"::float8),
+    ('Month_6', f."Month_6"::float8),
+    ('Month_7', f."Month_7"::float8),
+    ('Month_8', f."Month_8"::float8),
+    ('Month_9', f."Month_9"::float8),
+    ('Month_10', f."Month_10"::float8),
+    ('Month_11', f."Month_11"::float8),
+    ('Month_12', f."Month_12"::float8),
+    ('Month_13', f."Month_13"::float8)
+  ) as v(feature_name, value)
+  group by f.gym_id, v.feature_name
+  on conflict (gym_id, run_date, feature_name) do update
+  set count = excluded.count,
+      min_value = excluded.min_value,
+      max_value = excluded.max_value,
+      mean_value = excluded.mean_value,
+      null_count = excluded.null_count;
+
+  get diagnostics v_features = row_count;
+
+  insert into public.model_monitor_runs (gym_id, run_date, source, status, notes)
+  select g.id, p_metric_date, 'rollup', 'ok', 'daily rollup'
+  from public.gyms g;
+
+  return query select v_gyms, v_features;
+end;
+$$;
+
+revoke execute on function public.rollup_daily_metrics(date) from public, anon, authenticated;
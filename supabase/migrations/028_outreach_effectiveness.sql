@@ -0,0 +1,101 @@
+-- supabase/migrations/028_outreach_effectiveness.sql
+
+-- Outreach effectiveness in one set-based pass (apps/api/effectiveness.py).
+-- Replaces n8n/effectiveness_workflow.json, which ran two correlated subqueries per contact
+-- (without gym_id, so neither could use the score history index) and retried contacts with
+-- no score history on every run until they aged out of its 30 day window.
+
+-- 1) Pending contacts are a range scan on contacted_log
+create index if not exists contacted_log_created_at_idx on public.contacted_log (created_at);
+
+-- 2) Measure every contact whose 7 day window has closed and has no outcome yet.
+-- Both score lookups are lateral index probes on member_score_history (gym_id, member_id, score_date desc).
+-- A contact is measured once: missing scores are stored as nulls (a closed window won't get new
+-- history), so it isn't picked up again. Only the days that received outcomes are re-aggregated.
+-- Returns the number of outcomes written and effectiveness days updated.
+create or replace function public.measure_outreach_effectiveness(p_lookback interval default interval '30 days')
+returns table (outcome_count int, day_count int)
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_outcomes int;
+  v_days int;
+begin
+  create temporary table measured_days (gym_id uuid, metric_date date) on commit drop;
+
+  with measured as (
+    insert into public.outreach_outcomes (
+      gym_id, member_id, contacted_log_id, channel, contacted_at,
+      score_before, score_after_7d, delta_7d, improved_7d
+    )
+    select cl.gym_id, cl.member_id, cl.id, cl.channel, cl.created_at,
+           b.churn_score, a.churn_score,
+           a.churn_score - b.churn_score,
+           coalesce(a.churn_score - b.churn_score <= -5.0, false)
+    from public.contacted_log cl
+    left join lateral (
+      select h.churn_score
+      from public.member_score_history h
+      where h.gym_id = cl.gym_id
+        and h.member_id = cl.member_id
+        and h.score_date <= cl.created_at
+      order by h.score_date desc
+      limit 1
+    ) b on true
+    left join lateral (
+      select h.churn_score
+      from public.member_score_history h
+      where h.gym_id = cl.gym_id
+        and h.member_id = cl.member_id
+        and h.score_date >= cl.created_at + interval '1 day'
+        and h.score_date <= cl.created_at + interval '7 days'
+      order by h.score_date desc
+      limit 1
+    ) a on true
+    where cl.created_at > now() - p_lookback
+      and cl.created_at < now() - interval '7 days'
+      and not exists (
+        select 1
+        from public.outreach_outcomes o
+        where o.gym_id = cl.gym_id
+          and o.contacted_log_id = cl.id
+      )
+    on conflict (gym_id, contacted_log_id) do nothing
+    returning outreach_outcomes.gym_id, outreach_outcomes.contacted_at
+  ),
+  days as (
+    insert into measured_days
+    select distinct m.gym_id, m.contacted_at::date
+    from measured m
+    returning 1
+  )
+  select (select count(*) from measured), (select count(*) from days)
+  into v_outcomes, v_days;
+
+  -- Re-aggregate just the touched days from their outcomes
+  insert into public.gym_outreach_effectiveness_daily (
+    gym_id, metric_date, contacts_count, measured_count, avg_delta_7d, improved_percent_7d
+  )
+  select d.gym_id, d.metric_date,
+         count(*),
+         count(o.delta_7d),
+         avg(o.delta_7d),
+         count(*) filter (where o.improved_7d) * 100.0 / nullif(count(o.delta_7d), 0)
+  from measured_days d
+  join public.outreach_outcomes o
+    on o.gym_id = d.gym_id
+   and o.contacted_at >= d.metric_date::timestamptz
+   and o.contacted_at < (d.metric_date + 1)::timestamptz
+  group by d.gym_id, d.metric_date
+  on conflict (gym_id, metric_date) do update
+  set contacts_count = excluded.contacts_count,
+      measured_count = excluded.measured_count,
+      avg_delta_7d = excluded.avg_delta_7d,
+      improved_percent_7d = excluded.improved_percent_7d;
+
+  return query select v_outcomes, v_days;
+end;
+$$;
+
+revoke execute on function public.measure_outreach_effectiveness(interval) from public, anon, authenticated;
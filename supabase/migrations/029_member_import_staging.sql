@@ -0,0 +1,208 @@
+-- supabase/migrations/029_member_import_staging.sql
+
+-- Streaming CSV member import (apps/api/imports.py).
+-- Valid rows are bulk-loaded (COPY, or PostgREST inserts without DATABASE_URL) into an unlogged
+-- staging table one chunk at a time, then merged into members / member_features in one statement.
+-- Only invalid rows are written to member_import_rows.
+
+-- 1) Job progress, updated after every chunk
+alter table public.member_import_jobs
+add column if not exists rows_processed int not null default 0,
+add column if not exists rows_imported int not null default 0,
+add column if not exists rows_invalid int not null default 0,
+add column if not exists updated_at timestamptz not null default now();
+
+-- 2) Staging. Unlogged: it only holds an import in flight, and a crashed import is re-uploaded.
+-- Members and member_features imports share it; the other type's columns stay null.
+create unlogged table if not exists public.member_import_staging (
+  import_job_id uuid not null,
+  row_number int not null,
+  member_id text not null,
+
+  first_name text null,
+  last_name text null,
+  phone text null,
+  email text null,
+  last_churn_score double precision null,
+
+  "Gender" int null,
+  "Near_Location" int null,
+  "Partner" int null,
+  "Promo_friends" int null,
+  "Phone" int null,
+  "Age" int null,
+  "Lifetime_Tenure" int null,
+  "Contract_period" int null,
+  "Month_to_end_contract" int null,
+  "Group_visits" int null,
+  "Avg_class_frequency_total" double precision null,
+  "Avg_class_frequency_current_month" double precision null,
+  "Avg_additional_charges_total" double precision null,
+  "Days_Since_Last_Visit" int null,
+  "Month_1" int null,
+  "Month_2" int null,
+  "Month_3" int null,
+  "Month_4" int null,
+  "Month_5" int null,
+  "Month_6" int null,
+  "Month_7" int null,
+  "Month_8" int null,
+  "Month_9" int null,
+  "Month_10" int null,
+  "Month_11" int null,
+  "Month_12" int null,
+  "Month_13" int null
+);
+
+create index if not exists member_import_staging_job_member_idx
+on public.member_import_staging (import_job_id, member_id, row_number);
+
+-- Service role only
+alter table public.member_import_staging enable row level security;
+
+-- 3) Merge a fully staged job. A member_id repeated in the file breaks (gym_id, member_id)
+-- uniqueness: its first row is imported and the later ones are recorded as invalid rows.
+-- Returns the number of rows imported and duplicates rejected.
+create or replace function public.merge_member_import(p_job_id uuid)
+returns table (imported_count int, duplicate_count int)
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_job public.member_import_jobs;
+  v_imported int;
+  v_duplicates int;
+begin
+  select * into v_job from public.member_import_jobs where id = p_job_id for update;
+
+  if not found or v_job.status <> 'validated' then
+    raise exception 'import job % is not ready to merge', p_job_id;
+  end if;
+
+  with ranked as (
+    select s.ctid as row_ctid, s.row_number,
+           min(s.row_number) over (partition by s.member_id) as first_row_number
+    from public.member_import_staging s
+    where s.import_job_id = p_job_id
+  ),
+  duplicates as (
+    delete from public.member_import_staging s
+    using ranked r
+    where s.ctid = r.row_ctid
+      and r.row_number > r.first_row_number
+    returning s.*, r.first_row_number
+  )
+  insert into public.member_import_rows (gym_id, import_job_id, row_number, raw_row, is_valid, error_message)
+  select v_job.gym_id, p_job_id, d.row_number,
+         jsonb_strip_nulls(to_jsonb(d) - 'import_job_id' - 'row_number' - 'first_row_number'),
+         false,
+         format('Duplicate member_id %s (first seen on row %s)', d.member_id, d.first_row_number)
+  from duplicates d;
+
+  get diagnostics v_duplicates = row_count;
+
+  if v_job.import_type = 'members' then
+    insert into public.members (
+      gym_id, member_id, first_name, last_name, phone, email,
+      last_churn_score, last_score_date, is_high_risk
+    )
+    select v_job.gym_id, s.member_id, s.first_name, s.last_name, s.phone, s.email,
+           s.last_churn_score,
+           case when s.last_churn_score is not null then now() end,
+           coalesce(s.last_churn_score >= 70.0, false)
+    from public.member_import_staging s
+    where s.import_job_id = p_job_id
+    on conflict (gym_id, member_id) do update
+    set first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        phone = excluded.phone,
+        email = excluded.email,
+        -- A file without scores doesn't clear the ones churn sync wrote
+        last_churn_score = coalesce(excluded.last_churn_score, members.last_churn_score),
+        last_score_date = coalesce(excluded.last_score_date, members.last_score_date),
+        is_high_risk = case when excluded.last_churn_score is null then members.is_high_risk
+                            else excluded.is_high_risk end,
+        updated_at = now();
+  else
+    insert into public.member_features (
+      gym_id, member_id,
+      "Gender", "Near_Location", "Partner", "Promo_friends", "Phone", "Age", "Lifetime_Tenure",
+      "Contract_period", "Month_to_end_contract", "Group_visits", "Avg_class_frequency_total",
+      "Avg_class_frequency_current_month", "Avg_additional_charges_total",
+      "Days_Since_Last_Visit", "Month_1", "Month_2", "Month_3", "Month_4", "Month_5",
+      "Month_6", "Month_7", "Month_8", "Month_9", "Month_10", "Month_11", "Month_12",
+      "Month_13"
+    )
+    select v_job.gym_id, s.member_id,
+           s."Gender", s."Near_Location", s."Partner", s."Promo_friends", s."Phone", s."Age",
+           s."Lifetime_Tenure", s."Contract_period", s."Month_to_end_contract",
+           s."Group_visits", s."Avg_class_frequency_total",
+           s."Avg_class_frequency_current_month", s."Avg_additional_charges_total",
+           s."Days_Since_Last_Visit", s."Month_1", s."Month_2", s."Month_3", s."Month_4",
+           s."Month_5", s."Month_6", s."Month_7", s."Month_8", s."Month_9", s."Month_10",
+           s."Month_11", s."Month_12", s."Month_13"
+    from public.member_import_staging s
+    where s.import_job_id = p_job_id
+    on conflict (gym_id, member_id) do update
+    set "Gender" = excluded."Gender",
+      "Near_Location" = excluded."Near_Location",
+      "Partner" = excluded."Partner",
+      "Promo_friends" = excluded."Promo_friends",
+      "Phone" = excluded."Phone",
+      "Age" = excluded."Age",
+      "Lifetime_Tenure" = excluded."Lifetime_Tenure",
+      "Contract_period" = excluded."Contract_period",
+      "Month_to_end_contract" = excluded."Month_to_end_contract",
+      "Group_visits" = excluded."Group_visits",
+      "Avg_class_frequency_total" = excluded."Avg_class_frequency_total",
+      "Avg_class_frequency_current_month" = excluded."Avg_class_frequency_current_month",
+      "Avg_additional_charges_total" = excluded."Avg_additional_charges_total",
+      "Days_Since_Last_Visit" = excluded."Days_Since_Last_Visit",
+      "Month_1" = excluded."Month_1",
+      "Month_2" = excluded."Month_2",
+      "Month_3" = excluded."Month_3",
+      "Month_4" = excluded."Month_4",
+      "Month_5" = excluded."Month_5",
+      "Month_6" = excluded."Month_6",
+      "Month_7" = excluded."Month_7",
+      "Month_8" = excluded."Month_8",
+      "Month_9" = excluded."Month_9",
+      "Month_10" = excluded."Month_10",
+      "Month_11" = excluded."Month_11",
+      "Month_12" = excluded."Month_12",
+      "Month_13" = excluded."Month_13",
+      updated_at = now();
+  end if;
+
+  get diagnostics v_imported = row_count;
+
+  delete from public.member_import_staging where import_job_id = p_job_id;
+
+  update public.member_import_jobs
+  set status = 'imported',
+      rows_imported = v_imported,
+      rows_invalid = rows_invalid + v_duplicates,
+      updated_at = now()
+  where id = p_job_id;
+
+  return query select v_imported, v_duplicates;
+end;
+$$;
+
+-- 4) Fail a job and drop whatever it staged
+create or replace function public.fail_member_import(p_job_id uuid, p_error text)
+returns void
+language plpgsql
+set search_path = public
+as $$
+begin
+  delete from public.member_import_staging where import_job_id = p_job_id;
+
+  update public.member_import_jobs
+  set status = 'failed', error_summary = p_error, updated_at = now()
+  where id = p_job_id;
+end;
+$$;
+
+revoke execute on function public.merge_member_import(uuid) from public, anon, authenticated;
+revoke execute on function public.fail_member_import(uuid, text) from public, anon, authenticated;
@@ -0,0 +1,264 @@
+-- supabase/migrations/030_partition_event_tables.sql
+
+-- Monthly range partitions + retention for the append-only event tables.
+-- member_score_history gets a row per member per churn sync, and message_sends, provider_webhook_events,
+-- engagement_events and audit_logs only ever grow. Partitioned by month, time-bounded queries
+-- (effectiveness lookups, rollups, the /activity audit view) only touch the months they ask for,
+-- and retention drops or detaches whole months instead of running huge deletes.
+-- Maintenance (apps/api/partitions.py -> maintain_partitions) creates the coming months' partitions
+-- ahead of time and applies each table's retention from partition_policies.
+
+-- 1) Partitions live outside the API schemas: PostgREST only sees the parent tables,
+-- whose RLS policies and grants apply to every partition read through them.
+create schema if not exists partitions;
+create schema if not exists archive;
+revoke all on schema partitions from public, anon, authenticated;
+revoke all on schema archive from public, anon, authenticated;
+
+-- 2) Which tables are partitioned, on what, and how long months are kept
+create table if not exists public.partition_policies (
+  table_name text primary key,
+  partition_column text not null,
+  -- Whole months kept before the current one (null = keep forever)
+  retention_months int null,
+  -- true: expired months are detached into the archive schema (for export) instead of dropped
+  archive boolean not null default false,
+  updated_at timestamptz not null default now(),
+
+  constraint partition_policies_retention_check check (retention_months is null or retention_months >= 1)
+);
+
+-- Service role only
+alter table public.partition_policies enable row level security;
+
+insert into public.partition_policies (table_name, partition_column, retention_months, archive) values
+  ('member_score_history', 'score_date', 24, false),
+  ('message_sends', 'created_at', 18, false),
+  ('provider_webhook_events', 'received_at', 3, false),
+  ('engagement_events', 'created_at', 18, false),
+  ('audit_logs', 'created_at', 24, true)
+on conflict (table_name) do nothing;
+
+-- 3) One month's partition, named <table>_pYYYYMM. Rows that landed in the default partition
+-- for that month (it didn't exist yet) are moved into it first. Returns false if it already exists.
+create or replace function private.create_month_partition(p_table text, p_column text, p_month date)
+returns boolean
+language plpgsql
+as $$
+declare
+  v_name text := format('%s_p%s', p_table, to_char(p_month, 'YYYYMM'));
+  v_from timestamptz := date_trunc('month', p_month::timestamptz);
+  v_to timestamptz := date_trunc('month', p_month::timestamptz) + interval '1 month';
+begin
+  if to_regclass(format('partitions.%I', v_name)) is not null then
+    return false;
+  end if;
+
+  execute format('create table partitions.%I (like public.%I including defaults including constraints)', v_name, p_table);
+  execute format(
+    'with moved as (delete from partitions.%I where %I >= $1 and %I < $2 returning *) '
+    'insert into partitions.%I select * from moved',
+    p_table || '_default', p_column, p_column, v_name
+  ) using v_from, v_to;
+  execute format('alter table public.%I attach partition partitions.%I for values from (%L) to (%L)',
+                 p_table, v_name, v_from, v_to);
+  return true;
+end;
+$$;
+
+-- 4) Convert a plain table in place: same columns, defaults, checks, indexes, foreign keys,
+-- grants and RLS policies; primary key becomes (id, partition column). Existing rows are
+-- copied into their months. No-op if the table is already partitioned.
+create or replace function private.partition_by_month(p_table text, p_column text, p_months_ahead int default 3)
+returns void
+language plpgsql
+as $$
+declare
+  v_old text := p_table || '_unpartitioned';
+  v_first date;
+  v_month date;
+  v_def text;
+  v_policy record;
+  v_grant record;
+  v_fk record;
+  v_indexes text[];
+begin
+  if exists (select 1 from pg_partitioned_table where partrelid = to_regclass(format('public.%I', p_table))) then
+    return;
+  end if;
+
+  execute format('alter table public.%I rename to %I', p_table, v_old);
+  execute format('create table public.%I (like public.%I including defaults including constraints including storage) '
+                 'partition by range (%I)', p_table, v_old, p_column);
+  execute format('create table partitions.%I partition of public.%I default', p_table || '_default', p_table);
+
+  execute format('select date_trunc(''month'', min(%I))::date from public.%I', p_column, v_old) into v_first;
+  for v_month in
+    select generate_series(
+      date_trunc('month', least(coalesce(v_first, current_date), current_date)::timestamp),
+      (date_trunc('month', current_date) + make_interval(months => p_months_ahead))::timestamp,
+      interval '1 month'
+    )::date
+  loop
+    perform private.create_month_partition(p_table, p_column, v_month);
+  end loop;
+
+  execute format('insert into public.%I select * from public.%I', p_table, v_old);
+
+  -- Secondary indexes are rebuilt after the copy (one build per partition instead of row-by-row upkeep)
+  select array_agg(pg_get_indexdef(i.indexrelid)) into v_indexes
+  from pg_index i
+  where i.indrelid = format('public.%I', v_old)::regclass
+    and not i.indisprimary;
+
+  for v_fk in
+    select c.conname, pg_get_constraintdef(c.oid) as def
+    from pg_constraint c
+    where c.conrelid = format('public.%I', v_old)::regclass and c.contype = 'f'
+  loop
+    execute format('alter table public.%I add constraint %I %s', p_table, v_fk.conname, v_fk.def);
+  end loop;
+
+  for v_grant in
+    select g.grantee, string_agg(g.privilege_type, ', ') as privileges
+    from information_schema.role_table_grants g
+    where g.table_schema = 'public' and g.table_name = v_old
+    group by g.grantee
+  loop
+    execute format('grant %s on public.%I to %s', v_grant.privileges, p_table,
+                   case when v_grant.grantee = 'PUBLIC' then 'public' else quote_ident(v_grant.grantee) end);
+  end loop;
+
+  for v_policy in
+    select * from pg_policies where schemaname = 'public' and tablename = v_old
+  loop
+    execute format('create policy %I on public.%I as %s for %s to %s%s%s',
+      v_policy.policyname, p_table, v_policy.permissive, v_policy.cmd,
+      (select string_agg(quote_ident(r), ', ') from unnest(v_policy.roles) r),
+      case when v_policy.qual is not null then format(' using (%s)', v_policy.qual) else '' end,
+      case when v_policy.with_check is not null then format(' with check (%s)', v_policy.with_check) else '' end);
+  end loop;
+
+  execute format('alter table public.%I enable row level security', p_table);
+  execute format('drop table public.%I', v_old);
+
+  execute format('alter table public.%I add primary key (id, %I)', p_table, p_column);
+  foreach v_def in array coalesce(v_indexes, '{}')
+  loop
+    execute replace(v_def, format(' ON public.%s ', quote_ident(v_old)), format(' ON public.%s ', quote_ident(p_table)));
+  end loop;
+end;
+$$;
+
+-- claim_due_retries returns the message_sends row type, which is replaced: recreated below
+drop function if exists public.claim_due_retries(int, int);
+
+do $$
+declare
+  v_policy public.partition_policies;
+begin
+  for v_policy in select * from public.partition_policies order by table_name
+  loop
+    perform private.partition_by_month(v_policy.table_name, v_policy.partition_column);
+  end loop;
+end;
+$$;
+
+-- Same as migration 018; the due rows carry their partition key into the update
+create or replace function public.claim_due_retries(
+  p_limit int default 50,
+  p_lease_seconds int default 120
+)
+returns setof public.message_sends
+language plpgsql
+set search_path = public
+as $$
+begin
+  return query
+  with due as (
+    select ms.id, ms.created_at
+    from public.message_sends ms
+    where ms.next_retry_at is not null
+      and ms.next_retry_at <= now()
+    order by ms.next_retry_at
+    limit p_limit
+    for update skip locked
+  )
+  update public.message_sends ms
+  set next_retry_at = now() + make_interval(secs => p_lease_seconds),
+      updated_at = now()
+  from due
+  where ms.id = due.id
+    and ms.created_at = due.created_at
+  returning ms.*;
+end;
+$$;
+
+-- 5) Maintenance: create partitions through p_months_ahead, expire months older than retention
+-- (and purge expired rows that ended up in the default partition).
+-- Returns one row per table with what changed.
+create or replace function public.maintain_partitions(p_months_ahead int default 3)
+returns table (table_name text, created_count int, archived_count int, dropped_count int)
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_policy public.partition_policies;
+  v_month date;
+  v_cutoff date;
+  v_part record;
+begin
+  for v_policy in select * from public.partition_policies order by 1
+  loop
+    table_name := v_policy.table_name;
+    created_count := 0;
+    archived_count := 0;
+    dropped_count := 0;
+
+    for v_month in
+      select generate_series(date_trunc('month', now()), date_trunc('month', now()) + make_interval(months => p_months_ahead), interval '1 month')::date
+    loop
+      if private.create_month_partition(v_policy.table_name, v_policy.partition_column, v_month) then
+        created_count := created_count + 1;
+      end if;
+    end loop;
+
+    if v_policy.retention_months is not null then
+      v_cutoff := (date_trunc('month', now()) - make_interval(months => v_policy.retention_months))::date;
+
+      for v_part in
+        select c.relname
+        from pg_inherits i
+        join pg_class c on c.oid = i.inhrelid
+        join pg_namespace n on n.oid = c.relnamespace
+        where i.inhparent = format('public.%I', v_policy.table_name)::regclass
+          and n.nspname = 'partitions'
+          and c.relname ~ '_p[0-9]{6}$'
+          and to_date(right(c.relname, 6), 'YYYYMM') < v_cutoff
+        order by c.relname
+      loop
+        execute format('alter table public.%I detach partition partitions.%I', v_policy.table_name, v_part.relname);
+        if v_policy.archive then
+          execute format('alter table partitions.%I set schema archive', v_part.relname);
+          archived_count := archived_count + 1;
+        else
+          execute format('drop table partitions.%I', v_part.relname);
+          dropped_count := dropped_count + 1;
+        end if;
+      end loop;
+
+      if not v_policy.archive then
+        execute format('delete from partitions.%I where %I < $1',
+                       v_policy.table_name || '_default', v_policy.partition_column) using v_cutoff::timestamptz;
+      end if;
+    end if;
+
+    return next;
+  end loop;
+end;
+$$;
+
+revoke execute on function public.claim_due_retries(int, int) from public, anon, authenticated;
+revoke execute on function public.maintain_partitions(int) from public, anon, authenticated;
+revoke execute on function private.create_month_partition(text, text, date) from public;
+revoke execute on function private.partition_by_month(text, text, int) from public;
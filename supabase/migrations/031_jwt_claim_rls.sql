@@ -0,0 +1,161 @@
+-- supabase/migrations/031_jwt_claim_rls.sql
+
+-- Tenant RLS from JWT claims instead of a profiles lookup per query.
+-- Until now every policy ran `gym_id = (select p.gym_id from profiles p where p.user_id = auth.uid())`
+-- (and the 012-014 ones an unwrapped private.is_admin() per row): an extra index probe into profiles
+-- on every request, and a per-row function call for the admin override.
+-- custom_access_token_hook stamps the user's gym_id and role into app_metadata when Supabase Auth
+-- issues a token; policies then compare gym_id against that claim, evaluated once per statement.
+-- Enabling the hook: see docs/runbooks/production.md ("Auth Hook: Gym Claims").
+
+-- 1) Access token hook: app_metadata.gym_id / app_metadata.role from profiles.
+-- A user without a profile gets neither (a stale value from raw_app_meta_data is removed).
+create or replace function public.custom_access_token_hook(event jsonb)
+returns jsonb
+language plpgsql
+stable
+set search_path = ''
+as $$
+declare
+  v_claims jsonb := event -> 'claims';
+  v_app_metadata jsonb := coalesce(event -> 'claims' -> 'app_metadata', '{}'::jsonb) - 'gym_id' - 'role';
+  v_gym_id uuid;
+  v_role text;
+begin
+  select p.gym_id, p.role into v_gym_id, v_role
+  from public.profiles p
+  where p.user_id = (event ->> 'user_id')::uuid;
+
+  if found then
+    v_app_metadata := v_app_metadata || jsonb_build_object('gym_id', v_gym_id, 'role', v_role);
+  end if;
+
+  return jsonb_set(event, '{claims}', jsonb_set(v_claims, '{app_metadata}', v_app_metadata));
+end;
+$$;
+
+grant usage on schema public to supabase_auth_admin;
+grant execute on function public.custom_access_token_hook(jsonb) to supabase_auth_admin;
+revoke execute on function public.custom_access_token_hook(jsonb) from public, anon, authenticated;
+
+grant select on table public.profiles to supabase_auth_admin;
+drop policy if exists "Profiles: auth hook reads all" on public.profiles;
+create policy "Profiles: auth hook reads all"
+on public.profiles
+for select
+to supabase_auth_admin
+using (true);
+
+-- 2) Claim helpers. Tokens issued before the hook was enabled carry no claims until their next
+-- refresh (at most the JWT expiry), so both fall back to the profiles row.
+create or replace function private.current_gym_id()
+returns uuid
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+  select coalesce(
+    (auth.jwt() -> 'app_metadata' ->> 'gym_id')::uuid,
+    (select p.gym_id from public.profiles p where p.user_id = auth.uid())
+  );
+$$;
+
+create or replace function private.is_admin()
+returns boolean
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+  select case
+    when auth.jwt() -> 'app_metadata' ? 'role' then (auth.jwt() -> 'app_metadata' ->> 'role') = 'admin'
+    else exists (select 1 from public.profiles p where p.user_id = auth.uid() and p.role = 'admin')
+  end;
+$$;
+
+-- Gyms the caller may see: their own, or every gym for admins.
+-- Policies use `gym_id = any ((select private.visible_gym_ids())::uuid[])`: the wrapped call runs once per
+-- statement (an InitPlan) and `= any(array)` stays an index condition, unlike `... or is_admin()`.
+create or replace function private.visible_gym_ids()
+returns uuid[]
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+  select case
+    when private.is_admin() then (select coalesce(array_agg(g.id), '{}') from public.gyms g)
+    else array_remove(array[private.current_gym_id()], null)
+  end;
+$$;
+
+grant usage on schema private to authenticated;
+revoke execute on function private.current_gym_id() from public, anon;
+revoke execute on function private.is_admin() from public, anon;
+revoke execute on function private.visible_gym_ids() from public, anon;
+grant execute on function private.current_gym_id() to authenticated;
+grant execute on function private.is_admin() to authenticated;
+grant execute on function private.visible_gym_ids() to authenticated;
+
+-- 3) Rewrite every tenant policy. All existing policies on these tables are dropped first, including
+-- the wide-open `using (true)` ones from 015/016 (gyms, members, model_monitor_*, outreach_logs)
+-- which made the tenant policies next to them moot.
+-- Each table gets "<label>: <command> own gym" policies for authenticated; %s is the visible gym ids.
+do $$
+declare
+  v_table record;
+  v_policy record;
+  v_command text;
+  v_check text;
+begin
+  for v_table in
+    select *
+    from (values
+      ('gyms', 'Gyms', 'id = any (%s)', array['select']),
+      ('members', 'Members', 'gym_id = any (%s)', array['select', 'insert', 'update', 'delete']),
+      ('campaigns', 'Campaigns', 'gym_id = any (%s)', array['select', 'insert', 'update']),
+      ('campaign_recipients', 'Campaign Recipients', 'gym_id = any (%s)', array['select', 'insert', 'update']),
+      ('contacted_log', 'Contacted log', 'gym_id = any (%s)', array['select', 'insert']),
+      ('dead_letter_messages', 'DLQ', 'gym_id = any (%s)', array['select', 'insert', 'delete']),
+      ('engagement_events', 'Engagement', 'gym_id = any (%s)', array['select']),
+      ('gym_daily_metrics', 'Daily metrics', 'gym_id = any (%s)', array['select', 'insert', 'update']),
+      ('gym_outreach_effectiveness_daily', 'Effectiveness daily', 'gym_id = any (%s)', array['select', 'insert', 'update']),
+      ('member_score_history', 'Score history', 'gym_id = any (%s)', array['select', 'insert']),
+      ('message_sends', 'Message Sends', 'gym_id = any (%s)', array['select', 'insert']),
+      ('outreach_outcomes', 'Outreach outcomes', 'gym_id = any (%s)', array['select', 'insert']),
+      ('provider_webhook_events', 'Webhook Events', 'gym_id = any (%s)', array['select']),
+      ('templates', 'Templates', 'gym_id = any (%s)', array['select', 'insert', 'update', 'delete']),
+      ('audit_logs', 'Audit', 'gym_id = any (%s)', array['select', 'insert']),
+      ('member_import_jobs', 'Import jobs', 'gym_id = any (%s)', array['select', 'insert', 'update', 'delete']),
+      ('member_import_rows', 'Import rows', 'gym_id = any (%s)', array['select', 'insert', 'update', 'delete']),
+      ('gym_data_sources', 'Data sources', 'gym_id = any (%s)', array['select', 'insert', 'update', 'delete']),
+      ('model_monitor_runs', 'Monitor runs', 'gym_id = any (%s)', array['select']),
+      ('model_monitor_feature_stats', 'Monitor feature stats', 'gym_id = any (%s)', array['select']),
+      ('model_monitor_score_stats', 'Monitor score stats', 'gym_id = any (%s)', array['select']),
+      -- outreach_logs (016) has no gym_id: rows belong to their member's gym
+      ('outreach_logs', 'Outreach logs',
+       'exists (select 1 from public.members m where m.id = outreach_logs.member_id and m.gym_id = any (%s))',
+       array['select', 'insert', 'update', 'delete'])
+    ) as t(table_name, label, predicate, commands)
+    where to_regclass(format('public.%I', t.table_name)) is not null
+  loop
+    for v_policy in
+      select policyname from pg_policies where schemaname = 'public' and tablename = v_table.table_name
+    loop
+      execute format('drop policy %I on public.%I', v_policy.policyname, v_table.table_name);
+    end loop;
+
+    v_check := format(v_table.predicate, '(select private.visible_gym_ids())::uuid[]');
+    foreach v_command in array v_table.commands
+    loop
+      execute format('create policy %I on public.%I for %s to authenticated%s%s',
+        format('%s: %s own gym', v_table.label, v_command), v_table.table_name, v_command,
+        case when v_command <> 'insert' then format(' using (%s)', v_check) else '' end,
+        case when v_command in ('insert', 'update') then format(' with check (%s)', v_check) else '' end);
+    end loop;
+
+    execute format('alter table public.%I enable row level security', v_table.table_name);
+  end loop;
+end;
+$$;
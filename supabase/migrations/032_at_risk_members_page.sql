@@ -0,0 +1,59 @@
+-- supabase/migrations/032_at_risk_members_page.sql
+
+-- Home screen list through the API (apps/api/members.py): high-risk members not contacted within
+-- the cooldown, by score, one keyset page at a time instead of every row in one PostgREST read.
+
+-- 1) Only high-risk members, in page order: a page is one index range read from the cursor on,
+-- whatever the gym's size (members_gym_score_idx also walks every low-risk member).
+-- last_contacted_at rides along so the cooldown filter and the total are index-only.
+create index if not exists members_gym_at_risk_idx
+on public.members (gym_id, last_churn_score, id)
+include (last_contacted_at)
+where is_high_risk;
+
+-- 2) One page after (p_after_score, p_after_id), ordered by last_churn_score desc, id desc.
+-- Without a cursor the seek starts above every score, so it is always an index condition.
+-- p_with_total adds the whole list's size to every row (the Home screen's Mass Message count);
+-- it's only asked for with the first page.
+create or replace function public.at_risk_members_page(
+  p_gym_id uuid,
+  p_after_score double precision default null,
+  p_after_id uuid default null,
+  p_limit int default 50,
+  p_cooldown interval default '24 hours',
+  p_with_total boolean default false
+)
+returns table (
+  id uuid,
+  member_id text,
+  first_name text,
+  last_name text,
+  last_churn_score double precision,
+  last_score_date timestamptz,
+  last_contacted_at timestamptz,
+  sms_opted_out boolean,
+  total_count bigint
+)
+language sql
+stable
+set search_path = public
+as $$
+  select m.id, m.member_id, m.first_name, m.last_name, m.last_churn_score, m.last_score_date,
+         m.last_contacted_at, m.sms_opted_out,
+         case when p_with_total then (
+           select count(*)
+           from public.members c
+           where c.gym_id = p_gym_id
+             and c.is_high_risk
+             and (c.last_contacted_at is null or c.last_contacted_at < now() - p_cooldown)
+         ) end
+  from public.members m
+  where m.gym_id = p_gym_id
+    and m.is_high_risk
+    and (m.last_contacted_at is null or m.last_contacted_at < now() - p_cooldown)
+    and (m.last_churn_score, m.id) < (coalesce(p_after_score, 'infinity'), coalesce(p_after_id, 'ffffffff-ffff-ffff-ffff-ffffffffffff'))
+  order by m.last_churn_score desc, m.id desc
+  limit p_limit;
+$$;
+
+revoke execute on function public.at_risk_members_page(uuid, double precision, uuid, int, interval, boolean) from public, anon, authenticated;
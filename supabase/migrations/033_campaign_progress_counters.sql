@@ -0,0 +1,124 @@
+-- supabase/migrations/033_campaign_progress_counters.sql
+
+-- Campaign progress without counting campaign_recipients: workers keep per-status counters on
+-- the campaign (one update per campaign per send batch), and every change is published on the
+-- 'campaign_progress' channel for the API's progress stream (apps/api/campaign_progress.py).
+
+-- 1) Counters; processed_count (006) = sent + failed + skipped
+alter table public.campaigns
+add column if not exists sent_count int not null default 0,
+add column if not exists failed_count int not null default 0,
+add column if not exists skipped_count int not null default 0,
+add column if not exists retrying_count int not null default 0;
+
+update public.campaigns c
+set sent_count = t.sent,
+    failed_count = t.failed,
+    skipped_count = t.skipped,
+    retrying_count = t.retrying,
+    processed_count = t.sent + t.failed + t.skipped
+from (
+  select cr.campaign_id,
+         count(*) filter (where cr.status = 'sent') as sent,
+         count(*) filter (where cr.status = 'failed') as failed,
+         count(*) filter (where cr.status = 'skipped_opted_out') as skipped,
+         count(*) filter (where cr.status = 'retrying') as retrying
+  from public.campaign_recipients cr
+  group by cr.campaign_id
+) t
+where t.campaign_id = c.id;
+
+-- 2) Set a batch of recipient statuses and move the counters by the difference, in one statement.
+-- p_updates: [{"id": <recipient id>, "status": <new status>}, ...]. Rows already in that status
+-- are left alone, so a replayed batch doesn't count twice. Returns the number of rows changed.
+create or replace function public.set_campaign_recipient_statuses(p_updates jsonb)
+returns int
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_changed int;
+begin
+  with input as (
+    select u.id, u.status
+    from jsonb_to_recordset(p_updates) as u(id uuid, status text)
+  ),
+  prev as (
+    select cr.id, cr.campaign_id, cr.status as old_status, i.status as new_status
+    from public.campaign_recipients cr
+    join input i on i.id = cr.id
+    where cr.status is distinct from i.status
+    for update of cr
+  ),
+  changed as (
+    update public.campaign_recipients cr
+    set status = prev.new_status,
+        updated_at = now()
+    from prev
+    where cr.id = prev.id
+    returning prev.campaign_id, prev.old_status, prev.new_status
+  ),
+  deltas as (
+    select campaign_id,
+           count(*) filter (where new_status = 'sent') - count(*) filter (where old_status = 'sent') as sent,
+           count(*) filter (where new_status = 'failed') - count(*) filter (where old_status = 'failed') as failed,
+           count(*) filter (where new_status = 'skipped_opted_out') - count(*) filter (where old_status = 'skipped_opted_out') as skipped,
+           count(*) filter (where new_status = 'retrying') - count(*) filter (where old_status = 'retrying') as retrying,
+           count(*) as n
+    from changed
+    group by campaign_id
+  ),
+  bumped as (
+    update public.campaigns c
+    set sent_count = c.sent_count + d.sent,
+        failed_count = c.failed_count + d.failed,
+        skipped_count = c.skipped_count + d.skipped,
+        retrying_count = c.retrying_count + d.retrying,
+        processed_count = c.processed_count + d.sent + d.failed + d.skipped,
+        updated_at = now()
+    from deltas d
+    where c.id = d.campaign_id
+    returning d.n
+  )
+  select coalesce(sum(n), 0)::int into v_changed from bumped;
+
+  return v_changed;
+end;
+$$;
+
+-- 3) Publish status / counter changes. NOTIFY is delivered at commit and only to listeners,
+-- so it costs nothing while nobody watches.
+create or replace function private.notify_campaign_progress()
+returns trigger
+language plpgsql
+set search_path = public
+as $$
+begin
+  perform pg_notify('campaign_progress', json_build_object(
+    'id', new.id,
+    'gym_id', new.gym_id,
+    'status', new.status,
+    'total_recipients', new.total_recipients,
+    'processed_count', new.processed_count,
+    'sent_count', new.sent_count,
+    'failed_count', new.failed_count,
+    'skipped_count', new.skipped_count,
+    'retrying_count', new.retrying_count
+  )::text);
+  return null;
+end;
+$$;
+
+drop trigger if exists campaigns_notify_progress on public.campaigns;
+create trigger campaigns_notify_progress
+after update on public.campaigns
+for each row
+when (
+  old.status is distinct from new.status
+  or old.processed_count is distinct from new.processed_count
+  or old.retrying_count is distinct from new.retrying_count
+)
+execute function private.notify_campaign_progress();
+
+revoke execute on function public.set_campaign_recipient_statuses(jsonb) from public, anon, authenticated;
+revoke execute on function private.notify_campaign_progress() from public, anon, authenticated;
@@ -0,0 +1,92 @@
+-- supabase/migrations/034_campaign_templates.sql
+
+-- Campaigns sent from stored templates (004), personalized per recipient by the workers
+-- (apps/api/message_templates.py), with SMS segment counts known before and after sending.
+
+-- 1) The template a campaign was started from. message_body (017) keeps a copy of its body,
+-- so editing or deleting the template never changes a campaign already queued.
+alter table public.campaigns
+add column if not exists template_id uuid null references public.templates(id) on delete set null;
+
+-- 2) Segments each send was billed as (rendered bodies differ in length per member)
+alter table public.message_sends
+add column if not exists segment_count smallint null;
+
+-- 3) create_mass_outreach_campaign (020) with the template reference; same eligibility
+drop function if exists public.create_mass_outreach_campaign(uuid, text, double precision, interval);
+
+create or replace function public.create_mass_outreach_campaign(
+  p_gym_id uuid,
+  p_message_body text,
+  p_score_threshold double precision default 70.0,
+  p_cooldown interval default interval '24 hours',
+  p_template_id uuid default null
+)
+returns table (campaign_id uuid, recipient_count int)
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_campaign_id uuid;
+  v_count int;
+begin
+  insert into public.campaigns (gym_id, type, score_threshold, status, message_body, template_id, total_recipients)
+  values (p_gym_id, 'mass_risk_outreach', p_score_threshold, 'draft', p_message_body, p_template_id, 0)
+  returning id into v_campaign_id;
+
+  -- Walks members_gym_score_idx (gym_id, last_churn_score desc)
+  insert into public.campaign_recipients (gym_id, campaign_id, member_id, channel, status)
+  select m.gym_id, v_campaign_id, m.member_id, 'sms', 'queued'
+  from public.members m
+  where m.gym_id = p_gym_id
+    and m.last_churn_score >= p_score_threshold
+    and not coalesce(m.sms_opted_out, false)
+    and (m.last_contacted_at is null or m.last_contacted_at < now() - p_cooldown);
+
+  get diagnostics v_count = row_count;
+
+  if v_count = 0 then
+    delete from public.campaigns where id = v_campaign_id;
+    return;
+  end if;
+
+  -- Hand off to the worker pool (worker.py)
+  update public.campaigns
+  set total_recipients = v_count, status = 'queued', updated_at = now()
+  where id = v_campaign_id;
+
+  campaign_id := v_campaign_id;
+  recipient_count := v_count;
+  return next;
+end;
+$$;
+
+-- 4) Who a mass campaign would reach, as name lengths rather than names: a handful of rows however
+-- large the gym, enough for the API to count segments exactly per group.
+-- gsm7: both names only use GSM 03.38 basic characters (anything else is counted as UCS-2).
+-- A missing or empty name has a null length (the template's fallback text is used).
+create or replace function public.mass_outreach_audience_name_lengths(
+  p_gym_id uuid,
+  p_score_threshold double precision default 70.0,
+  p_cooldown interval default interval '24 hours'
+)
+returns table (first_name_length int, last_name_length int, gsm7 boolean, members bigint)
+language sql
+stable
+set search_path = public
+as $$
+  select nullif(char_length(btrim(m.first_name)), 0),
+         nullif(char_length(btrim(m.last_name)), 0),
+         coalesce(btrim(m.first_name), '') || coalesce(btrim(m.last_name), '')
+           ~ '^[ A-Za-z0-9@£$¥èéùìòÇØøÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ!"#¤%&''()*+,./:;<=>?¡ÄÖÑÜ§¿äöñüà-]*$',
+         count(*)
+  from public.members m
+  where m.gym_id = p_gym_id
+    and m.last_churn_score >= p_score_threshold
+    and not coalesce(m.sms_opted_out, false)
+    and (m.last_contacted_at is null or m.last_contacted_at < now() - p_cooldown)
+  group by 1, 2, 3;
+$$;
+
+revoke execute on function public.create_mass_outreach_campaign(uuid, text, double precision, interval, uuid) from public, anon, authenticated;
+revoke execute on function public.mass_outreach_audience_name_lengths(uuid, double precision, interval) from public, anon, authenticated;
@@ -0,0 +1,76 @@
+-- supabase/migrations/035_email_campaigns.sql
+
+-- Email mass outreach: campaign_recipients rows with channel 'email', sent by the workers in
+-- provider bulk requests (apps/api/campaigns.py process_email_recipients).
+
+-- 1) Subjects: on email templates, copied onto the campaign like message_body (017),
+-- and on each send so a retry can go out without the campaign
+alter table public.templates
+add column if not exists subject text null;
+
+alter table public.campaigns
+add column if not exists email_subject text null;
+
+alter table public.message_sends
+add column if not exists subject text null;
+
+-- 2) create_mass_outreach_campaign (034) per channel.
+-- Same score / cooldown eligibility; sms skips opted-out members, email needs an address.
+drop function if exists public.create_mass_outreach_campaign(uuid, text, double precision, interval, uuid);
+
+create or replace function public.create_mass_outreach_campaign(
+  p_gym_id uuid,
+  p_message_body text,
+  p_score_threshold double precision default 70.0,
+  p_cooldown interval default interval '24 hours',
+  p_template_id uuid default null,
+  p_channel text default 'sms',
+  p_email_subject text default null
+)
+returns table (campaign_id uuid, recipient_count int)
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_campaign_id uuid;
+  v_count int;
+begin
+  if p_channel not in ('sms', 'email') then
+    raise exception 'unknown channel %', p_channel;
+  end if;
+
+  insert into public.campaigns (gym_id, type, score_threshold, status, message_body, template_id, email_subject, total_recipients)
+  values (p_gym_id, 'mass_risk_outreach', p_score_threshold, 'draft', p_message_body, p_template_id, p_email_subject, 0)
+  returning id into v_campaign_id;
+
+  -- Walks members_gym_score_idx (gym_id, last_churn_score desc)
+  insert into public.campaign_recipients (gym_id, campaign_id, member_id, channel, status)
+  select m.gym_id, v_campaign_id, m.member_id, p_channel, 'queued'
+  from public.members m
+  where m.gym_id = p_gym_id
+    and m.last_churn_score >= p_score_threshold
+    and (m.last_contacted_at is null or m.last_contacted_at < now() - p_cooldown)
+    and case p_channel
+          when 'sms' then not coalesce(m.sms_opted_out, false)
+          else coalesce(btrim(m.email), '') <> ''
+        end;
+
+  get diagnostics v_count = row_count;
+
+  if v_count = 0 then
+    delete from public.campaigns where id = v_campaign_id;
+    return;
+  end if;
+
+  -- Hand off to the worker pool (worker.py)
+  update public.campaigns
+  set total_recipients = v_count, status = 'queued', updated_at = now()
+  where id = v_campaign_id;
+
+  campaign_id := v_campaign_id;
+  recipient_count := v_count;
+  return next;
+end;
+$$;
+
+revoke execute on function public.create_mass_outreach_campaign(uuid, text, double precision, interval, uuid, text, text) from public, anon, authenticated;
@@ -0,0 +1,50 @@
+-- supabase/migrations/036_send_rate_time_recovery.sql
+
+-- Time-based recovery for the adaptive send rate (019, apps/api/ratelimit.py).
+-- 019 added p_step to the factor per successful send, so one 50-message batch undid a halving
+-- and a 429 barely slowed anything down. The factor now climbs back at p_recovery_per_second
+-- for the time since its last adjustment, and processes report successes at most once a second
+-- instead of once per send, so the shared 'sms:global' row isn't written per message.
+
+-- 1) When rate_factor last changed (a 429 or a recovery step)
+alter table public.send_rate_buckets
+add column if not exists rate_adjusted_at timestamptz null;
+
+-- 2) adjust_send_rate without the per-send step
+drop function if exists public.adjust_send_rate(text, double precision, double precision, boolean, int, double precision, double precision);
+
+create or replace function public.adjust_send_rate(
+  p_key text,
+  p_rate double precision,
+  p_burst double precision,
+  p_rate_limited boolean,
+  p_min_factor double precision default 0.05,
+  p_recovery_per_second double precision default 0.02
+)
+returns double precision
+language plpgsql
+set search_path = public
+as $$
+declare
+  b public.send_rate_buckets;
+begin
+  b := private.settle_send_bucket(p_key, p_rate, p_burst);
+
+  if p_rate_limited then
+    b.rate_factor := greatest(p_min_factor, b.rate_factor / 2);
+    b.tokens := least(b.tokens, 0);
+  else
+    -- Every process reports against the same row, so recovery runs at one speed however many send
+    b.rate_factor := least(1.0, b.rate_factor
+      + extract(epoch from (b.updated_at - coalesce(b.rate_adjusted_at, b.updated_at))) * p_recovery_per_second);
+  end if;
+
+  update public.send_rate_buckets
+  set tokens = b.tokens, rate_factor = b.rate_factor, rate_adjusted_at = b.updated_at, updated_at = b.updated_at
+  where key = p_key;
+
+  return b.rate_factor;
+end;
+$$;
+
+revoke execute on function public.adjust_send_rate(text, double precision, double precision, boolean, double precision, double precision) from public, anon, authenticated;
@@ -0,0 +1,45 @@
+-- supabase/migrations/037_claim_due_retries_by_channel.sql
+
+-- Due retries claimed per channel (apps/api/worker.py). SMS retries are sized to the SMS send
+-- tokens; email retries (from failed bulk requests, 035) don't use SMS capacity and aren't held
+-- back when SMS is throttled.
+
+-- 1) Walked per channel, in due order (message_sends is partitioned by month since 030)
+create index if not exists message_sends_channel_retry_idx
+on public.message_sends (channel, next_retry_at) where next_retry_at is not null;
+
+-- 2) claim_due_retries (030) with a channel filter; null claims either channel
+drop function if exists public.claim_due_retries(int, int);
+
+create or replace function public.claim_due_retries(
+  p_limit int default 50,
+  p_lease_seconds int default 120,
+  p_channel text default null
+)
+returns setof public.message_sends
+language plpgsql
+set search_path = public
+as $$
+begin
+  return query
+  with due as (
+    select ms.id, ms.created_at
+    from public.message_sends ms
+    where ms.next_retry_at is not null
+      and ms.next_retry_at <= now()
+      and (p_channel is null or ms.channel = p_channel)
+    order by ms.next_retry_at
+    limit p_limit
+    for update skip locked
+  )
+  update public.message_sends ms
+  set next_retry_at = now() + make_interval(secs => p_lease_seconds),
+      updated_at = now()
+  from due
+  where ms.id = due.id
+    and ms.created_at = due.created_at
+  returning ms.*;
+end;
+$$;
+
+revoke execute on function public.claim_due_retries(int, int, text) from public, anon, authenticated;